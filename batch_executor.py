@@ -0,0 +1,241 @@
+import asyncio
+import inspect
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Dict, Iterable, List, Optional
+
+# --- Configuration ---
+DEFAULT_MAX_IN_FLIGHT = 4  # Batches allowed to be waiting on the API at the same time
+DEFAULT_WINDOW_FACTOR = 4  # Finished-but-unsaved batches allowed per in-flight slot
+DEFAULT_REQUESTS_PER_MINUTE = 15
+DEFAULT_TOKENS_PER_MINUTE = 1_000_000
+CHARS_PER_TOKEN = 4  # Rough heuristic used for quota accounting
+
+# The batch being processed by the current thread or task. asyncio.to_thread copies the
+# context, so a worker thread sees the batch its task set.
+_current_batch: ContextVar[Optional[Dict[str, Any]]] = ContextVar("current_batch", default=None)
+
+# --- Functions ---
+
+
+def estimate_tokens(text: str) -> int:
+    """Roughly estimate the number of tokens in a piece of text"""
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+@contextmanager
+def batch_context(index: int, items: int, stage: str = ""):
+    """Tag every API call made inside the block with this batch's index, size and stage"""
+    token = _current_batch.set({"index": index, "items": items, "stage": stage, "attempts": Counter()})
+    try:
+        yield
+    finally:
+        _current_batch.reset(token)
+
+
+def current_batch() -> Optional[Dict[str, Any]]:
+    """The batch_context() of the calling thread or task, if any"""
+    return _current_batch.get()
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at a fixed per-minute rate"""
+
+    def __init__(
+        self,
+        rate_per_minute: float,
+        capacity: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if rate_per_minute <= 0:
+            raise ValueError("rate_per_minute must be positive")
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.clock = clock  # The planner replays a run on a simulated clock
+        self.updated_at = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate_per_second)
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` tokens are available (0 if they are available now)"""
+        self._refill()
+        amount = min(amount, self.capacity)  # Oversized requests only need a full bucket
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate_per_second
+
+    def consume(self, amount: float):
+        """Take `amount` tokens; callers must check wait_time() first"""
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    """
+    Combined requests-per-minute and tokens-per-minute budget shared by concurrent batches.
+
+    Batches take from it on the event loop with acquire(); calls made from worker threads
+    outside a batch's reservation (e.g. a prefetched search) take from the same budget
+    with acquire_blocking().
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = DEFAULT_REQUESTS_PER_MINUTE,
+        tokens_per_minute: float = DEFAULT_TOKENS_PER_MINUTE,
+    ):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self._lock: Optional[asyncio.Lock] = None
+        self._buckets_lock = threading.Lock()
+
+    def _take(self, tokens: int, requests: int) -> float:
+        """Consume both budgets if they cover the request now; else the seconds to wait"""
+        with self._buckets_lock:
+            delay = max(self.requests.wait_time(requests), self.tokens.wait_time(tokens))
+            if delay <= 0:
+                self.requests.consume(requests)
+                self.tokens.consume(tokens)
+            return delay
+
+    async def acquire(self, tokens: int, requests: int = 1):
+        """Wait until both budgets can cover the request, then consume them (FIFO order)"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                delay = self._take(tokens, requests)
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+
+    def acquire_blocking(self, tokens: int, requests: int = 1):
+        """acquire() for a worker thread: block the thread, not the event loop"""
+        while True:
+            delay = self._take(tokens, requests)
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+
+async def run_batch_stream(
+    batches: AsyncIterable[List[Dict]],
+    process_batch: Callable[[List[Dict]], List[Dict]],
+    on_batch_done: Callable[[int, List[Dict]], Any],
+    estimate_batch_tokens: Callable[[List[Dict]], int],
+    limiter: Optional[RateLimiter] = None,
+    max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+    requests_per_batch: int = 1,
+    is_cached: Optional[Callable[[List[Dict]], bool]] = None,
+    total: Optional[int] = None,
+    label: str = "",
+    max_window: Optional[int] = None,
+):
+    """
+    Run `process_batch` over batches as they arrive, with up to `max_in_flight` in flight.
+
+    `process_batch` is a blocking function and runs in a worker thread. Results are handed
+    to `on_batch_done(index, results)` strictly in input order, so callers can append them
+    to the output file exactly as the sequential loop would; `on_batch_done` may be a
+    coroutine function. At most `max_window` batches are held between being read from the
+    source and being handed on, so memory stays flat however long the source is, and a slow
+    consumer applies backpressure to whatever produces the batches. Batches for which
+    `is_cached` returns True are answered locally and do not consume rate-limit budget.
+    """
+    limiter = limiter or RateLimiter()
+    max_in_flight = max(1, max_in_flight)
+    slots = asyncio.Semaphore(max_in_flight)
+    window = asyncio.Semaphore(max(max_window or max_in_flight * DEFAULT_WINDOW_FACTOR, max_in_flight))
+    emit_lock = asyncio.Lock()
+    completed: Dict[int, List[Dict]] = {}
+    next_to_emit = 0
+    prefix = f"{label} " if label else ""
+    of_total = f"/{total}" if total else ""
+
+    async def run_one(index: int, batch: List[Dict]):
+        nonlocal next_to_emit
+        results: Optional[List[Dict]] = None
+        try:
+            if not (is_cached and is_cached(batch)):
+                await limiter.acquire(estimate_batch_tokens(batch), requests_per_batch)
+            print(f"\n--- Dispatching {prefix}batch {index+1}{of_total} ({len(batch)} items) ---")
+            started = time.monotonic()
+            with batch_context(index, len(batch), label):
+                results = await asyncio.to_thread(process_batch, batch)
+            print(f"✓ {prefix.capitalize()}Batch {index+1} finished in {time.monotonic() - started:.1f}s")
+        except Exception as e:
+            errors[index] = e
+        finally:
+            slots.release()
+
+        # Reorder buffer: only release contiguous results starting at next_to_emit.
+        # Nothing at or after a failed batch is handed on (that would leave a gap in the
+        # output), but the window keeps draining so the remaining tasks can finish.
+        completed[index] = results
+        async with emit_lock:
+            while next_to_emit in completed:
+                ready = completed.pop(next_to_emit)
+                if not errors or next_to_emit < min(errors):
+                    try:
+                        done = on_batch_done(next_to_emit, ready)
+                        if inspect.isawaitable(done):
+                            await done
+                    except Exception as e:
+                        errors[next_to_emit] = e
+                next_to_emit += 1
+                window.release()
+
+    errors: Dict[int, Exception] = {}
+    tasks = set()
+    index = 0
+    async for batch in batches:
+        if errors:
+            break
+        await window.acquire()
+        await slots.acquire()
+        task = asyncio.create_task(run_one(index, batch))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)  # Finished tasks must not pile up on long runs
+        index += 1
+    while tasks:
+        await asyncio.gather(*list(tasks))
+    if errors:
+        raise errors[min(errors)]
+
+
+async def iterate_batches(batches: Iterable[List[Dict]]) -> AsyncIterator[List[Dict]]:
+    """Adapt a list or generator of planned batches to the streaming executor"""
+    for batch in batches:
+        yield batch
+
+
+async def run_batches(
+    batches: Iterable[List[Dict]],
+    process_batch: Callable[[List[Dict]], List[Dict]],
+    on_batch_done: Callable[[int, List[Dict]], Any],
+    estimate_batch_tokens: Callable[[List[Dict]], int],
+    limiter: Optional[RateLimiter] = None,
+    max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+    requests_per_batch: int = 1,
+    is_cached: Optional[Callable[[List[Dict]], bool]] = None,
+    total: Optional[int] = None,
+):
+    """Run a list or generator of planned batches concurrently; see run_batch_stream()"""
+    await run_batch_stream(
+        iterate_batches(batches),
+        process_batch,
+        on_batch_done,
+        estimate_batch_tokens,
+        limiter=limiter,
+        max_in_flight=max_in_flight,
+        requests_per_batch=requests_per_batch,
+        is_cached=is_cached,
+        total=total,
+    )
@@ -0,0 +1,262 @@
+import heapq
+from datetime import timedelta
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from batch_executor import TokenBucket, estimate_tokens
+
+# --- Configuration ---
+DEFAULT_MAX_BATCH_TOKENS = 12_000  # Prompt + expected response per request
+DEFAULT_MAX_RESPONSE_TOKENS = 6_000  # Stay well below the model's output limit to avoid truncated JSON
+JSON_TOKENS_PER_ITEM = 20  # Keys, quotes and the echoed item name in each response object
+DEFAULT_LOOKAHEAD_ITEMS = 200  # Rows buffered at a time when packing a stream
+DEFAULT_REQUEST_LATENCY = 6.0  # Seconds per request assumed by --plan when no metrics were recorded
+
+# --- Functions ---
+
+
+class BatchPlan:
+    """Batches produced by the planner together with their token estimates"""
+
+    def __init__(self, requests_per_batch: int = 1):
+        self.batches: List[List[Dict]] = []
+        self.batch_sizes: List[int] = []
+        self.prompt_tokens: List[int] = []
+        self.response_tokens: List[int] = []
+        self.requests_per_batch = requests_per_batch
+
+    def add(self, batch: List[Dict], prompt_tokens: int, response_tokens: int, keep_items: bool = True):
+        """Record a batch; with keep_items=False only its size and token estimates are kept"""
+        if keep_items:
+            self.batches.append(batch)
+        self.batch_sizes.append(len(batch))
+        self.prompt_tokens.append(prompt_tokens)
+        self.response_tokens.append(response_tokens)
+
+    @property
+    def batch_count(self) -> int:
+        return len(self.batch_sizes)
+
+    @property
+    def item_count(self) -> int:
+        return sum(self.batch_sizes)
+
+    @property
+    def request_count(self) -> int:
+        return self.batch_count * self.requests_per_batch
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(self.prompt_tokens) + sum(self.response_tokens)
+
+    def report(self, label: str = "Batch plan"):
+        if not self.batch_sizes:
+            print(f"{label}: nothing to process.")
+            return
+        sizes = self.batch_sizes
+        print(
+            f"{label}: {self.item_count} items in {self.batch_count} batches "
+            f"({min(sizes)}-{max(sizes)} items, avg {self.item_count / self.batch_count:.1f}), "
+            f"expected {self.request_count} requests and ~{self.total_tokens:,} tokens"
+        )
+
+
+def plan_batches(
+    items: List[Dict],
+    build_prompt: Callable[[List[Dict]], str],
+    response_tokens: Callable[[Dict], int],
+    max_batch_tokens: int = DEFAULT_MAX_BATCH_TOKENS,
+    max_response_tokens: int = DEFAULT_MAX_RESPONSE_TOKENS,
+    max_items: Optional[int] = None,
+    prompt_multiplier: int = 1,
+    requests_per_batch: int = 1,
+) -> BatchPlan:
+    """
+    Pack items into batches bounded by an estimated token ceiling instead of a fixed count.
+
+    Each item costs the tokens its section adds to `build_prompt` (times `prompt_multiplier`
+    for stages that send the items more than once) plus its expected response. Items are
+    packed greedily in input order, so saved output and checkpoints keep the input order.
+    An item that exceeds the ceiling on its own still gets a batch to itself.
+    """
+    plan = BatchPlan(requests_per_batch)
+    overhead = estimate_tokens(build_prompt([]))
+    current: List[Dict] = []
+    current_prompt = current_response = 0
+
+    def close_batch():
+        plan.add(current, overhead * prompt_multiplier + current_prompt, current_response)
+
+    for item in items:
+        item_prompt = max(1, estimate_tokens(build_prompt([item])) - overhead) * prompt_multiplier
+        item_response = response_tokens(item) + JSON_TOKENS_PER_ITEM
+        fits = (
+            overhead * prompt_multiplier + current_prompt + current_response + item_prompt + item_response
+            <= max_batch_tokens
+            and current_response + item_response <= max_response_tokens
+            and (max_items is None or len(current) < max_items)
+        )
+        if current and not fits:
+            close_batch()
+            current, current_prompt, current_response = [], 0, 0
+        current.append(item)
+        current_prompt += item_prompt
+        current_response += item_response
+
+    if current:
+        close_batch()
+    return plan
+
+
+def iter_planned_batches(
+    rows: Iterable[Dict],
+    plan: Callable[[List[Dict]], BatchPlan],
+    lookahead_items: int = DEFAULT_LOOKAHEAD_ITEMS,
+    summary: Optional[BatchPlan] = None,
+) -> Iterator[List[Dict]]:
+    """
+    Pack a stream of rows into batches while holding at most `lookahead_items` rows.
+
+    Packing is greedy and in order, so planning a window at a time gives the same batches
+    as planning the whole file, apart from the batch that straddles two windows. When a
+    `summary` plan is given, every batch's size and token estimates are added to it.
+    """
+    buffer: List[Dict] = []
+
+    def release(batches_plan: BatchPlan, upto: int) -> Iterator[List[Dict]]:
+        for i in range(upto):
+            batch = batches_plan.batches[i]
+            if summary is not None:
+                summary.requests_per_batch = batches_plan.requests_per_batch
+                summary.add(
+                    batch,
+                    batches_plan.prompt_tokens[i],
+                    batches_plan.response_tokens[i],
+                    keep_items=False,
+                )
+            yield batch
+
+    for row in rows:
+        buffer.append(row)
+        if len(buffer) >= lookahead_items:
+            window = plan(buffer)
+            # The last batch may still have room, so carry it into the next window
+            yield from release(window, window.batch_count - 1)
+            buffer = window.batches[-1]
+    if buffer:
+        window = plan(buffer)
+        yield from release(window, window.batch_count)
+
+
+def summarize_plan(rows: Iterable[Dict], plan: Callable[[List[Dict]], BatchPlan]) -> BatchPlan:
+    """Plan a stream of rows without keeping them, returning only sizes and token estimates"""
+    summary = BatchPlan()
+    for _ in iter_planned_batches(rows, plan, summary=summary):
+        pass
+    return summary
+
+
+class OfflineModels:
+    def generate_content(self, model: str, contents: str, config: Any = None):
+        raise RuntimeError("A dry run must not call the API")
+
+
+class OfflineClient:
+    """Stands in for genai.Client in --plan mode, so cache lookups work but no call is made"""
+
+    def __init__(self):
+        self.models = OfflineModels()
+
+
+def simulate_async_run(
+    costs: List[Tuple[int, int]],
+    latency: float,
+    requests_per_minute: float,
+    tokens_per_minute: float,
+    max_in_flight: int,
+    requests_per_batch: int = 1,
+) -> float:
+    """
+    Seconds the async executor needs for batches of (limiter tokens, requests sent).
+
+    Replays run_batch_stream on a simulated clock: batches start in order as in-flight
+    slots free up, wait in FIFO order on the same token buckets as RateLimiter, then take
+    `latency` per request sent. Batches answered from the cache send none and cost no time.
+    """
+    now = 0.0
+    requests = TokenBucket(requests_per_minute, clock=lambda: now)
+    tokens = TokenBucket(tokens_per_minute, clock=lambda: now)
+    slots = [0.0] * max(1, max_in_flight)
+    started = limiter_free = finished = 0.0
+    for batch_tokens, sent in costs:
+        started = max(started, heapq.heappop(slots))
+        done = started
+        if sent:
+            now = max(started, limiter_free)
+            now += max(requests.wait_time(requests_per_batch), tokens.wait_time(batch_tokens))
+            requests.consume(requests_per_batch)
+            tokens.consume(batch_tokens)
+            limiter_free = now
+            done = now + latency * sent
+        heapq.heappush(slots, done)
+        finished = max(finished, done)
+    return finished
+
+
+def simulate_sequential_run(costs: List[Tuple[int, int]], latency: float, sleep_time: float) -> float:
+    """Seconds the sequential loop needs: one request at a time, sleeping before each uncached batch but the first"""
+    sleeps = sum(1 for _, sent in costs[1:] if sent)
+    return sum(sent for _, sent in costs) * latency + sleeps * sleep_time
+
+
+def report_dry_run(
+    batches: Iterable[List[Dict]],
+    batch_prompts: Callable[[List[Dict]], List[str]],
+    response_tokens: Callable[[List[Dict]], int],
+    estimate_batch_tokens: Callable[[List[Dict]], int],
+    latency: Optional[float],
+    requests_per_minute: float,
+    tokens_per_minute: float,
+    max_in_flight: int,
+    execution_mode: str = "async",
+    sleep_time: float = 0.0,
+    requests_per_batch: int = 1,
+    label: str = "Dry run",
+):
+    """
+    Print what a run over `batches` would cost without calling the API.
+
+    `batch_prompts` builds the prompts a batch would still send (none when the response
+    cache answers it) and `response_tokens` estimates the batch's response. Wall time is
+    simulated under the configured execution mode, limits and per-request `latency`
+    (DEFAULT_REQUEST_LATENCY when no recorded latency is available).
+    """
+    source = "median of recorded calls"
+    if latency is None:
+        latency, source = DEFAULT_REQUEST_LATENCY, "default"
+    costs: List[Tuple[int, int]] = []
+    items = prompt_tokens = expected_response = 0
+    for batch in batches:
+        items += len(batch)
+        prompts = batch_prompts(batch)
+        costs.append((estimate_batch_tokens(batch), len(prompts)))
+        if prompts:
+            prompt_tokens += sum(estimate_tokens(prompt) for prompt in prompts)
+            expected_response += response_tokens(batch)
+
+    if execution_mode == "async":
+        seconds = simulate_async_run(
+            costs, latency, requests_per_minute, tokens_per_minute, max_in_flight, requests_per_batch
+        )
+        limits = f"{requests_per_minute:g} RPM, {tokens_per_minute:,.0f} TPM, {max_in_flight} batches in flight"
+    else:
+        seconds = simulate_sequential_run(costs, latency, sleep_time)
+        limits = f"sequential, {sleep_time:g}s between batches"
+    print(
+        f"{label}: {items} items in {len(costs)} batches -> {sum(sent for _, sent in costs)} requests "
+        f"({sum(1 for _, sent in costs if not sent)} answered without a request), "
+        f"~{prompt_tokens:,} prompt + ~{expected_response:,} response tokens"
+    )
+    print(
+        f"{label}: {limits}, {latency:.1f}s per request ({source}) -> "
+        f"expected wall time {timedelta(seconds=round(seconds))}"
+    )
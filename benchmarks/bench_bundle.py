@@ -0,0 +1,137 @@
+"""
+Parse-time comparison of the item browser's base data: the CSV the page parsed at
+runtime against the JSON shards build_bundle.py precompiles on deploy.
+
+Builds synthetic catalogs by repeating base-items.csv under unique names and, for each
+size, times turning the fetched text into item objects and reports the bytes of each
+format (raw and gzipped). The CSV path mirrors what script.js did on first load: parse
+with a header row, then look every field up among its header variants
+case-insensitively, row by row (processCSVData / getHeaderValue). The bundle path
+decodes every shard and zips each row with the canonical field names; the region path
+decodes only the shards of the largest region, as the page does when filtered to it.
+
+This is a proxy for the parsing work only: it runs in Python, not in a browser, and
+leaves out fetching, caching and rendering, so it is not a measure of page load time.
+The full bundle is not smaller on the wire than the CSV; only a region's shards are.
+Usage:
+
+    python benchmarks/bench_bundle.py [rows ...]   (default: 500 10000 100000)
+"""
+
+import csv
+import gzip
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from build_bundle import CANONICAL_FIELDS, MANIFEST_NAME, build_bundle, capitalize  # noqa: E402
+from csv_stream import iter_csv_rows, read_csv_header  # noqa: E402
+
+SOURCE_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "base-items.csv")
+DEFAULT_SIZES = [500, 10_000, 100_000]
+REPEAT = 3  # Best of this many runs is reported
+
+
+def make_catalog(path: str, rows: int):
+    source = list(iter_csv_rows(SOURCE_CSV))
+    fieldnames = read_csv_header(SOURCE_CSV)
+    with open(path, "w", encoding="utf-8", newline="") as outfile:
+        writer = csv.DictWriter(outfile, fieldnames=fieldnames, delimiter=";", quoting=csv.QUOTE_ALL)
+        writer.writeheader()
+        for i in range(rows):
+            row = dict(source[i % len(source)])
+            row["Item Name"] = f"{row['Item Name']} #{i}"
+            writer.writerow(row)
+
+
+def header_value(row: Dict, possible_headers: List[str], default: str = "") -> str:
+    """getHeaderValue from script.js: every header variant against every key of the row"""
+    for header in possible_headers:
+        lower_header = header.lower()
+        for key in row:
+            if key.strip().lower() == lower_header:
+                return row[key] or default
+    return default
+
+
+def load_csv(text: str) -> List[Dict]:
+    rows = csv.DictReader(io.StringIO(text), delimiter=";")
+    items = []
+    for index, row in enumerate(rows):
+        item = {"id": f"file-{index}"}
+        for field, (variants, default) in CANONICAL_FIELDS:
+            item[field] = header_value(row, variants, default)
+        item["region"] = capitalize(item["region"])
+        item["fileId"] = "file"
+        item["source"] = "csv"
+        items.append(item)
+    return items
+
+
+def load_shards(texts: List[str]) -> List[Dict]:
+    items = []
+    for text in texts:
+        shard = json.loads(text)
+        fields = shard["fields"]
+        for row in shard["rows"]:
+            item = {"id": f"file-{len(items)}"}
+            item.update(zip(fields, row))
+            item["fileId"] = "file"
+            item["source"] = "csv"
+            items.append(item)
+    return items
+
+
+def best_time(load, data) -> float:
+    best = float("inf")
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        load(data)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def read_files(paths: List[str]) -> List[bytes]:
+    files = []
+    for path in paths:
+        with open(path, "rb") as infile:
+            files.append(infile.read())
+    return files
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+    print(f"{'rows':>8}  {'format':<7} {'parse ms':>9} {'bytes':>12} {'gzipped':>11}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for rows in sizes:
+            csv_path = os.path.join(workdir, "catalog.csv")
+            make_catalog(csv_path, rows)
+            manifest, _ = build_bundle(csv_path, workdir)
+            with open(os.path.join(workdir, MANIFEST_NAME), "r", encoding="utf-8") as infile:
+                shards = json.load(infile)["shards"]
+            largest = max(manifest["regions"], key=manifest["regions"].get)
+            region_shards = [shard for shard in shards if shard["region"] == largest]
+            for label, paths, load, expected in (
+                ("csv", [csv_path], lambda texts: load_csv(texts[0]), manifest["items"]),
+                ("bundle", [os.path.join(workdir, shard["name"]) for shard in shards], load_shards, manifest["items"]),
+                ("region", [os.path.join(workdir, shard["name"]) for shard in region_shards], load_shards,
+                 manifest["regions"][largest]),
+            ):
+                files = read_files(paths)
+                texts = [data.decode("utf-8") for data in files]
+                assert len(load(texts)) == expected
+                elapsed = best_time(load, texts)
+                print(
+                    f"{rows:>8,}  {label:<7} {elapsed * 1000:>9.1f} {sum(map(len, files)):>12,} "
+                    f"{sum(len(gzip.compress(data)) for data in files):>11,}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Peak-memory benchmark: whole-file loading vs. the streaming reader -> batcher -> writer path.
+
+Builds synthetic catalogs by repeating base-items.csv under unique names, then runs both
+paths with a no-op model call and reports tracemalloc peaks. A second table holds each
+whole catalog in memory, as a merge of large catalogs does: csv.DictReader dicts against
+item_record.ItemRecord records (one schema per file, interned Region and ImageURL). Usage:
+
+    python benchmarks/bench_memory.py [rows ...]   (default: 1000 10000 100000)
+"""
+
+import asyncio
+import contextlib
+import csv
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from batch_executor import RateLimiter, run_batches  # noqa: E402
+from batch_planner import iter_planned_batches, plan_batches  # noqa: E402
+from csv_stream import iter_csv_rows, iter_item_records, read_csv_header  # noqa: E402
+
+SOURCE_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "base-items.csv")
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+BATCH_SIZE = 10
+
+
+def build_prompt(items: List[Dict]) -> str:
+    """Same shape as create_batch_5e_prompt, without importing the API client"""
+    prompt = "Rewrite the following item's descriptions.\n\nItems:\n"
+    for item in items:
+        prompt += f"\n--- ITEM: {item.get('Item Name', 'Unknown')} ---\n"
+        prompt += f"REGION: {item.get('Region', 'N/A')}\n"
+        prompt += f"LORE: {item.get('Lore', 'N/A')}\n"
+        prompt += f"DescriptionLore: {item.get('DescriptionLore', 'N/A')}\n\n"
+    return prompt
+
+
+def plan(items: List[Dict]):
+    return plan_batches(items, build_prompt, lambda item: 270, max_items=BATCH_SIZE)
+
+
+def fake_process(batch: List[Dict]) -> List[Dict]:
+    build_prompt(batch)  # The prompt is built per batch in both paths
+    for item in batch:
+        item["Description5e"] = item["DescriptionLore"]
+    return batch
+
+
+def make_catalog(path: str, rows: int):
+    with open(SOURCE_CSV, "r", encoding="utf-8-sig") as infile:
+        reader = csv.DictReader(infile, delimiter=";")
+        fieldnames = reader.fieldnames
+        source = list(reader)
+    with open(path, "w", encoding="utf-8", newline="") as outfile:
+        writer = csv.DictWriter(outfile, fieldnames=fieldnames, delimiter=";", quoting=csv.QUOTE_ALL)
+        writer.writeheader()
+        for i in range(rows):
+            row = dict(source[i % len(source)])
+            row["Item Name"] = f"{row['Item Name']} #{i}"
+            writer.writerow(row)
+
+
+def run_list_path(input_csv: str, output_csv: str):
+    """The original scripts: list(reader), fixed slices, results kept until the end"""
+    with open(input_csv, "r", encoding="utf-8-sig") as infile:
+        reader = csv.DictReader(infile, delimiter=";")
+        fieldnames = reader.fieldnames + ["Description5e"]
+        all_items = list(reader)
+    batches = [all_items[i : i + BATCH_SIZE] for i in range(0, len(all_items), BATCH_SIZE)]
+    results = []
+    for batch in batches:
+        results.extend(fake_process(batch))
+    with open(output_csv, "w", encoding="utf-8", newline="") as outfile:
+        writer = csv.DictWriter(outfile, fieldnames=fieldnames, delimiter=";", quoting=csv.QUOTE_ALL)
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def run_stream_path(input_csv: str, output_csv: str):
+    """Generator reader -> token-packed batches -> bounded async window -> ordered writer"""
+    fieldnames = read_csv_header(input_csv) + ["Description5e"]
+    with open(output_csv, "w", encoding="utf-8", newline="") as outfile:
+        writer = csv.DictWriter(outfile, fieldnames=fieldnames, delimiter=";", quoting=csv.QUOTE_ALL)
+        writer.writeheader()
+        # The executor logs every batch; discard that so only the pipeline itself is measured
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            asyncio.run(
+                run_batches(
+                    iter_planned_batches(iter_csv_rows(input_csv), plan),
+                    fake_process,
+                    lambda index, batch: writer.writerows(batch),
+                    lambda batch: 1,
+                    limiter=RateLimiter(10**9, 10**12),
+                )
+            )
+
+
+def hold_dict_rows(input_csv: str):
+    return list(iter_csv_rows(input_csv))
+
+
+def hold_records(input_csv: str):
+    return list(iter_item_records(input_csv))
+
+
+def measure(fn, *args):
+    tracemalloc.start()
+    started = time.perf_counter()
+    fn(*args)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / (1024 * 1024), elapsed
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+    print(f"{'rows':>8} | {'list peak MB':>12} | {'stream peak MB':>14} | {'list s':>7} | {'stream s':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in sizes:
+            input_csv = os.path.join(tmp, f"catalog_{rows}.csv")
+            make_catalog(input_csv, rows)
+            list_mb, list_s = measure(run_list_path, input_csv, os.path.join(tmp, "out_list.csv"))
+            stream_mb, stream_s = measure(
+                run_stream_path, input_csv, os.path.join(tmp, "out_stream.csv")
+            )
+            print(f"{rows:>8} | {list_mb:>12.1f} | {stream_mb:>14.1f} | {list_s:>7.2f} | {stream_s:>8.2f}")
+
+        print()
+        print(f"{'rows':>8} | {'dicts peak MB':>13} | {'records peak MB':>15} | {'dicts s':>7} | {'records s':>9}")
+        for rows in sizes:
+            input_csv = os.path.join(tmp, f"catalog_{rows}.csv")
+            dicts_mb, dicts_s = measure(hold_dict_rows, input_csv)
+            records_mb, records_s = measure(hold_records, input_csv)
+            print(f"{rows:>8} | {dicts_mb:>13.1f} | {records_mb:>15.1f} | {dicts_s:>7.2f} | {records_s:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
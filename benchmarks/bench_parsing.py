@@ -0,0 +1,79 @@
+"""
+Micro-benchmark of response parsing: the scripts' former json.loads + model_validate path
+against response_parsing.BatchParser (precompiled TypeAdapter, partial-result salvage).
+
+Parses synthetic responses for each batch schema in three shapes (well formed, wrapped
+in a ```json fence, and cut off two thirds of the way through) and reports microseconds
+per parse and the item objects each path recovers. Usage:
+
+    python benchmarks/bench_parsing.py [--items 10] [--repeat 2000]
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+from typing import Any, List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from correct_lore import BatchLoreResponse  # noqa: E402
+from correct_to_5e import Batch5eResponse  # noqa: E402
+from generate_osr_powers import BatchResponse  # noqa: E402
+from response_parsing import parser_for  # noqa: E402
+from fake_gemini import _fake_item  # noqa: E402
+
+SCHEMAS = {"lore": BatchLoreResponse, "5e": Batch5eResponse, "osr": BatchResponse}
+TRUNCATE_AT = 2 / 3
+
+
+def json_loads_path(text: str, schema: Any) -> Optional[List[Any]]:
+    """What the scripts did before: hand-stripped fences, json.loads, then model_validate"""
+    if text.strip().startswith("```json"):
+        text = text.strip()[7:-3].strip()
+    elif text.strip().startswith("```"):
+        text = text.strip()[3:-3].strip()
+    try:
+        return schema.model_validate(json.loads(text)).items
+    except Exception:
+        return None
+
+
+def make_responses(schema: Any, items: int) -> dict:
+    text = json.dumps({"items": [_fake_item(schema, f"Item {i}") for i in range(items)]}, ensure_ascii=False)
+    return {
+        "valid": text,
+        "fenced": f"```json\n{text}\n```",
+        "truncated": text[: int(len(text) * TRUNCATE_AT)],
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark response parsing paths")
+    parser.add_argument("--items", type=int, default=10, help="Items per synthetic batch response")
+    parser.add_argument("--repeat", type=int, default=2000, help="Parses timed per case")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    print(
+        f"{'schema':>6} | {'response':>9} | {'json.loads us':>13} | {'adapter us':>10} | "
+        f"{'speedup':>7} | {'items old':>9} | {'items new':>9}"
+    )
+    for name, schema in SCHEMAS.items():
+        parser = parser_for(schema)
+        for shape, text in make_responses(schema, args.items).items():
+            old_items = json_loads_path(text, schema)
+            new_items = parser.parse(text).items
+            old_us = timeit.timeit(lambda: json_loads_path(text, schema), number=args.repeat) / args.repeat * 1e6
+            new_us = timeit.timeit(lambda: parser.parse(text), number=args.repeat) / args.repeat * 1e6
+            print(
+                f"{name:>6} | {shape:>9} | {old_us:>13.1f} | {new_us:>10.1f} | {old_us / new_us:>6.2f}x | "
+                f"{len(old_items or []):>9} | {len(new_items):>9}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Per-keystroke cost of the item browser's search: scanning and re-sorting the whole
+catalog, as script.js did for every input event (filterItems + sortItems), against the
+prebuilt search index build_bundle.py writes next to the bundle (see search_index).
+
+Builds synthetic catalogs by repeating base-items.csv under unique names and, for each
+size, replays the keystrokes of a few search terms through both paths in Python. The
+scan path substring-matches every item and sorts the matches; the index path unions the
+posting lists of the tokens containing each search word, intersects them across words,
+orders the candidate rows by their precomputed rank and keeps those the term is a
+substring of, so both paths return the same items. Usage:
+
+    python benchmarks/bench_search.py [rows ...]   (default: 500 10000 50000)
+"""
+
+import os
+import sys
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from build_bundle import FIELDS, BundleReport, normalize_rows, resolve_columns  # noqa: E402
+from csv_stream import iter_csv_rows, read_csv_header  # noqa: E402
+from search_index import build_index, collation_key, tokenize  # noqa: E402
+
+SOURCE_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "base-items.csv")
+DEFAULT_SIZES = [500, 10_000, 50_000]
+SEARCH_TERMS = ["sword", "ring of", "fire", "ancient elven"]
+REPEAT = 3  # Best of this many runs is reported
+
+
+def make_rows(count: int) -> List[List[str]]:
+    report = BundleReport()
+    columns = resolve_columns(read_csv_header(SOURCE_CSV))
+    source = list(normalize_rows(iter_csv_rows(SOURCE_CSV), columns, report))
+    name = FIELDS.index("name")
+    rows = []
+    for i in range(count):
+        row = list(source[i % len(source)])
+        row[name] = f"{row[name]} #{i}"
+        rows.append(row)
+    return rows
+
+
+def keystrokes(term: str) -> List[str]:
+    return [term[:length] for length in range(1, len(term) + 1)]
+
+
+def matches(item: Dict, term: str) -> bool:
+    return term in item["name"].lower() or term in item["lore"].lower() or term in item["descriptionLore"].lower()
+
+
+def scan(items: List[Dict], term: str) -> List[Dict]:
+    term = term.lower()
+    return sorted((item for item in items if matches(item, term)), key=lambda item: collation_key(item["name"]))
+
+
+def indexed(index: Dict, ranks: List[int], items: List[Dict], term: str) -> List[Dict]:
+    term = term.lower()
+    tokens, postings = index["tokens"], index["postings"]
+    rows = None
+    for query_token in tokenize(term):
+        found = set()
+        for token, posting in zip(tokens, postings):
+            if query_token in token:
+                found.update(posting)
+        rows = found if rows is None else rows & found
+    if rows is None:
+        rows = index["orders"]["nameAsc"]
+    return [items[row] for row in sorted(rows, key=ranks.__getitem__) if matches(items[row], term)]
+
+
+def best_time(search) -> float:
+    best = float("inf")
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        for term in SEARCH_TERMS:
+            for prefix in keystrokes(term):
+                search(prefix)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+    strokes = sum(len(keystrokes(term)) for term in SEARCH_TERMS)
+    print(f"{'rows':>8}  {'path':<6} {'ms/keystroke':>13} {'build ms':>9}")
+    for count in sizes:
+        rows = make_rows(count)
+        items = [dict(zip(FIELDS, row)) for row in rows]
+        started = time.perf_counter()
+        index = build_index(rows, FIELDS, "bench")
+        build_ms = (time.perf_counter() - started) * 1000
+        ranks = [0] * count
+        for position, row in enumerate(index["orders"]["nameAsc"]):
+            ranks[row] = position
+        for term in SEARCH_TERMS:
+            assert [item["name"] for item in indexed(index, ranks, items, term)] == [
+                item["name"] for item in scan(items, term)
+            ]
+        for label, search in (
+            ("scan", lambda term: scan(items, term)),
+            ("index", lambda term: indexed(index, ranks, items, term)),
+        ):
+            elapsed = best_time(search)
+            build = f"{build_ms:>9.1f}" if label == "index" else f"{'':>9}"
+            print(f"{count:>8,}  {label:<6} {elapsed / strokes * 1000:>13.3f} {build}")
+
+
+if __name__ == "__main__":
+    main()
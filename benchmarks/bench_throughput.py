@@ -0,0 +1,209 @@
+"""
+End-to-end throughput/latency benchmark of the three enrichment scripts against fake_gemini.
+
+Builds synthetic catalogs by repeating items-2.csv (which has every column the scripts read)
+under unique names, then runs each script's async batch loop on a clean and a faulty fake
+API. Reports items/sec, p50/p95/p99 batch latency, API calls and the error-recovery cost:
+calls spent on retries and re-sent items, items recovered, rows still saved with an error,
+rows given another item's result, and throughput lost against the clean run. Usage:
+
+    python benchmarks/bench_throughput.py [--rows 500 10000 100000] [--scripts lore 5e osr]
+        [--latency lognormal:0.05,0.5] [--profiles clean faulty] [--in-flight 4] [--seed 1]
+        [--keys 1 2 4 --key-rpm 600]
+
+Quotas are lifted and backoff delays shortened so the numbers reflect the batch loops
+rather than the 15 RPM limit. With --keys, each run instead goes through a KeyPool of that
+many fake keys, each limited to --key-rpm and starting with an empty bucket, to show how
+throughput scales with keys once the run is quota-bound.
+"""
+
+import argparse
+import contextlib
+import csv
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import correct_lore  # noqa: E402
+import correct_to_5e  # noqa: E402
+import generate_osr_powers  # noqa: E402
+from csv_stream import iter_csv_rows, read_csv_header  # noqa: E402
+from delta import run_batches_for, summarize_run  # noqa: E402
+from retry_policy import RetryingClient  # noqa: E402
+from key_pool import KeyPool, PooledClient, PoolMember  # noqa: E402
+from fake_gemini import FakeGeminiClient, FaultProfile, LatencyModel, failure_summary  # noqa: E402
+
+SOURCE_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "items-2.csv")
+DEFAULT_SIZES = [500, 10_000, 100_000]
+SCRIPTS = {"lore": correct_lore, "5e": correct_to_5e, "osr": generate_osr_powers}
+# Column each script fills; the fake API starts every generated text with the item's name
+OUTPUT_COLUMNS = {correct_lore: "Lore", correct_to_5e: "Description5e", generate_osr_powers: "OSRPower"}
+PROFILES = {"clean": FaultProfile.clean, "faulty": FaultProfile.faulty}
+BACKOFF_BASE_DELAY = 0.01
+BACKOFF_MAX_DELAY = 0.1
+
+
+def make_catalog(path: str, rows: int):
+    with open(SOURCE_CSV, "r", encoding="utf-8-sig") as infile:
+        reader = csv.DictReader(infile, delimiter=";")
+        fieldnames = reader.fieldnames
+        source = list(reader)
+    with open(path, "w", encoding="utf-8", newline="") as outfile:
+        writer = csv.DictWriter(outfile, fieldnames=fieldnames, delimiter=";", quoting=csv.QUOTE_ALL)
+        writer.writeheader()
+        for i in range(rows):
+            row = dict(source[i % len(source)])
+            row["Item Name"] = f"{row['Item Name']} #{i}"
+            writer.writerow(row)
+
+
+def percentile(values: List[float], pct: int) -> float:
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100, method="inclusive")[pct - 1]
+
+
+def make_pool(fakes: List[FakeGeminiClient], key_rpm: float) -> PooledClient:
+    members = [PoolMember(f"key{i + 1}", fake, None, key_rpm, 10**9) for i, fake in enumerate(fakes)]
+    for member in members:
+        member.requests.tokens = 0  # Start empty, so the first minute's burst does not hide the quota
+    return PooledClient(KeyPool(members, pause_seconds=BACKOFF_MAX_DELAY))
+
+
+def run_script(
+    module, input_csv: str, output_csv: str, fakes: List[FakeGeminiClient], in_flight: int, key_rpm: float = 0
+) -> Dict:
+    """Run one script's async path over the catalog, timing every batch it processes"""
+    api = make_pool(fakes, key_rpm) if key_rpm else fakes[0]
+    client = RetryingClient(api, base_delay=BACKOFF_BASE_DELAY, max_delay=BACKOFF_MAX_DELAY)
+    latencies: List[float] = []
+    latencies_lock = threading.Lock()
+    original = module.process_item_batch
+
+    def timed_process_item_batch(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return original(*args, **kwargs)
+        finally:
+            with latencies_lock:
+                latencies.append(time.perf_counter() - started)
+
+    saved = {
+        name: getattr(module, name)
+        for name in ("process_item_batch", "REQUESTS_PER_MINUTE", "TOKENS_PER_MINUTE", "MAX_IN_FLIGHT")
+    }
+    module.process_item_batch = timed_process_item_batch
+    module.REQUESTS_PER_MINUTE = module.TOKENS_PER_MINUTE = 10**9
+    module.MAX_IN_FLIGHT = in_flight
+
+    plan, num_batches, _, _ = summarize_run(iter_csv_rows(input_csv), module.plan_item_batches)
+    fieldnames = read_csv_header(input_csv) + ["Description5e", "OSRPower"]
+    started = time.perf_counter()
+    try:
+        # The scripts log every batch; discard that so only the loop itself is measured
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            batches = run_batches_for(iter_csv_rows(input_csv), module.plan_item_batches)
+            if module is generate_osr_powers:
+                with open(output_csv, "w", encoding="utf-8", newline="") as outfile:
+                    writer = csv.DictWriter(outfile, fieldnames=fieldnames, extrasaction="ignore")
+                    writer.writeheader()
+                    module.process_item_batches_async(
+                        client, batches, lambda index, batch: writer.writerows(batch), num_batches
+                    )
+            else:
+                with module.open_output(output_csv, fieldnames) as writer:
+                    module.process_and_save_batches_async(batches, writer, client, num_batches=num_batches)
+    finally:
+        elapsed = time.perf_counter() - started
+        for name, value in saved.items():
+            setattr(module, name, value)
+
+    delimiter = "," if module is generate_osr_powers else ";"
+    rows = error_rows = misassigned = 0
+    for row in iter_csv_rows(output_csv, delimiter=delimiter, encoding="utf-8"):
+        rows += 1
+        error_rows += module.needs_rerun(row)
+        output = row.get(OUTPUT_COLUMNS[module]) or ""
+        misassigned += not module.needs_rerun(row) and not output.startswith(f"{row['Item Name']}: ")
+    return {
+        "rows": rows,
+        "seconds": elapsed,
+        "items_per_sec": rows / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "calls": sum(fake.models.calls for fake in fakes),
+        "planned_calls": plan.request_count,
+        "recovery_calls": client.recovery.recovery_calls,
+        "recovered": client.recovery.items_recovered,
+        "error_rows": error_rows,
+        "misassigned": misassigned,
+        "failures": failure_summary(*fakes),
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the enrichment scripts against a fake Gemini API")
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--scripts", nargs="+", choices=sorted(SCRIPTS), default=["lore", "5e", "osr"])
+    parser.add_argument("--profiles", nargs="+", choices=sorted(PROFILES), default=["clean", "faulty"])
+    parser.add_argument("--latency", default="lognormal:0.05,0.5", help="fixed:S, uniform:LOW,HIGH or lognormal:MEDIAN,SIGMA")
+    parser.add_argument("--in-flight", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--keys", type=int, nargs="+", help="Run through a key pool of each of these sizes")
+    parser.add_argument("--key-rpm", type=float, default=600, help="Requests per minute of each pooled key")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    latency = LatencyModel.parse(args.latency)
+    print(f"Latency {latency}, {args.in_flight} batches in flight")
+    print(
+        f"{'script':>6} | {'rows':>7} | {'profile':>7} | {'keys':>4} | {'items/s':>8} | {'p50 s':>6} | {'p95 s':>6} | "
+        f"{'p99 s':>6} | {'calls':>7} | {'recov':>5} | {'fixed':>5} | {'err rows':>8} | {'wrong':>5} | {'lost':>6} | injected"
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in args.rows:
+            input_csv = os.path.join(tmp, f"catalog_{rows}.csv")
+            make_catalog(input_csv, rows)
+            for script in args.scripts:
+                for keys in args.keys or [0]:
+                    clean_rate = None
+                    for profile in args.profiles:
+                        fakes = [
+                            FakeGeminiClient(PROFILES[profile](latency), seed=args.seed + i)
+                            for i in range(max(keys, 1))
+                        ]
+                        result = run_script(
+                            SCRIPTS[script],
+                            input_csv,
+                            os.path.join(tmp, "out.csv"),
+                            fakes,
+                            args.in_flight,
+                            args.key_rpm if keys else 0,
+                        )
+                        if profile == "clean":
+                            clean_rate = result["items_per_sec"]
+                        lost = (
+                            f"{1 - result['items_per_sec'] / clean_rate:>6.1%}"
+                            if clean_rate and profile != "clean"
+                            else f"{'-':>6}"
+                        )
+                        print(
+                            f"{script:>6} | {rows:>7} | {profile:>7} | {keys or '-':>4} | {result['items_per_sec']:>8.1f} | "
+                            f"{result['p50']:>6.3f} | {result['p95']:>6.3f} | {result['p99']:>6.3f} | "
+                            f"{result['calls']:>7} | {result['recovery_calls']:>5} | {result['recovered']:>5} | "
+                            f"{result['error_rows']:>8} | {result['misassigned']:>5} | {lost} | "
+                            f"{' '.join(result['failures']) or '-'}"
+                        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+Local stand-in for `genai.Client` so the batch loops can be exercised without an API key.
+
+`FakeGeminiClient().models.generate_content(model=..., contents=..., config=...)` answers
+every prompt the scripts build: schema-less prompts (the search step of correct_lore.py)
+get a block of free text, and prompts with a `response_schema` get JSON with one object
+per item named in the prompt. Latency is drawn from a configurable distribution, and
+429/500 errors, truncated JSON, code-fenced JSON, missing, reordered and typographically
+renamed items can be injected at fixed rates. Usage:
+
+    client = FakeGeminiClient(FaultProfile.faulty(LatencyModel.parse("lognormal:0.05,0.5")), seed=1)
+"""
+
+import json
+import random
+import re
+import threading
+import time
+import typing
+from typing import Dict, List, Optional
+
+# Item names as they appear in the prompts of the three scripts
+ITEM_NAME_PATTERNS = [re.compile(r"^Item Name: (.*)$", re.M), re.compile(r"^--- ITEM: (.*) ---$", re.M)]
+FILLER_TEXT = "Forged in a forgotten age, it hums with a power that remembers every hand that held it. "
+
+
+class FakeAPIError(Exception):
+    """Raised for injected failures; `code` mirrors the HTTP status of the real API error"""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+class LatencyModel:
+    """Per-call latency in seconds: fixed:S, uniform:LOW,HIGH or lognormal:MEDIAN,SIGMA"""
+
+    KINDS = ("fixed", "uniform", "lognormal")
+
+    def __init__(self, kind: str = "lognormal", a: float = 0.05, b: float = 0.5):
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown latency distribution '{kind}', choose from {self.KINDS}")
+        self.kind = kind
+        self.a = a
+        self.b = b
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyModel":
+        kind, _, args = spec.partition(":")
+        values = [float(v) for v in args.split(",") if v.strip()] or [0.0]
+        return cls(kind, values[0], values[1] if len(values) > 1 else values[0])
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            return self.a
+        if self.kind == "uniform":
+            return rng.uniform(self.a, self.b)
+        return rng.lognormvariate(0, self.b) * self.a  # Median a, spread b
+
+    def __str__(self) -> str:
+        return f"{self.kind}:{self.a},{self.b}"
+
+
+class FaultProfile:
+    """Probabilities of each injected failure, checked independently per call"""
+
+    def __init__(
+        self,
+        latency: Optional[LatencyModel] = None,
+        rate_limited: float = 0.0,
+        server_error: float = 0.0,
+        truncated: float = 0.0,
+        fenced: float = 0.0,
+        missing_item: float = 0.0,
+        reordered: float = 0.0,
+        renamed: float = 0.0,
+    ):
+        self.latency = latency or LatencyModel()
+        self.rate_limited = rate_limited
+        self.server_error = server_error
+        self.truncated = truncated
+        self.fenced = fenced
+        self.missing_item = missing_item
+        self.reordered = reordered
+        self.renamed = renamed
+
+    @classmethod
+    def clean(cls, latency: Optional[LatencyModel] = None) -> "FaultProfile":
+        return cls(latency)
+
+    @classmethod
+    def faulty(cls, latency: Optional[LatencyModel] = None) -> "FaultProfile":
+        """A bad day on the real API: a few percent of calls fail in each way"""
+        return cls(
+            latency,
+            rate_limited=0.05,
+            server_error=0.02,
+            truncated=0.03,
+            fenced=0.05,
+            missing_item=0.05,
+            reordered=0.05,
+            renamed=0.05,
+        )
+
+
+class FakeModels:
+    def __init__(self, profile: FaultProfile, seed: Optional[int]):
+        self.profile = profile
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()  # Scripts call from several worker threads at once
+        self.calls = 0
+        self.failures: Dict[str, int] = {}
+
+    def _roll(self, probability: float) -> bool:
+        with self._lock:
+            return self._rng.random() < probability
+
+    def _count(self, kind: str):
+        with self._lock:
+            self.failures[kind] = self.failures.get(kind, 0) + 1
+
+    def generate_content(self, model: str, contents: str, config=None):
+        with self._lock:
+            self.calls += 1
+            delay = self.profile.latency.sample(self._rng)
+        time.sleep(delay)
+
+        if self._roll(self.profile.rate_limited):
+            self._count("429")
+            raise FakeAPIError(429, "RESOURCE_EXHAUSTED: Quota exceeded")
+        if self._roll(self.profile.server_error):
+            self._count("500")
+            raise FakeAPIError(500, "INTERNAL: An internal error has occurred")
+
+        names = [name.strip() for pattern in ITEM_NAME_PATTERNS for name in pattern.findall(contents)]
+        names = list(dict.fromkeys(names))  # The lore prompts may mention a name more than once
+        schema = _config_value(config, "response_schema")
+        if schema is None:
+            return FakeResponse("\n\n".join(f"## {name}\n{FILLER_TEXT}" for name in names))
+
+        if names and self._roll(self.profile.missing_item):
+            self._count("missing_item")
+            with self._lock:
+                names.pop(self._rng.randrange(len(names)))
+        if len(names) > 1 and self._roll(self.profile.reordered):
+            self._count("reordered")
+            with self._lock:
+                self._rng.shuffle(names)
+        items = [_fake_item(schema, name) for name in names]
+        if items and self._roll(self.profile.renamed):
+            self._count("renamed")
+            for item in items:
+                item["item_name"] = _retyped_name(item["item_name"])
+        text = json.dumps({"items": items}, ensure_ascii=False)
+        finish_reason = None
+        if self._roll(self.profile.truncated):
+            self._count("truncated")
+            with self._lock:
+                text = text[: self._rng.randrange(1, max(2, len(text)))]
+            finish_reason = "MAX_TOKENS"
+        elif self._roll(self.profile.fenced):
+            self._count("fenced")
+            text = f"```json\n{text}\n```"
+        return FakeResponse(text, schema, finish_reason)
+
+
+class FakeGeminiClient:
+    """Drop-in for `genai.Client` as used by the scripts (only `.models.generate_content`)"""
+
+    def __init__(self, profile: Optional[FaultProfile] = None, seed: Optional[int] = None):
+        self.models = FakeModels(profile or FaultProfile.clean(), seed)
+
+
+class _Part:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class _Content:
+    def __init__(self, text: str):
+        self.parts = [_Part(text)]
+
+    def to_dict(self) -> Dict:
+        return {"parts": [{"text": part.text} for part in self.parts]}
+
+
+class _Candidate:
+    def __init__(self, text: str, finish_reason: Optional[str]):
+        self.content = _Content(text)
+        self.finish_reason = finish_reason
+        self.safety_ratings = None
+
+
+class FakeResponse:
+    """The parts of GenerateContentResponse the scripts read"""
+
+    def __init__(self, text: str, schema=None, finish_reason: Optional[str] = None):
+        self.text = text
+        self.candidates = [_Candidate(text, finish_reason)]
+        self.parsed = None
+        if schema is not None:
+            try:
+                self.parsed = schema.model_validate_json(text)
+            except Exception:
+                pass  # Like the SDK, leave parsed empty when the text does not validate
+
+
+def _config_value(config, name: str):
+    if config is None:
+        return None
+    if isinstance(config, dict):
+        return config.get(name)
+    return getattr(config, name, None)
+
+
+def _item_model(schema):
+    """The model of one element of the schema's `items` list"""
+    annotation = schema.model_fields["items"].annotation
+    return typing.get_args(annotation)[0]
+
+
+def _fake_item(schema, name: str) -> Dict:
+    item = {}
+    for field_name, field in _item_model(schema).model_fields.items():
+        if field_name == "item_name":
+            item[field_name] = name
+            continue
+        max_length = next(
+            (getattr(m, "max_length") for m in field.metadata if getattr(m, "max_length", None)), 400
+        )
+        item[field_name] = f"{name}: {FILLER_TEXT}"[:max_length]
+    return item
+
+
+def _retyped_name(name: str) -> str:
+    """The name as the model sometimes writes it back: curly apostrophes, other case, no dots"""
+    return name.replace("'", "\u2019").replace(".", "").upper()
+
+
+def failure_summary(*clients: FakeGeminiClient) -> List[str]:
+    totals: Dict[str, int] = {}
+    for client in clients:
+        for kind, count in client.models.failures.items():
+            totals[kind] = totals.get(kind, 0) + count
+    return [f"{kind}={count}" for kind, count in sorted(totals.items())]
@@ -0,0 +1,238 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import re
+import sys
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from search_index import build_index, collation_key
+
+# --- Configuration ---
+DEFAULT_INPUT_CSV = "base-items.csv"
+DEFAULT_OUTPUT_DIR = "data"
+MANIFEST_NAME = "manifest.json"  # Fetched by the page on every load; names the current shards
+BUNDLE_FORMAT = 2
+HASH_LENGTH = 12  # Hex digits of the content hash in a shard's file name
+# A region with more items is split into shards of this many, in catalog order, so an edit
+# changes one shard and a new item only its region's last one (a byte cap would move the
+# boundaries of every later shard of the region whenever an item grows)
+SHARD_MAX_ITEMS = 100
+# Canonical field -> (header variants tried in order, case-insensitively; default value),
+# the same lookup script.js's processCSVData does for an uploaded CSV
+CANONICAL_FIELDS = [
+    ("name", (["Item Name", "name", "itemname"], "Unknown Item")),
+    ("region", (["Region", "region"], "Unknown")),
+    ("lore", (["Lore", "lore"], "")),
+    ("descriptionLore", (["Description5e", "description5e", "DescriptionLore", "descriptionlore"], "")),
+    ("image", (["ImageURL", "image", "imageurl"], "")),
+]
+FIELDS = [field for field, _ in CANONICAL_FIELDS]
+
+# --- Functions ---
+
+
+def capitalize(text: str) -> str:
+    """Upper-case the first letter of every space-separated word, like capitalize() in script.js"""
+    return " ".join(word[:1].upper() + word[1:] for word in text.split(" "))
+
+
+def resolve_columns(headers: List[str]) -> Dict[str, Optional[str]]:
+    """The input column feeding each canonical field (None when the file has none), found once per file"""
+    by_lower = {}
+    for header in headers:
+        by_lower.setdefault(header.strip().lower(), header)
+    return {
+        field: next((by_lower[v.lower()] for v in variants if v.lower() in by_lower), None)
+        for field, (variants, _) in CANONICAL_FIELDS
+    }
+
+
+class BundleReport:
+    """Problems found while validating a catalog; errors stop the build"""
+
+    def __init__(self):
+        self.errors: List[str] = []
+        self.warnings: List[str] = []
+
+    def print_report(self, input_csv: str):
+        for warning in self.warnings:
+            print(f"Warning: {warning}")
+        for error in self.errors:
+            print(f"Error: {error}")
+        if self.errors:
+            print(f"'{input_csv}' has {len(self.errors)} errors; no bundle was written.")
+
+
+def normalize_rows(
+    rows: Iterable[Dict], columns: Dict[str, Optional[str]], report: BundleReport
+) -> Iterator[List[str]]:
+    """Rows as lists of canonical field values, validated as the page's CSV parser would"""
+    names = set()
+    repeated = []
+    for line_number, row in enumerate(rows, 2):  # Line 1 is the header
+        if None in row or None in row.values():
+            report.errors.append(f"Line {line_number} does not have one field per header column")
+            continue
+        values = []
+        for field, (_, default) in CANONICAL_FIELDS:
+            column = columns[field]
+            values.append((row[column] if column else "") or default)
+        values[FIELDS.index("region")] = capitalize(values[FIELDS.index("region")])
+        name = values[FIELDS.index("name")]
+        if not columns["name"] or not row[columns["name"]].strip():
+            report.warnings.append(f"Line {line_number} has no item name")
+        elif name in names:
+            repeated.append(name)
+        names.add(name)
+        yield values
+    if repeated:
+        examples = ", ".join(repr(name) for name in repeated[:3])
+        report.warnings.append(f"{len(repeated)} rows repeat an earlier item name (e.g. {examples})")
+
+
+def encode_json(value: Dict) -> bytes:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def encode_shard(source: str, region: str, rows: List[List[str]]) -> bytes:
+    """Compact JSON: the canonical field names once, then one array of values per item"""
+    return encode_json(
+        {"format": BUNDLE_FORMAT, "source": source, "region": region, "fields": FIELDS, "rows": rows}
+    )
+
+
+def slugify(text: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-") or "region"
+
+
+def partition_rows(rows: List[List[str]]) -> List[Tuple[str, List[List[str]]]]:
+    """The rows grouped by region (regions A-Z, catalog order within one), split into shards"""
+    region = FIELDS.index("region")
+    by_region: Dict[str, List[List[str]]] = {}
+    for row in rows:
+        by_region.setdefault(row[region], []).append(row)
+    return [
+        (name, region_rows[start:start + SHARD_MAX_ITEMS])
+        for name, region_rows in sorted(by_region.items(), key=lambda item: collation_key(item[0]))
+        for start in range(0, len(region_rows), SHARD_MAX_ITEMS)
+    ]
+
+
+def write_atomic(path: str, data: bytes):
+    temp_path = path + ".partial"
+    with open(temp_path, "wb") as outfile:
+        outfile.write(data)
+    os.replace(temp_path, path)
+
+
+def write_hashed(output_dir: str, stem: str, data: bytes) -> str:
+    """Write `data` as <stem>.<content hash>.json unless it is there already; returns the name"""
+    name = f"{stem}.{hashlib.sha256(data).hexdigest()[:HASH_LENGTH]}.json"
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, name)
+    if not os.path.exists(path):
+        write_atomic(path, data)
+    return name
+
+
+def build_bundle(
+    input_csv: str, output_dir: str = DEFAULT_OUTPUT_DIR, delimiter: str = ";"
+) -> Tuple[Optional[Dict], BundleReport]:
+    """
+    Validate and normalize a catalog CSV into per-region JSON shards plus manifest.
+
+    The shards and the search index (see search_index) are named after their content, so
+    they can be cached by the browser indefinitely; only the small manifest needs
+    revalidating, and an edited item invalidates just its shard and the index. The
+    manifest lists every shard with its region and the catalog position of its first
+    row, which the index refers to, so the page fetches only the regions it shows.
+    Files of earlier builds of the same catalog are removed. Returns the manifest (None
+    when the catalog has errors) and the validation report.
+    """
+    report = BundleReport()
+    with open(input_csv, "r", encoding="utf-8-sig", newline="") as infile:
+        reader = csv.DictReader(infile, delimiter=delimiter)
+        headers = reader.fieldnames or []
+        columns = resolve_columns(headers)
+        if not headers:
+            report.errors.append(f"No header row found in '{input_csv}'")
+        elif columns["name"] is None:
+            report.errors.append(f"No item name column in '{input_csv}'; detected headers are {headers}")
+        rows = list(normalize_rows(reader, columns, report)) if not report.errors else []
+    if report.errors:
+        return None, report
+
+    source = os.path.basename(input_csv)
+    stem = os.path.splitext(source)[0]
+    catalog = hashlib.sha256()  # Identifies this version of the whole catalog
+    shards = []
+    ordered_rows: List[List[str]] = []  # Row ids of the index are positions in this order
+    region_shards = Counter()
+    for region, shard_rows in partition_rows(rows):
+        data = encode_shard(source, region, shard_rows)
+        name = write_hashed(output_dir, f"{stem}.{slugify(region)}.{region_shards[region]}", data)
+        catalog.update(name.encode("utf-8") + b"\x00")
+        shards.append(
+            {"name": name, "region": region, "start": len(ordered_rows), "items": len(shard_rows), "bytes": len(data)}
+        )
+        region_shards[region] += 1
+        ordered_rows.extend(shard_rows)
+    digest = catalog.hexdigest()
+    index_data = encode_json(build_index(ordered_rows, FIELDS, digest))
+    index_name = write_hashed(output_dir, stem + ".index", index_data)
+    region = FIELDS.index("region")
+    manifest = {
+        "format": BUNDLE_FORMAT,
+        "source": source,
+        "items": len(rows),
+        "bytes": sum(shard["bytes"] for shard in shards),
+        "sha256": digest,
+        "regions": dict(Counter(row[region] for row in ordered_rows)),
+        "shards": shards,
+        "index": index_name,
+        "index_bytes": len(index_data),
+    }
+    write_atomic(
+        os.path.join(output_dir, MANIFEST_NAME),
+        (json.dumps(manifest, indent=2, ensure_ascii=False) + "\n").encode("utf-8"),
+    )
+    current = {shard["name"] for shard in shards} | {index_name}
+    for name in os.listdir(output_dir):
+        if name not in current and name.startswith(stem + ".") and name.endswith(".json"):
+            os.remove(os.path.join(output_dir, name))  # An older build of this catalog
+    return manifest, report
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Build the item browser's static data shards from the base catalog CSV"
+    )
+    parser.add_argument("--input", default=DEFAULT_INPUT_CSV, help=f"(default: {DEFAULT_INPUT_CSV})")
+    parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR, help=f"(default: {DEFAULT_OUTPUT_DIR})")
+    parser.add_argument("--delimiter", default=";", help="Delimiter of the input CSV (default: ;)")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    try:
+        manifest, report = build_bundle(args.input, args.output_dir, args.delimiter)
+    except FileNotFoundError as e:
+        print(f"Error: File '{e.filename}' not found")
+        return 1
+    report.print_report(args.input)
+    if manifest is None:
+        return 1
+    print(
+        f"✓ Bundled {manifest['items']} items from '{args.input}' into {len(manifest['shards'])} shards "
+        f"over {len(manifest['regions'])} regions in '{args.output_dir}' ({manifest['bytes']:,} bytes, "
+        f"search index {manifest['index_bytes']:,} bytes)"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
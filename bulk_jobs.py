@@ -0,0 +1,316 @@
+"""
+Offline bulk-job mode: export a stage's requests as a JSONL job file, ingest the results.
+
+Each line of a job file is one request in the Gemini batch format, plus the metadata
+needed to tie it back to the catalog:
+
+    {"key": "<sha256>", "request": {"contents": [...], "generation_config": {...}, "tools": [...]},
+     "metadata": {"stage": "5e", "model": "gemini-2.0-flash", "batch": 3, "items": [["Item Name", "<input hash>"], ...]}}
+
+The key is the request's response-cache key, so the results need no bookkeeping of
+their own: a later run of the stage with --ingest-results rebuilds the same prompts and
+answers each one from the results file (a provider batch endpoint's output, or one
+written by `python bulk_jobs.py run`), without calling the API or waiting on rate limits.
+Result lines look like {"key": ..., "response": {"candidates": [{"content": {"parts":
+[{"text": ...}]}}]}} or {"key": ..., "error": {...}}.
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from google import genai
+
+from batch_executor import TokenBucket, estimate_tokens
+from checkpoint import batch_keys
+from response_cache import CachedResponse, config_schema, make_cache_key, response_text
+from retry_policy import no_recovery
+
+# --- Configuration ---
+DEFAULT_REQUESTS_PER_MINUTE = 15  # Pace of the local stand-in for a batch endpoint
+
+# A prompt, the config it is sent with and the input rows it covers
+JobRequest = Tuple[str, Any, List[Dict]]
+
+# --- Functions ---
+
+
+def config_value(config: Any, name: str) -> Any:
+    """A field of a config dict or GenerateContentConfig"""
+    if isinstance(config, dict):
+        return config.get(name)
+    return getattr(config, name, None)
+
+
+def tool_json(tool: Any) -> Dict:
+    if isinstance(tool, dict):
+        return tool
+    if hasattr(tool, "model_dump"):
+        return tool.model_dump(mode="json", exclude_none=True)
+    return {name: {} for name, value in vars(tool).items() if value is not None}
+
+
+def request_json(prompt: str, config: Any) -> Dict:
+    """The body of one batch request: the prompt and its generation config, schema and tools"""
+    request: Dict[str, Any] = {"contents": [{"role": "user", "parts": [{"text": prompt}]}]}
+    generation_config = {}
+    mime_type = config_value(config, "response_mime_type")
+    if mime_type:
+        generation_config["response_mime_type"] = mime_type
+    schema = config_schema(config)
+    if schema is not None:
+        json_schema = schema.model_json_schema() if hasattr(schema, "model_json_schema") else schema
+        generation_config["response_json_schema"] = json_schema
+    if generation_config:
+        request["generation_config"] = generation_config
+    tools = config_value(config, "tools")
+    if tools:
+        request["tools"] = [tool_json(tool) for tool in tools]
+    return request
+
+
+class ExportStats:
+    def __init__(self):
+        self.batches = 0
+        self.skipped = 0  # Batches answered by the cache or a previous run
+        self.requests = 0
+        self.items = 0
+        self.repeated = 0  # Requests identical to one already in the file
+        self.prompt_tokens = 0
+
+    def print_report(self, path: str):
+        print(
+            f"Exported {self.requests} requests for {self.items} items from {self.batches} batches "
+            f"to '{path}' (~{self.prompt_tokens:,} prompt tokens)"
+        )
+        if self.skipped or self.repeated:
+            print(
+                f"  No request needed for {self.skipped} batches (answered by the cache, a previous run "
+                f"or another batch); {self.repeated} repeated requests written once"
+            )
+
+
+def export_jobs(
+    path: str,
+    batches: Iterable[List[Dict]],
+    requests_for: Callable[[List[Dict]], List[JobRequest]],
+    stage: str,
+    model_id: str,
+) -> ExportStats:
+    """Stream the requests of every batch into a JSONL job file, each distinct request once"""
+    stats = ExportStats()
+    written = set()
+    with open(path, "w", encoding="utf-8") as jobs:
+        for index, batch in enumerate(batches):
+            stats.batches += 1
+            requests = requests_for(batch)
+            if not requests:
+                stats.skipped += 1
+            for prompt, config, items in requests:
+                key = make_cache_key(model_id, config_schema(config), prompt)
+                if key in written:
+                    stats.repeated += 1
+                    continue
+                written.add(key)
+                line = {
+                    "key": key,
+                    "request": request_json(prompt, config),
+                    "metadata": {
+                        "stage": stage,
+                        "model": model_id,
+                        "batch": index,
+                        "items": [list(item_key) for item_key in batch_keys(items)],
+                    },
+                }
+                jobs.write(json.dumps(line, ensure_ascii=False) + "\n")
+                stats.requests += 1
+                stats.items += len(items)
+                stats.prompt_tokens += estimate_tokens(prompt)
+    return stats
+
+
+def result_text(response: Dict) -> Optional[str]:
+    """The text of a result's response: every text part of its first candidate"""
+    candidates = response.get("candidates") or []
+    parts = ((candidates[0].get("content") or {}).get("parts") or []) if candidates else []
+    texts = [part["text"] for part in parts if isinstance(part.get("text"), str)]
+    return "".join(texts) if texts else None
+
+
+class JobResults:
+    """Response texts and errors of a bulk job, by request key"""
+
+    def __init__(self):
+        self.texts: Dict[str, str] = {}
+        self.errors: Dict[str, str] = {}
+
+    def answers(self, model: str, contents: str, config: Any = None) -> bool:
+        """True when the results hold this request, answered or failed at the provider"""
+        key = make_cache_key(model, config_schema(config), contents)
+        return key in self.texts or key in self.errors
+
+    @classmethod
+    def load(cls, paths: List[str]) -> "JobResults":
+        """Read results files; a key answered in a later file replaces an earlier answer"""
+        results = cls()
+        for path in paths:
+            with open(path, "r", encoding="utf-8") as infile:
+                for line_number, line in enumerate(infile, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        entry = json.loads(line)
+                        key = entry["key"]
+                    except (ValueError, KeyError, TypeError):
+                        print(f"Warning: Skipping malformed line {line_number} of '{path}'.")
+                        continue
+                    text = result_text(entry.get("response") or {})
+                    if text is not None:
+                        results.texts[key] = text
+                        results.errors.pop(key, None)
+                    elif key not in results.texts:
+                        error = entry.get("error") or entry.get("status") or "No text in the response"
+                        results.errors[key] = json.dumps(error) if not isinstance(error, str) else error
+        print(
+            f"Bulk results: {len(results.texts)} answered, {len(results.errors)} failed "
+            f"in {', '.join(repr(path) for path in paths)}"
+        )
+        return results
+
+
+class MissingResultError(RuntimeError):
+    """A request has no answer in the ingested results; its batch is not re-sent or split"""
+
+
+class JobResultsModels:
+    """Drop-in for `client.models` that answers every request from a bulk job's results"""
+
+    def __init__(self, results: JobResults):
+        self.results = results
+        self.answered = 0
+        self.failed = 0
+        self.missing = 0
+        self._lock = threading.Lock()
+
+    def is_cached(self, model: str, contents: str, config: Any = None) -> bool:
+        return True  # Nothing reaches the API, so no request waits on the rate limits
+
+    def generate_content(self, model: str, contents: str, config: Any = None):
+        # Only the exported requests have results, so a re-sent or split batch never would
+        no_recovery()
+        schema = config_schema(config)
+        key = make_cache_key(model, schema, contents)
+        text = self.results.texts.get(key)
+        with self._lock:
+            if text is not None:
+                self.answered += 1
+            elif key in self.results.errors:
+                self.failed += 1
+            else:
+                self.missing += 1
+        if text is not None:
+            return CachedResponse(text, schema)
+        if key in self.results.errors:
+            raise MissingResultError(f"Bulk job request failed: {self.results.errors[key]}")
+        raise MissingResultError("No result for this request in the bulk job results")
+
+
+class JobResultsClient:
+    """Stands in for genai.Client when a run ingests bulk job results"""
+
+    def __init__(self, results: JobResults):
+        self.results = results
+        self.models = JobResultsModels(results)
+
+    def print_report(self):
+        models = self.models
+        print(
+            f"Bulk results: {models.answered} requests answered from the results, "
+            f"{models.failed} failed at the provider, {models.missing} had no result"
+        )
+        if models.failed or models.missing:
+            print(
+                "  Their items were saved as errors; export again with --delta-from INPUT OUTPUT "
+                "to request only those."
+            )
+
+
+def run_jobs(
+    jobs_path: str,
+    results_path: str,
+    client: Any,
+    requests_per_minute: float = DEFAULT_REQUESTS_PER_MINUTE,
+) -> Tuple[int, int]:
+    """
+    Local stand-in for a batch endpoint: send each request of a job file, appending results.
+
+    Requests already answered in `results_path` are skipped, so an interrupted run is
+    continued by running it again. Returns the requests answered and failed.
+    """
+    done = set(JobResults.load([results_path]).texts) if os.path.exists(results_path) else set()
+    bucket = TokenBucket(requests_per_minute, capacity=1)
+    answered = failed = 0
+    with open(jobs_path, "r", encoding="utf-8") as jobs, open(results_path, "a", encoding="utf-8") as results:
+        for line in jobs:
+            if not line.strip():
+                continue
+            job = json.loads(line)
+            if job["key"] in done:
+                continue
+            request = job["request"]
+            config = dict(request.get("generation_config") or {})
+            if request.get("tools"):
+                config["tools"] = request["tools"]
+            wait = bucket.wait_time(1)
+            if wait:
+                time.sleep(wait)
+            bucket.consume(1)
+            try:
+                response = client.models.generate_content(
+                    model=job["metadata"]["model"],
+                    contents=request["contents"][0]["parts"][0]["text"],
+                    config=config or None,
+                )
+                text = response_text(response)
+                entry = {"key": job["key"], "response": {"candidates": [{"content": {"parts": [{"text": text}]}}]}}
+                answered += 1
+            except Exception as e:
+                print(f"Error for request {job['key'][:12]}: {e}")
+                entry = {"key": job["key"], "error": {"message": str(e)}}
+                failed += 1
+            results.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            results.flush()
+    return answered, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send the requests of a bulk job file and write its results")
+    parser.add_argument("command", choices=["run"])
+    parser.add_argument("jobs_jsonl", metavar="JOBS_JSONL")
+    parser.add_argument("results_jsonl", metavar="RESULTS_JSONL")
+    parser.add_argument(
+        "--requests-per-minute",
+        type=float,
+        default=DEFAULT_REQUESTS_PER_MINUTE,
+        help=f"(default: {DEFAULT_REQUESTS_PER_MINUTE})",
+    )
+    args = parser.parse_args()
+
+    api_key = os.environ.get("GOOGLE_API_KEY")
+    if not api_key:
+        print("Error: GOOGLE_API_KEY environment variable not set")
+        return
+    try:
+        answered, failed = run_jobs(
+            args.jobs_jsonl, args.results_jsonl, genai.Client(api_key=api_key), args.requests_per_minute
+        )
+        print(f"✓ {answered} requests answered, {failed} failed; results in '{args.results_jsonl}'")
+    except FileNotFoundError as e:
+        print(f"Error: File '{e.filename}' not found")
+
+
+if __name__ == "__main__":
+    main()
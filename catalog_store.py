@@ -0,0 +1,317 @@
+"""
+Versioned store of catalog CSV snapshots with row-level diffs.
+
+Each distinct row is stored once, keyed by the SHA-256 of its content; a version is its
+header plus the digests of its rows in order. Snapshots that share most rows (the
+base-items*.csv and items*.csv copies) therefore cost one 32-byte digest per row plus
+the rows that actually changed. Usage:
+
+    python catalog_store.py ingest base-items.csv base-items-2.csv ...
+    python catalog_store.py log
+    python catalog_store.py diff base-items-4.csv base-items-5.csv
+    python catalog_store.py checkout base-items-2.csv restored.csv
+
+A version is named after the file it was ingested from (or --name); a name refers to
+its latest version, and `#<id>` to any version listed by `log`.
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+# --- Configuration ---
+DEFAULT_STORE_PATH = "catalog_store.sqlite"
+NAME_COLUMN = "Item Name"
+DIGEST_SIZE = 32  # Bytes of a row digest in a version's row list
+MAX_VALUE_PREVIEW = 60  # Characters of a changed value shown by `diff`
+
+# --- Functions ---
+
+
+def row_digest(row: Dict) -> bytes:
+    """Content address of a row: independent of column order, so reordered headers share rows"""
+    return hashlib.sha256(json.dumps(row, sort_keys=True, ensure_ascii=False).encode("utf-8")).digest()
+
+
+def name_column(headers: List[str]) -> Optional[str]:
+    return next((h for h in headers if h.strip().lower() == NAME_COLUMN.lower()), None)
+
+
+def preview(value: Optional[str]) -> str:
+    text = " ".join((value or "").split())
+    return repr(text if len(text) <= MAX_VALUE_PREVIEW else text[: MAX_VALUE_PREVIEW - 1] + "…")
+
+
+class Version:
+    def __init__(self, version_id: int, name: str, headers: List[str], digests: List[bytes], created_at: float):
+        self.id = version_id
+        self.name = name
+        self.headers = headers
+        self.digests = digests
+        self.created_at = created_at
+
+
+class CatalogDiff:
+    """Rows added, removed and changed between two versions, matched by item name"""
+
+    def __init__(self):
+        self.unchanged = 0
+        self.added: List[Dict] = []
+        self.removed: List[Dict] = []
+        self.changed: List[Tuple[Dict, Dict, List[str]]] = []  # (old row, new row, changed fields)
+        self.added_columns: List[str] = []
+        self.removed_columns: List[str] = []
+
+    def print_report(self, old: Version, new: Version, name_of):
+        print(f"Diff of '{old.name}' (#{old.id}) and '{new.name}' (#{new.id}):")
+        if self.added_columns or self.removed_columns:
+            print(f"  Columns added: {self.added_columns or 'none'}; removed: {self.removed_columns or 'none'}")
+        for row in self.removed:
+            print(f"- {name_of(row)}")
+        for row in self.added:
+            print(f"+ {name_of(row)}")
+        for old_row, new_row, fields in self.changed:
+            print(f"~ {name_of(new_row)}")
+            for field in fields:
+                print(f"    {field}: {preview(old_row.get(field))} -> {preview(new_row.get(field))}")
+        print(
+            f"{self.unchanged} rows unchanged, {len(self.changed)} changed, "
+            f"{len(self.added)} added, {len(self.removed)} removed"
+        )
+
+
+class CatalogStore:
+    """SQLite store of content-addressed catalog rows and the versions made of them"""
+
+    def __init__(self, path: str = DEFAULT_STORE_PATH):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS rows (digest BLOB PRIMARY KEY, data TEXT NOT NULL)")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS versions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                headers TEXT NOT NULL,
+                row_digests BLOB NOT NULL,
+                created_at REAL NOT NULL
+            )"""
+        )
+        self._conn.commit()
+
+    def ingest(self, path: str, name: Optional[str] = None, delimiter: str = ";") -> Tuple[Version, int, bool]:
+        """
+        Store a CSV snapshot as a new version; returns it, the rows that were new to the
+        store, and whether it was stored (False when it repeats the name's latest version).
+        """
+        name = name or os.path.basename(path)
+        with open(path, "r", encoding="utf-8-sig", newline="") as infile:
+            reader = csv.DictReader(infile, delimiter=delimiter)
+            headers = list(reader.fieldnames or [])
+            if not headers:
+                raise ValueError(f"No header row found in '{path}'")
+            digests = []
+            new_rows = {}
+            for line_number, row in enumerate(reader, 2):  # Line 1 is the header
+                if None in row:
+                    print(f"Warning: Line {line_number} of '{path}' has more fields than the header; extras dropped")
+                    del row[None]
+                digest = row_digest(row)
+                digests.append(digest)
+                new_rows.setdefault(digest, row)
+
+        latest = self.find(name)
+        if latest is not None and latest.headers == headers and latest.digests == digests:
+            return latest, 0, False
+        before = self._conn.total_changes
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO rows (digest, data) VALUES (?, ?)",
+            [(digest, json.dumps(row, ensure_ascii=False)) for digest, row in new_rows.items()],
+        )
+        added_rows = self._conn.total_changes - before
+        cursor = self._conn.execute(
+            "INSERT INTO versions (name, headers, row_digests, created_at) VALUES (?, ?, ?, ?)",
+            (name, json.dumps(headers, ensure_ascii=False), b"".join(digests), time.time()),
+        )
+        self._conn.commit()
+        return self.get(cursor.lastrowid), added_rows, True
+
+    def _version(self, row) -> Version:
+        version_id, name, headers, blob, created_at = row
+        digests = [blob[i:i + DIGEST_SIZE] for i in range(0, len(blob), DIGEST_SIZE)]
+        return Version(version_id, name, json.loads(headers), digests, created_at)
+
+    def get(self, version_id: int) -> Optional[Version]:
+        row = self._conn.execute(
+            "SELECT id, name, headers, row_digests, created_at FROM versions WHERE id = ?", (version_id,)
+        ).fetchone()
+        return self._version(row) if row else None
+
+    def find(self, name: str) -> Optional[Version]:
+        """The latest version of this name"""
+        row = self._conn.execute(
+            "SELECT id, name, headers, row_digests, created_at FROM versions WHERE name = ? ORDER BY id DESC",
+            (name,),
+        ).fetchone()
+        return self._version(row) if row else None
+
+    def resolve(self, ref: str) -> Version:
+        """A version by `#<id>` or name"""
+        version = self.get(int(ref[1:])) if ref.startswith("#") and ref[1:].isdigit() else self.find(ref)
+        if version is None:
+            raise KeyError(f"No version '{ref}' in '{self.path}'")
+        return version
+
+    def versions(self) -> List[Tuple[int, str, int, float]]:
+        return self._conn.execute(
+            f"SELECT id, name, LENGTH(row_digests) / {DIGEST_SIZE}, created_at FROM versions ORDER BY id"
+        ).fetchall()
+
+    def load_rows(self, digests: List[bytes]) -> Dict[bytes, Dict]:
+        """Row contents by digest, each distinct row fetched once"""
+        rows = {}
+        for digest in dict.fromkeys(digests):
+            data = self._conn.execute("SELECT data FROM rows WHERE digest = ?", (digest,)).fetchone()[0]
+            rows[digest] = json.loads(data)
+        return rows
+
+    def diff(self, old: Version, new: Version) -> CatalogDiff:
+        """
+        Row-level diff in O(rows): rows with the same digest in both versions are unchanged
+        without being read; only the rest are loaded and matched by item name (the k-th
+        row of a repeated name with the k-th of the other version), then compared field
+        by field.
+        """
+        result = CatalogDiff()
+        result.added_columns = [h for h in dict.fromkeys(new.headers) if h not in old.headers]
+        result.removed_columns = [h for h in dict.fromkeys(old.headers) if h not in new.headers]
+        old_left = Counter(old.digests)
+        new_left = Counter(new.digests)
+        common = old_left & new_left
+        result.unchanged = sum(common.values())
+        old_left -= common
+        new_left -= common
+
+        def leftover(version: Version, left: Counter) -> List[bytes]:
+            digests = []
+            for digest in version.digests:
+                if left[digest]:
+                    left[digest] -= 1
+                    digests.append(digest)
+            return digests
+
+        old_digests = leftover(old, old_left)
+        new_digests = leftover(new, new_left)
+        rows = self.load_rows(old_digests + new_digests)
+        old_name = name_column(old.headers)
+        new_name = name_column(new.headers)
+        shared = [h for h in new.headers if h in old.headers]  # Other columns are reported once, above
+
+        by_name: Dict[str, List[Dict]] = {}
+        for digest in old_digests:
+            row = rows[digest]
+            by_name.setdefault((row.get(old_name) or "").strip(), []).append(row)
+        for digest in new_digests:
+            row = rows[digest]
+            candidates = by_name.get((row.get(new_name) or "").strip())
+            if not candidates:
+                result.added.append(row)
+                continue
+            old_row = candidates.pop(0)
+            fields = [f for f in shared if (old_row.get(f) or "") != (row.get(f) or "")]
+            if fields:
+                result.changed.append((old_row, row, fields))
+            else:
+                result.unchanged += 1
+        for candidates in by_name.values():
+            result.removed.extend(candidates)
+        return result
+
+    def checkout(self, version: Version, output_csv: str, delimiter: str = ";"):
+        """Write a version as a fully quoted CSV, as quote_csv.py emits"""
+        rows = self.load_rows(version.digests)
+        with open(output_csv, "w", encoding="utf-8", newline="") as outfile:
+            writer = csv.DictWriter(outfile, fieldnames=version.headers, delimiter=delimiter, quoting=csv.QUOTE_ALL)
+            writer.writeheader()
+            for digest in version.digests:
+                writer.writerow(rows[digest])
+
+    def print_stats(self):
+        rows, row_bytes = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM rows").fetchone()
+        versions, references = self._conn.execute(
+            f"SELECT COUNT(*), COALESCE(SUM(LENGTH(row_digests)), 0) / {DIGEST_SIZE} FROM versions"
+        ).fetchone()
+        print(
+            f"Catalog store: {versions} versions of {references} rows in total, "
+            f"{rows} distinct rows ({row_bytes / 1024:.0f} KB) in '{self.path}'"
+        )
+
+    def close(self):
+        self._conn.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Store catalog CSV snapshots as versions and diff them by item name")
+    parser.add_argument("--store", default=DEFAULT_STORE_PATH, help=f"(default: {DEFAULT_STORE_PATH})")
+    parser.add_argument("--delimiter", default=";", help="Delimiter of the CSV files (default: ;)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest = commands.add_parser("ingest", help="Store CSV snapshots as new versions")
+    ingest.add_argument("csv_files", nargs="+", metavar="CSV")
+    ingest.add_argument("--name", help="Version name (default: the file name; only with a single CSV)")
+    commands.add_parser("log", help="List the stored versions")
+    diff = commands.add_parser("diff", help="Rows added, removed and changed between two versions")
+    diff.add_argument("old", metavar="OLD_VERSION")
+    diff.add_argument("new", metavar="NEW_VERSION")
+    checkout = commands.add_parser("checkout", help="Write a version back to a fully quoted CSV")
+    checkout.add_argument("version", metavar="VERSION")
+    checkout.add_argument("output_csv", metavar="OUTPUT_CSV")
+    args = parser.parse_args()
+    if args.command == "ingest" and args.name and len(args.csv_files) > 1:
+        parser.error("--name needs a single CSV")
+    return args
+
+
+def main():
+    args = parse_args()
+    store = CatalogStore(args.store)
+    try:
+        if args.command == "ingest":
+            for path in args.csv_files:
+                version, added_rows, stored = store.ingest(path, args.name, args.delimiter)
+                if stored:
+                    print(
+                        f"✓ Stored '{path}' as '{version.name}' (#{version.id}): "
+                        f"{len(version.digests)} rows, {added_rows} new to the store"
+                    )
+                else:
+                    print(f"'{path}' is unchanged since '{version.name}' (#{version.id})")
+            store.print_stats()
+        elif args.command == "log":
+            for version_id, name, rows, created_at in store.versions():
+                print(f"#{version_id:<4} {time.strftime('%Y-%m-%d %H:%M', time.localtime(created_at))}  {rows:>6} rows  {name}")
+            store.print_stats()
+        elif args.command == "diff":
+            old, new = store.resolve(args.old), store.resolve(args.new)
+            old_name, new_name = name_column(old.headers), name_column(new.headers)
+            store.diff(old, new).print_report(
+                old, new, lambda row: row.get(new_name) if new_name in row else row.get(old_name)
+            )
+        elif args.command == "checkout":
+            version = store.resolve(args.version)
+            store.checkout(version, args.output_csv, args.delimiter)
+            print(f"✓ Wrote '{version.name}' (#{version.id}) to '{args.output_csv}' ({len(version.digests)} rows)")
+    except FileNotFoundError as e:
+        print(f"Error: File '{e.filename}' not found")
+    except (KeyError, ValueError) as e:
+        print(f"Error: {e}")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
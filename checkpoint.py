@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# --- Configuration ---
+JOURNAL_SUFFIX = ".journal.jsonl"
+NAME_COLUMN = "Item Name"
+
+# --- Functions ---
+
+
+def journal_path_for(output_file: str) -> str:
+    """Journal file that sits next to an output CSV"""
+    return output_file + JOURNAL_SUFFIX
+
+
+def item_input_hash(item: Dict) -> str:
+    """Hash of every input field of a row, taken before the row is modified by processing"""
+    payload = json.dumps(
+        [[str(k), "" if v is None else str(v)] for k, v in item.items()], ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def item_key(item: Dict) -> Tuple[str, str]:
+    item = getattr(item, "source_row", item)  # Rows carried over by a delta run keep their input key
+    return (item.get(NAME_COLUMN) or "", item_input_hash(item))
+
+
+class CheckpointJournal:
+    """
+    Append-only record of finished batches for one output file.
+
+    Each line lists the (Item Name, input hash) pairs of a batch together with the size of
+    the output file right after that batch was written. On resume the output is truncated
+    back to the last recorded size, so a row torn by a crash is discarded and redone.
+    While a run lasts its rows may go to a separate `data_file` (see output_writer), which
+    becomes the output when the run is published.
+    """
+
+    def __init__(self, output_file: str, data_file: Optional[str] = None):
+        self.output_file = output_file
+        self.data_file = data_file or output_file
+        self.path = journal_path_for(output_file)
+        self.completed: Counter = Counter()
+        self.output_size = 0
+
+    def reset(self):
+        """Start a fresh run: forget every previous checkpoint"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.completed = Counter()
+        self.output_size = 0
+
+    def load(self, rollback: bool = True) -> bool:
+        """Read the journal and roll the output back to the last checkpoint; False if unusable"""
+        # A published run has no data file left; its output holds every journaled row
+        rows_file = self.data_file if os.path.exists(self.data_file) else self.output_file
+        if not os.path.exists(self.path) or not os.path.exists(rows_file):
+            return False
+        with open(self.path, "r", encoding="utf-8") as journal:
+            for line in journal:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    break  # A torn last line means that batch never finished
+                for name, input_hash in entry["items"]:
+                    self.completed[(name, input_hash)] += 1
+                self.output_size = entry["output_size"]
+
+        actual_size = os.path.getsize(rows_file)
+        if actual_size < self.output_size:
+            print(f"Warning: '{rows_file}' is shorter than its checkpoint journal; cannot resume.")
+            self.completed = Counter()
+            self.output_size = 0
+            return False
+        if actual_size > self.output_size and rollback:
+            print(f"Discarding {actual_size - self.output_size} bytes written after the last checkpoint.")
+            with open(rows_file, "r+b") as outfile:
+                outfile.truncate(self.output_size)
+        return self.output_size > 0
+
+    def pending(self, items: Iterable[Dict]) -> Iterator[Dict]:
+        """Yield items that still need processing (a duplicate row is skipped once per journal entry)"""
+        remaining = Counter(self.completed)
+        for item in items:
+            key = item_key(item)
+            if remaining[key] > 0:
+                remaining[key] -= 1
+            else:
+                yield item
+
+    def record_batch(self, keys: List[Tuple[str, str]]):
+        """Record a batch as done; call only after its rows were written to the data file"""
+        self.output_size = os.path.getsize(self.data_file)
+        entry = {"items": [list(key) for key in keys], "output_size": self.output_size}
+        with open(self.path, "a", encoding="utf-8") as journal:
+            journal.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            journal.flush()
+            os.fsync(journal.fileno())
+        for key in keys:
+            self.completed[key] += 1
+
+
+def prepare_journal(
+    output_file: str, resume: bool, dry_run: bool = False, data_file: Optional[str] = None
+) -> Tuple[CheckpointJournal, bool]:
+    """
+    Open the checkpoint journal for a run.
+
+    Returns the journal and whether the run continues an existing output file. Without
+    `resume` (or when there is nothing to resume) the journal is reset and the data file
+    (the output itself unless rows go to a temporary file first) truncated, matching a
+    fresh run. A `dry_run` reads the journal but touches neither file.
+    """
+    journal = CheckpointJournal(output_file, data_file)
+    if resume and journal.load(rollback=not dry_run):
+        print(f"Resuming from checkpoint: {sum(journal.completed.values())} items already done.")
+        return journal, True
+    if resume:
+        print("No usable checkpoint found; starting from the beginning.")
+    if dry_run:
+        return journal, False
+    journal.reset()
+    with open(journal.data_file, "w", encoding="utf-8", newline=""):
+        pass  # Just create/clear the file
+    return journal, False
+
+
+def batch_keys(batch: List[Dict]) -> List[Tuple[str, str]]:
+    return [item_key(item) for item in batch]
+
+
+def track_batch_keys(
+    batches: Iterable[List[Dict]], keys_by_index: Dict[int, List[Tuple[str, str]]]
+) -> Iterator[List[Dict]]:
+    """Yield batches unchanged, remembering each one's keys before processing modifies it"""
+    for index, batch in enumerate(batches):
+        keys_by_index[index] = batch_keys(batch)
+        yield batch
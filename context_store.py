@@ -0,0 +1,115 @@
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+# --- Configuration ---
+DEFAULT_CONTEXT_STORE_PATH = "gathered_context.sqlite"
+DEFAULT_MAX_AGE_DAYS = 90  # Search results older than this are gathered again
+NAME_COLUMN = "Item Name"
+REGION_COLUMN = "Region"
+
+# --- Functions ---
+
+
+def context_key(item: Dict) -> Tuple[str, str]:
+    """Store key of an item: its name and (uncorrected) region, case-insensitive"""
+    return (
+        (item.get(NAME_COLUMN) or "").strip().lower(),
+        (item.get(REGION_COLUMN) or "").strip().lower(),
+    )
+
+
+def split_context_by_item(text: str, items: List[Dict]) -> Dict[Tuple[str, str], str]:
+    """
+    Cut a consolidated search answer into per-item sections headed `## <Item Name>`.
+
+    Items the answer has no section for get the whole answer, so nothing is lost when the
+    model ignores the requested layout.
+    """
+    by_name = {(item.get(NAME_COLUMN) or "").strip().lower(): item for item in items}
+    sections: Dict[str, List[str]] = {}
+    current: Optional[str] = None
+    for line in text.splitlines():
+        heading = re.match(r"^\s*#{1,6}\s*(.+?)\s*#*\s*$", line)
+        if heading:
+            name = heading.group(1).strip(" *:_").lower()
+            current = name if name in by_name else None
+            if current is not None:
+                sections[current] = [line.strip()]
+            continue
+        if current is not None:
+            sections[current].append(line)
+
+    contexts = {}
+    for name, item in by_name.items():
+        section = "\n".join(sections.get(name, [])).strip()
+        contexts[context_key(item)] = section if "\n" in section else text.strip()
+    return contexts
+
+
+def join_contexts(contexts: List[str]) -> str:
+    """Combine per-item contexts in item order, once each (items may share a whole answer)"""
+    return "\n\n".join(dict.fromkeys(context for context in contexts if context))
+
+
+class ContextStore:
+    """SQLite store of gathered search context per (item name, region)"""
+
+    def __init__(self, path: str = DEFAULT_CONTEXT_STORE_PATH, max_age_days: float = DEFAULT_MAX_AGE_DAYS):
+        self.path = path
+        self.max_age_seconds = max_age_days * 24 * 3600
+        self.hits = 0
+        self.writes = 0
+        self._lock = threading.Lock()  # Batches look contexts up from worker threads
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS contexts (
+                name_key TEXT NOT NULL,
+                region_key TEXT NOT NULL,
+                context TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (name_key, region_key)
+            )"""
+        )
+        self._conn.commit()
+
+    def get_many(self, items: List[Dict], count_hits: bool = True) -> Dict[Tuple[str, str], str]:
+        """Stored, unexpired contexts for whichever of these items have one"""
+        keys = list(dict.fromkeys(context_key(item) for item in items))
+        found = {}
+        cutoff = time.time() - self.max_age_seconds
+        with self._lock:
+            for key in keys:
+                row = self._conn.execute(
+                    "SELECT context FROM contexts WHERE name_key = ? AND region_key = ? AND created_at >= ?",
+                    (*key, cutoff),
+                ).fetchone()
+                if row is not None:
+                    found[key] = row[0]
+            if count_hits:
+                self.hits += len(found)
+        return found
+
+    def put_many(self, contexts: Dict[Tuple[str, str], str]):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO contexts (name_key, region_key, context, created_at) VALUES (?, ?, ?, ?)",
+                [(name, region, context, now) for (name, region), context in contexts.items()],
+            )
+            self._conn.commit()
+            self.writes += len(contexts)
+
+    def print_stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM contexts").fetchone()[0]
+        print(
+            f"Context store: {self.hits} item contexts reused, {self.writes} stored, "
+            f"{entries} entries in '{self.path}'"
+        )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
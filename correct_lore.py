@@ -1,8 +1,10 @@
+import asyncio
 import csv
 import os
+import threading
 import time
-import json
-from typing import List, Dict, Optional
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterable, Iterator, List, Dict, Optional, Tuple
 from pydantic import BaseModel, Field
 from google import genai
 from google.genai.types import (
@@ -14,6 +16,29 @@ from google.genai.types import (
     Content,
     Part,
 )
+from batch_executor import CHARS_PER_TOKEN, RateLimiter, batch_context, estimate_tokens, run_batches
+from response_cache import batch_is_cached, response_text
+from response_parsing import parser_for
+from name_matching import reconcile
+from checkpoint import CheckpointJournal, batch_keys, prepare_journal, track_batch_keys
+from output_writer import OrderedCsvWriter, temp_path_for
+from batch_planner import BatchPlan, plan_batches, report_dry_run
+from bulk_jobs import JobRequest, JobResults, export_jobs
+from csv_stream import iter_item_records, read_csv_header
+from item_record import ItemSchema
+from delta import (
+    DeltaIndex,
+    changed_rows,
+    process_changed,
+    resolve_duplicates,
+    run_batches_for,
+    summarize_run,
+)
+from telemetry import recorded_latency
+from retry_policy import process_with_recovery
+from key_pool import pool_limits
+from stage_cli import StageRun, ask_paths, report_run, stage_parser
+from context_store import ContextStore, context_key, join_contexts, split_context_by_item
 
 # --- Configuration ---
 # Columns to use for context and correction
@@ -24,13 +49,29 @@ INPUT_DESCRIPTION_COLUMN = "DescriptionLore"  # Added for context
 
 # Columns required in the input file to ensure they can be carried over to the output
 REQUIRED_INPUT_COLUMNS_FOR_OUTPUT = ["Item Name", "Region", "Lore", "DescriptionLore", "ImageURL"]
+# Columns that feed the prompts; a row is re-sent in delta mode only when one of them changed
+DELTA_COLUMNS = [INPUT_NAME_COLUMN, INPUT_REGION_COLUMN, INPUT_LORE_COLUMN, INPUT_DESCRIPTION_COLUMN]
+DEDUPE_PAYLOADS = True  # Send each distinct prompt payload once and copy its result to repeats
 
 DEFAULT_INPUT_CSV = "items.csv"
 DEFAULT_OUTPUT_CSV = "items_lore_corrected.csv"
-BATCH_SIZE = 5  # Adjust as needed, lore correction might need more context per item
+BATCH_SIZE = 10  # Maximum items per batch; batches are packed by token estimate below this
+MAX_BATCH_TOKENS = 12_000  # Estimated tokens per batch across both steps of the query
 SLEEP_TIME = 10  # Seconds to wait between batches
 MODEL_ID = "gemini-2.0-flash"
+EXECUTION_MODE = "async"  # "async" keeps several batches in flight, "sequential" sleeps between batches
+MAX_IN_FLIGHT = 4  # Batches in flight at once in async mode
+REQUESTS_PER_MINUTE = 15  # Request quota shared by both steps of every batch
+TOKENS_PER_MINUTE = 1_000_000
+RESPONSE_TOKENS_PER_ITEM = 400  # Corrected lore is capped at ~1500 characters
+CONTEXT_TOKENS_PER_ITEM = 150  # Gathered context returned by step 1 and resent in step 2
+USE_RESPONSE_CACHE = True  # Re-runs over unchanged items are answered from disk
+CACHE_PATH = "gemini_cache.sqlite"
+METRICS_PATH = "gemini_metrics.jsonl"  # One JSON record per API call
+USE_CONTEXT_STORE = True  # Reuse gathered context per (item name, region) and skip the search step
+CONTEXT_STORE_PATH = "gathered_context.sqlite"
 GOOGLE_SEARCH_TOOL = Tool(google_search=GoogleSearch())
+INFO_GATHERING_CONFIG = GenerateContentConfig(tools=[GOOGLE_SEARCH_TOOL])
 # --- Pydantic Models ---
 
 
@@ -55,6 +96,12 @@ class BatchLoreResponse(BaseModel):
     )
 
 
+CORRECTION_CONFIG = GenerateContentConfig(
+    response_mime_type="application/json", response_schema=BatchLoreResponse
+)
+RESPONSE_PARSER = parser_for(BatchLoreResponse)
+
+
 # --- Functions ---
 
 
@@ -78,7 +125,7 @@ def setup_api():
 
 def create_info_gathering_prompt(items: List[Dict]) -> str:
     """Create a prompt to gather information and context about items."""
-    prompt = f"""For the following Runeterra items, gather relevant context regarding their likely origin, lore connections, and potential region inconsistencies. Focus on details that would help correct their 'Region' and 'Lore'. Use search if necessary to find the most up-to-date or accurate information. Provide the gathered context concisely for each item.
+    prompt = f"""For the following Runeterra items, gather relevant context regarding their likely origin, lore connections, and potential region inconsistencies. Focus on details that would help correct their 'Region' and 'Lore'. Use search if necessary to find the most up-to-date or accurate information. Provide the gathered context concisely for each item, starting each item's context with a heading line of the form '## <Item Name>'.
 
 Input Items:
 """
@@ -120,43 +167,129 @@ def create_correction_prompt(items: List[Dict], gathered_context: str) -> str:
     return prompt
 
 
-# --- Modified process_item_batch Function ---
-
-
-def process_item_batch(
-    client: genai.Client, items: List[Dict], batch_size: int = BATCH_SIZE
-) -> List[Dict]:
-    """Process a batch using a two-step query: 1. Gather info with search, 2. Correct with JSON output."""
-    print(f"Processing batch of {len(items)} items (2-step query)...")
-    results = []
-    gathered_context = "No context gathered."  # Default context
-
-    # --- Step 1: Information Gathering Query ---
+def search_item_context(client: genai.Client, items: List[Dict]) -> Tuple[str, bool]:
+    """Step 1: gather context with search; returns the context and whether the query succeeded"""
     print("Step 1: Gathering context...")
     info_prompt = create_info_gathering_prompt(items)
     try:
         info_response = client.models.generate_content(
             model=MODEL_ID,
             contents=info_prompt,
-            config=GenerateContentConfig(tools=[GOOGLE_SEARCH_TOOL]),
+            config=INFO_GATHERING_CONFIG,
         )
         if info_response.candidates and info_response.candidates[0].content.parts:
-            gathered_context = info_response.candidates[0].content.parts[0].text
             print("✓ Context gathered successfully.")
-        else:
-            print("Warning: No context could be gathered from the first query.")
-            if info_response.candidates:
-                for i, candidate in enumerate(info_response.candidates):
-                    if candidate.finish_reason:
-                        print(f"  Candidate {i} Finish reason: {candidate.finish_reason}")
-                    if candidate.safety_ratings:
-                        print(f"  Candidate {i} Safety ratings: {candidate.safety_ratings}")
+            return info_response.candidates[0].content.parts[0].text, True
+        print("Warning: No context could be gathered from the first query.")
+        if info_response.candidates:
+            for i, candidate in enumerate(info_response.candidates):
+                if candidate.finish_reason:
+                    print(f"  Candidate {i} Finish reason: {candidate.finish_reason}")
+                if candidate.safety_ratings:
+                    print(f"  Candidate {i} Safety ratings: {candidate.safety_ratings}")
+        return "No context gathered.", False
 
     except Exception as e:
         print(f"Error during Step 1 (Information Gathering): {e}")
-        gathered_context = (
-            f"Error gathering context: {e}"  # Store error in context for step 2 prompt
-        )
+        return f"Error gathering context: {e}", False  # Passed on to the step 2 prompt
+
+
+def stored_context(store: Optional[ContextStore], items: List[Dict]) -> Optional[str]:
+    """The step 2 context for these items if every one of them is stored, else None"""
+    if store is None or not items:
+        return None
+    found = store.get_many(items, count_hits=False)
+    if any(context_key(item) not in found for item in items):
+        return None
+    return join_contexts([found[context_key(item)] for item in items])
+
+
+def estimate_search_tokens(items: List[Dict]) -> int:
+    """The search step's share of estimate_batch_tokens: its prompt plus the context it returns"""
+    return estimate_tokens(create_info_gathering_prompt(items)) + CONTEXT_TOKENS_PER_ITEM * len(items)
+
+
+class ContextGatherer:
+    """
+    Step 1 of the query for every batch of a run.
+
+    Items with a context in `store` are not searched again; only the rest go to the
+    search query, and successful answers are stored per (item name, region). prefetch()
+    starts the search for batch N+1 on a background thread while batch N is corrected.
+    With a `limiter`, every search that is not answered from the response cache first
+    takes its request and tokens from it, so searches run ahead of their batch stay
+    within the quota; without one they are covered by their batch's own reservation.
+    """
+
+    def __init__(self, store: Optional[ContextStore] = None, limiter: Optional[RateLimiter] = None):
+        self.store = store
+        self.limiter = limiter
+        self._pending: Dict[Tuple[int, ...], Future] = {}
+        self._lock = threading.Lock()
+
+    def gather(self, client: genai.Client, items: List[Dict]) -> str:
+        with self._lock:
+            future = self._pending.pop(tuple(id(item) for item in items), None)
+        if future is not None:
+            return future.result()
+        return self._gather_now(client, items)
+
+    def _gather_now(self, client: genai.Client, items: List[Dict]) -> str:
+        contexts = self.store.get_many(items) if self.store else {}
+        missing = [item for item in items if context_key(item) not in contexts]
+        if not missing:
+            print("✓ Context reused from the context store; search skipped.")
+        else:
+            if self.limiter and not batch_is_cached(
+                client, MODEL_ID, create_info_gathering_prompt(missing), INFO_GATHERING_CONFIG
+            ):
+                self.limiter.acquire_blocking(estimate_search_tokens(missing))
+            text, ok = search_item_context(client, missing)
+            if not ok:
+                return join_contexts([contexts.get(context_key(item), "") for item in items] + [text])
+            fresh = split_context_by_item(text, missing)
+            if self.store:
+                self.store.put_many(fresh)
+            contexts.update(fresh)
+        # Built from the per-item sections either way, so a re-run sends an identical step 2 prompt
+        return join_contexts([contexts[context_key(item)] for item in items])
+
+    def _prefetch_one(self, client: genai.Client, index: int, items: List[Dict]) -> str:
+        with batch_context(index, len(items), "lore"):
+            return self._gather_now(client, items)
+
+    def prefetch(self, client: genai.Client, batches: Iterable[List[Dict]]) -> Iterator[List[Dict]]:
+        """Yield batches unchanged, starting the next batch's search as each one is handed on"""
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            previous = None
+            for index, batch in enumerate(batches):
+                items = changed_rows(batch)
+                if items:
+                    future = pool.submit(self._prefetch_one, client, index, items)
+                    with self._lock:
+                        self._pending[tuple(id(item) for item in items)] = future
+                if previous is not None:
+                    yield previous
+                previous = batch
+            if previous is not None:
+                yield previous
+
+
+# --- Modified process_item_batch Function ---
+
+
+def request_item_batch(
+    client: genai.Client,
+    items: List[Dict],
+    batch_size: int = BATCH_SIZE,
+    gatherer: Optional[ContextGatherer] = None,
+) -> List[Dict]:
+    """Process a batch using a two-step query: 1. Gather info with search, 2. Correct with JSON output."""
+    print(f"Processing batch of {len(items)} items (2-step query)...")
+    results = []
+
+    # --- Step 1: Information Gathering (stored, prefetched or searched now) ---
+    gathered_context = (gatherer or ContextGatherer()).gather(client, items)
 
     # --- Step 2: Correction Query ---
     print("Step 2: Generating corrections...")
@@ -167,40 +300,23 @@ def process_item_batch(
         correction_response = client.models.generate_content(
             model=MODEL_ID,
             contents=correction_prompt,
-            config=GenerateContentConfig(
-                response_mime_type="application/json", response_schema=BatchLoreResponse
-            ),
+            config=CORRECTION_CONFIG,
         )
 
         if correction_response.candidates and correction_response.candidates[0].content.parts:
-            try:
-                json_text = correction_response.candidates[0].content.parts[0].text
-                if json_text:
-                    if json_text.strip().startswith("```json"):
-                        json_text = json_text.strip()[7:-3].strip()
-                    elif json_text.strip().startswith("```"):
-                        json_text = json_text.strip()[3:-3].strip()
-
-                    parsed_data = json.loads(json_text)
-                    batch_results_model = BatchLoreResponse.model_validate(parsed_data)
-                else:
-                    print("Warning: Received empty text content for correction batch.")
-
-            except json.JSONDecodeError as json_err:
-                print(f"Error: Failed to decode JSON response for correction batch: {json_err}")
+            batch_results_model = RESPONSE_PARSER.parse(response_text(correction_response))
+            if batch_results_model.outcome == "empty":
+                print("Warning: Received empty text content for correction batch.")
+            elif batch_results_model.outcome == "salvaged":
                 print(
-                    f"Received text: {correction_response.candidates[0].content.parts[0].text if correction_response.candidates and correction_response.candidates[0].content.parts else 'No text part'}"
+                    f"Warning: Correction response was cut off or malformed; "
+                    f"kept {len(batch_results_model.items)} complete items"
                 )
-            except Exception as parse_err:
+            elif not batch_results_model.complete:
                 print(
-                    f"Error: Failed to parse or validate response for correction batch: {parse_err}"
+                    f"Error: Failed to parse or validate response for correction batch ({batch_results_model.outcome})"
                 )
-                try:
-                    print(
-                        f"Raw correction response content: {correction_response.candidates[0].content.to_dict() if correction_response.candidates else 'No candidates'}"
-                    )
-                except Exception as print_err:
-                    print(f"Could not print raw correction response content: {print_err}")
+                print(f"Received text: {response_text(correction_response)}")
         else:
             print("Error: No response content received for correction batch.")
             if correction_response.candidates:
@@ -211,24 +327,20 @@ def process_item_batch(
                         print(f"  Candidate {i} Safety ratings: {candidate.safety_ratings}")
 
         if batch_results_model and batch_results_model.items:
-            results_map = {}
-            for res in batch_results_model.items:
-                if res.item_name:
-                    results_map[res.item_name.strip().lower()] = {
-                        "region": res.corrected_region,
-                        "lore": res.corrected_lore,
-                    }
+            matched = reconcile(
+                [item.get(INPUT_NAME_COLUMN, "Unknown") for item in items], batch_results_model.items
+            )
+            matched.print_report("correction batch")
 
-            for item in items:
+            for j, item in enumerate(items):
                 item_name_original = item.get(INPUT_NAME_COLUMN, "Unknown")
-                item_name_key = item_name_original.strip().lower()
 
-                if item_name_key in results_map:
-                    item[INPUT_REGION_COLUMN] = results_map[item_name_key]["region"]
-                    item[INPUT_LORE_COLUMN] = results_map[item_name_key]["lore"]
+                if j in matched.matches:
+                    item[INPUT_REGION_COLUMN] = matched.matches[j].corrected_region
+                    item[INPUT_LORE_COLUMN] = matched.matches[j].corrected_lore
                 else:
                     print(
-                        f"Warning: No corrected data found for '{item_name_original}' (key: '{item_name_key}'). Available keys: {list(results_map.keys())}"
+                        f"Warning: No corrected data found for '{item_name_original}'. Returned names: {[res.item_name for res in batch_results_model.items]}"
                     )
                     item[INPUT_REGION_COLUMN] = f"Error: No data returned for item"
                     item[INPUT_LORE_COLUMN] = "Error: No data returned for item"
@@ -258,151 +370,439 @@ def process_item_batch(
     return results
 
 
-def save_batch(items: List[Dict], fieldnames: List[str], output_file: str, is_first_batch: bool):
-    """Save a batch of items to the output CSV file, quoting all fields."""
-    mode = "w" if is_first_batch else "a"
-    try:
-        with open(output_file, mode, encoding="utf-8", newline="") as outfile:
-            # Add quoting=csv.QUOTE_ALL to ensure all fields are quoted
-            writer = csv.DictWriter(
-                outfile,
-                fieldnames=fieldnames,
-                extrasaction="ignore",
-                delimiter=";",
-                quoting=csv.QUOTE_ALL,  # Ensure all fields are quoted
-            )
-            if is_first_batch:
-                writer.writeheader()  # writeheader() will also respect QUOTE_ALL
-            writer.writerows(items)
-    except IOError as e:
-        print(f"Error writing to output file {output_file}: {e}")
-        raise
+def mark_batch_error(items: List[Dict], e: Exception):
+    for item in items:
+        item[INPUT_REGION_COLUMN] = f"Error during batch processing: {str(e)}"
+        item[INPUT_LORE_COLUMN] = f"Error during batch processing: {str(e)}"
 
 
-def process_and_save_batches(
+def process_item_batch(
+    client: genai.Client,
     items: List[Dict],
-    fieldnames: List[str],
+    batch_size: int = BATCH_SIZE,
+    gatherer: Optional[ContextGatherer] = None,
+) -> List[Dict]:
+    """Process a batch, re-sending failed items until only those that cannot be corrected are errors"""
+    return process_with_recovery(
+        items,
+        lambda part: request_item_batch(client, part, len(part), gatherer),
+        needs_rerun,
+        mark_batch_error,
+        getattr(client, "recovery", None),
+    )
+
+
+def is_cached(client: genai.Client, items: List[Dict], context_store: Optional[ContextStore] = None) -> bool:
+    """True when the information gathering step for this batch is already in the response cache"""
+    items = changed_rows(items)
+    if not items:
+        return True  # Every row is carried over from a previous run
+    stored = stored_context(context_store, items)
+    if stored is not None:
+        # The search step is skipped, so only the correction request can reach the API
+        return batch_is_cached(
+            client, MODEL_ID, create_correction_prompt(items, stored), CORRECTION_CONFIG
+        )
+    # The correction prompt embeds the gathered context, so a cached first step means an
+    # identical (and therefore cached) second step
+    return batch_is_cached(
+        client, MODEL_ID, create_info_gathering_prompt(items), INFO_GATHERING_CONFIG
+    )
+
+
+def open_output(
     output_file: str,
+    fieldnames: List[str],
+    journal: Optional[CheckpointJournal] = None,
+    append: bool = False,
+) -> OrderedCsvWriter:
+    """The output CSV of a run, quoting all fields, published when the run completes"""
+    # Duplicates are resolved as their batch is written, after the batches holding the originals
+    return OrderedCsvWriter(
+        output_file,
+        fieldnames,
+        journal,
+        append,
+        quoting=csv.QUOTE_ALL,  # Ensure all fields are quoted, the header included
+        before_write=resolve_duplicates,
+    )
+
+
+def process_and_save_batches(
+    batches: Iterable[List[Dict]],
+    writer: OrderedCsvWriter,
     client: genai.Client,
-    batch_size: int = BATCH_SIZE,
+    num_batches: Optional[int] = None,
+    context_store: Optional[ContextStore] = None,
 ):
-    """Process items in batches and save each batch immediately"""
-    total_items = len(items)
-    num_batches = (total_items + batch_size - 1) // batch_size
-
-    for i in range(num_batches):
-        start_index = i * batch_size
-        end_index = start_index + batch_size
-        batch = items[start_index:end_index]
+    """Process planned batches (a list or a stream) and save each batch immediately"""
+    # The searches run ahead of the sleep between batches, so they are held to the quota instead
+    requests_per_minute, tokens_per_minute, _ = pool_limits(
+        client, MODEL_ID, REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE, MAX_IN_FLIGHT
+    )
+    gatherer = ContextGatherer(context_store, RateLimiter(requests_per_minute, tokens_per_minute))
+    for i, batch in enumerate(gatherer.prefetch(client, batches)):
+        if i > 0 and not is_cached(client, batch, context_store):
+            print(f"Waiting {SLEEP_TIME} seconds before next batch...")
+            time.sleep(SLEEP_TIME)
 
-        print(f"\n--- Processing Batch {i+1}/{num_batches} ({len(batch)} items) ---")
+        print(f"\n--- Processing Batch {i+1}/{num_batches or '?'} ({len(batch)} items) ---")
+        keys = batch_keys(batch)  # Taken before processing overwrites Region/Lore
 
         try:
-            processed_batch = process_item_batch(client, batch, batch_size)
+            with batch_context(i, len(batch), "lore"):
+                processed_batch = process_changed(
+                    batch, lambda items: process_item_batch(client, items, len(items), gatherer)
+                )
 
-            is_first = i == 0
-            save_batch(processed_batch, fieldnames, output_file, is_first)
-            print(f"✓ Batch {i+1} saved successfully to '{output_file}'")
+            writer.write_batch(i, processed_batch, keys)
+            print(f"✓ Batch {i+1} processed successfully")
 
         except Exception as e:
             print(f"!! Critical Error processing/saving batch {i+1}: {e}")
-            error_batch = []
-            for item in batch:
-                item[INPUT_REGION_COLUMN] = f"Error during batch processing: {str(e)}"
-                item[INPUT_LORE_COLUMN] = f"Error during batch processing: {str(e)}"
-                error_batch.append(item)
+            mark_batch_error(changed_rows(batch), e)
             try:
-                is_first = i == 0
-                save_batch(error_batch, fieldnames, output_file, is_first)
+                writer.write_batch(i, batch, keys)
                 print(f"Saved batch {i+1} with critical error messages")
             except Exception as save_e:
                 print(f"!!! Failed to save batch {i+1} even with error messages: {save_e}")
 
-        if i < num_batches - 1:
-            print(f"Waiting {SLEEP_TIME} seconds before next batch...")
-            time.sleep(SLEEP_TIME)
 
+def needs_rerun(output_row: Dict) -> bool:
+    """A previous output row that recorded an error is not carried over by a delta run"""
+    return any(
+        (output_row.get(col) or "").startswith("Error")
+        for col in (INPUT_REGION_COLUMN, INPUT_LORE_COLUMN)
+    )
 
-def main():
-    """Main function to process items and correct lore/regions"""
-    input_csv_file = (
-        input(f"Enter input CSV filename (default: {DEFAULT_INPUT_CSV}): ") or DEFAULT_INPUT_CSV
+
+def estimate_response_tokens(item: Dict) -> int:
+    """Gathered context plus corrected lore, which tracks the length of the current lore"""
+    lore_tokens = estimate_tokens(item.get(INPUT_LORE_COLUMN) or "")
+    return CONTEXT_TOKENS_PER_ITEM + min(RESPONSE_TOKENS_PER_ITEM, lore_tokens)
+
+
+def estimate_batch_tokens(items: List[Dict]) -> int:
+    """Estimate the tokens one batch consumes across both steps of the query"""
+    # The correction prompt repeats the items plus the gathered context, so count the items twice
+    items = changed_rows(items)
+    return 2 * estimate_tokens(create_info_gathering_prompt(items)) + sum(
+        estimate_response_tokens(item) for item in items
     )
-    output_csv_file = (
-        input(f"Enter output CSV filename (default: {DEFAULT_OUTPUT_CSV}): ") or DEFAULT_OUTPUT_CSV
+
+
+def estimate_correction_tokens(items: List[Dict]) -> int:
+    """What a batch reserves when its search takes its own share (see ContextGatherer)"""
+    return estimate_batch_tokens(items) - estimate_search_tokens(changed_rows(items))
+
+
+def plan_item_batches(items: List[Dict]) -> BatchPlan:
+    """Pack items into batches up to MAX_BATCH_TOKENS (and at most BATCH_SIZE items)"""
+    return plan_batches(
+        items,
+        create_info_gathering_prompt,
+        estimate_response_tokens,
+        max_batch_tokens=MAX_BATCH_TOKENS,
+        max_items=BATCH_SIZE,
+        prompt_multiplier=2,  # Items appear in both the search and the correction prompt
+        requests_per_batch=2,
     )
 
-    try:
-        client = setup_api()
 
-        output_fieldnames = ["Item Name", "Region", "Lore", "DescriptionLore", "ImageURL"]
+def process_and_save_batches_async(
+    batches: Iterable[List[Dict]],
+    writer: OrderedCsvWriter,
+    client: genai.Client,
+    num_batches: Optional[int] = None,
+    context_store: Optional[ContextStore] = None,
+):
+    """Process batches concurrently under the rate limits, saving them in input order"""
+    keys_by_batch: Dict[int, list] = {}
+    requests_per_minute, tokens_per_minute, max_in_flight = pool_limits(
+        client, MODEL_ID, REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE, MAX_IN_FLIGHT
+    )
+    limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+    # Searches, prefetched or not, take their share of the limiter themselves
+    gatherer = ContextGatherer(context_store, limiter)
+
+    def process_batch(batch: List[Dict]) -> List[Dict]:
+        try:
+            return process_changed(batch, lambda items: process_item_batch(client, items, len(items), gatherer))
+        except Exception as e:
+            print(f"!! Critical Error processing batch: {e}")
+            mark_batch_error(changed_rows(batch), e)
+            return batch
+
+    def save_in_order(index: int, processed_batch: List[Dict]):
+        writer.write_batch(index, processed_batch, keys_by_batch.pop(index))
+        print(f"✓ Batch {index+1} processed successfully")
+
+    asyncio.run(
+        run_batches(
+            track_batch_keys(gatherer.prefetch(client, batches), keys_by_batch),
+            process_batch,
+            save_in_order,
+            estimate_correction_tokens,
+            limiter=limiter,
+            max_in_flight=max_in_flight,
+            requests_per_batch=1,  # The correction; the search is taken by the gatherer
+            is_cached=lambda batch: is_cached(client, batch, context_store),
+            total=num_batches,
+        )
+    )
 
-        client = setup_api()
 
-        output_fieldnames = ["Item Name", "Region", "Lore", "DescriptionLore", "ImageURL"]
+def batch_prompts(
+    client: genai.Client, items: List[Dict], context_store: Optional[ContextStore] = None
+) -> List[str]:
+    """The prompts a batch would send: a search for items without stored context, then the correction"""
+    if is_cached(client, items, context_store):
+        return []
+    items = changed_rows(items)
+    stored = context_store.get_many(items, count_hits=False) if context_store else {}
+    missing = [item for item in items if context_key(item) not in stored]
+    # Context that is still to be searched is stood in for by text of the expected length
+    contexts = [
+        stored.get(context_key(item))
+        or f"## {item.get(INPUT_NAME_COLUMN)}\n" + "." * (CONTEXT_TOKENS_PER_ITEM * CHARS_PER_TOKEN)
+        for item in items
+    ]
+    prompts = [create_info_gathering_prompt(missing)] if missing else []
+    return prompts + [create_correction_prompt(items, join_contexts(contexts))]
+
+
+def batch_requests(
+    client: genai.Client, items: List[Dict], context_store: Optional[ContextStore] = None
+) -> List[JobRequest]:
+    """
+    The next request a batch needs, for a bulk job file.
+
+    The correction prompt embeds the gathered context, so it can only be exported once
+    every item's context is in the context store; until then the batch exports the search
+    for the items without one, and ingesting its results stores their context.
+    """
+    if is_cached(client, items, context_store):
+        return []
+    items = changed_rows(items)
+    stored = stored_context(context_store, items)
+    if stored is not None:
+        return [(create_correction_prompt(items, stored), CORRECTION_CONFIG, items)]
+    contexts = context_store.get_many(items, count_hits=False) if context_store else {}
+    missing = [item for item in items if context_key(item) not in contexts]
+    return [(create_info_gathering_prompt(missing), INFO_GATHERING_CONFIG, missing)]
+
+
+def ingest_searches(
+    batches: Iterable[List[Dict]],
+    client: genai.Client,
+    results: JobResults,
+    context_store: Optional[ContextStore] = None,
+) -> int:
+    """
+    First pass of an --ingest-results run: answer every batch's search from the results,
+    storing its context, and count the batches whose correction the results do not hold
+    yet (they have to be exported and run before the output can be written).
+    """
+    gatherer = ContextGatherer(context_store)
+    waiting = 0
+    for index, batch in enumerate(batches):
+        items = changed_rows(batch)
+        if not items:
+            continue
+        with batch_context(index, len(items), "lore"):
+            context = gatherer.gather(client, items)
+        if not results.answers(MODEL_ID, create_correction_prompt(items, context), CORRECTION_CONFIG):
+            waiting += 1
+    return waiting
+
+
+def report_plan(
+    batches: Iterable[List[Dict]],
+    client: genai.Client,
+    metrics_jsonl: Optional[str],
+    context_store: Optional[ContextStore] = None,
+):
+    """Estimate requests, tokens and wall time of a run over `batches` without calling the API"""
+    requests_per_minute, tokens_per_minute, max_in_flight = pool_limits(
+        client, MODEL_ID, REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE, MAX_IN_FLIGHT
+    )
+    report_dry_run(
+        batches,
+        lambda batch: batch_prompts(client, batch, context_store),
+        lambda batch: sum(estimate_response_tokens(item) for item in changed_rows(batch)),
+        estimate_batch_tokens,
+        recorded_latency(metrics_jsonl, "lore"),
+        requests_per_minute,
+        tokens_per_minute,
+        max_in_flight,
+        execution_mode=EXECUTION_MODE,
+        sleep_time=SLEEP_TIME,
+        requests_per_batch=2,  # What the async mode takes per batch: the search and the correction
+        label="Plan",
+    )
 
-        all_items = []
-        detected_headers = []
-        with open(input_csv_file, "r", encoding="utf-8-sig") as infile:
-            reader = csv.DictReader(infile, delimiter=";")
 
-            detected_headers = reader.fieldnames
-            if not detected_headers:
-                print(f"Warning: No headers found in '{input_csv_file}'.")
-                return
+def parse_args(argv: Optional[List[str]] = None):
+    parser = stage_parser(
+        "Correct item lore and regions with Gemini",
+        METRICS_PATH,
+        export_jobs_help="Write every request to this bulk job file instead of calling the API "
+        "(searches first; corrections once their context is stored)",
+    )
+    return parser.parse_args(argv)
 
-            print(f"Detected headers: {detected_headers}")
-
-            header_map = {header.strip().lower(): header for header in detected_headers}
-
-            required_cols_for_processing = [
-                INPUT_LORE_COLUMN,
-                INPUT_REGION_COLUMN,
-                INPUT_NAME_COLUMN,
-                INPUT_DESCRIPTION_COLUMN,
-            ]
-            required_cols_for_output_check = REQUIRED_INPUT_COLUMNS_FOR_OUTPUT
-
-            missing_cols = []
-            all_required_cols = set(required_cols_for_processing + required_cols_for_output_check)
-
-            for col in all_required_cols:
-                col_normalized = col.strip().lower()
-                if col_normalized not in header_map:
-                    missing_cols.append(col)
-
-            if missing_cols:
-                missing_cols_original_case = []
-                detected_lower_to_original = {h.strip().lower(): h for h in detected_headers}
-                for col in missing_cols:
-                    col_lower = col.strip().lower()
-                    if col_lower in detected_lower_to_original:
-                        missing_cols_original_case.append(detected_lower_to_original[col_lower])
-                    else:
-                        missing_cols_original_case.append(col)
-
-                raise ValueError(
-                    f"Error: Required columns {list(set(missing_cols_original_case))} not found in '{input_csv_file}'. "
-                    f"These columns are needed either for processing or for the final output header. "
-                    f"Detected headers are: {detected_headers}."
-                )
 
-            all_items = list(reader)
+def main(argv: Optional[List[str]] = None):
+    """Main function to process items and correct lore/regions"""
+    args = parse_args(argv)
+    input_csv_file, output_csv_file = ask_paths(args, DEFAULT_INPUT_CSV, DEFAULT_OUTPUT_CSV)
 
-        if not all_items:
-            print("Input file is empty. Exiting.")
+    context_store = None
+    # A --plan or --export-jobs run writes no metrics and only reads the cache, context
+    # store and journal
+    run = StageRun(args, "lore")
+    try:
+        client = run.open_client(
+            setup_api, REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE, CACHE_PATH if USE_RESPONSE_CACHE else None
+        )
+        if USE_CONTEXT_STORE and (os.path.exists(CONTEXT_STORE_PATH) or not run.offline):
+            context_store = ContextStore(CONTEXT_STORE_PATH)
+
+        output_fieldnames = ["Item Name", "Region", "Lore", "DescriptionLore", "ImageURL"]
+
+        detected_headers = read_csv_header(input_csv_file)
+        if not detected_headers:
+            print(f"Warning: No headers found in '{input_csv_file}'.")
             return
 
-        print(f"Found {len(all_items)} items to process from '{input_csv_file}'")
+        print(f"Detected headers: {detected_headers}")
+
+        # Resolved once for the whole file; rows are streamed from disk later as records of this schema
+        schema = ItemSchema(detected_headers)
+
+        required_cols_for_processing = [
+            INPUT_LORE_COLUMN,
+            INPUT_REGION_COLUMN,
+            INPUT_NAME_COLUMN,
+            INPUT_DESCRIPTION_COLUMN,
+        ]
+        required_cols_for_output_check = REQUIRED_INPUT_COLUMNS_FOR_OUTPUT
+
+        all_required_cols = dict.fromkeys(required_cols_for_processing + required_cols_for_output_check)
+        missing_cols = [col for col in all_required_cols if schema.find(col) is None]
 
+        if missing_cols:
+            raise ValueError(
+                f"Error: Required columns {missing_cols} not found in '{input_csv_file}'. "
+                f"These columns are needed either for processing or for the final output header. "
+                f"Detected headers are: {detected_headers}."
+            )
+
+        # An ingest only touches the journal and output once it is known to have every correction
         try:
-            with open(output_csv_file, "w", encoding="utf-8", newline="") as outfile:
-                pass
+            journal, resumed = prepare_journal(
+                output_csv_file,
+                args.resume,
+                dry_run=run.offline or bool(args.ingest_results),
+                data_file=temp_path_for(output_csv_file),
+            )
         except IOError as e:
             print(f"Error initializing output file {output_csv_file}: {e}")
             return
 
-        process_and_save_batches(all_items, output_fieldnames, output_csv_file, client, BATCH_SIZE)
+        delta = None
+        if args.delta_from:
+            delta = DeltaIndex.load(*args.delta_from, DELTA_COLUMNS, needs_rerun)
+
+        def pending_rows():
+            # Rows are streamed from disk on every pass; nothing holds the whole catalog
+            rows = iter_item_records(input_csv_file, schema=schema)
+            if args.shard:
+                rows = args.shard.select(rows)
+            return journal.pending(rows) if resumed else rows
+
+        # A first pass only plans, so the batch/request report is available before any call
+        dedupe_columns = DELTA_COLUMNS if DEDUPE_PAYLOADS else None
+        plan, num_batches, carried, duplicates = summarize_run(
+            pending_rows(), plan_item_batches, delta, dedupe_columns
+        )
+        if plan.item_count == 0 and carried + duplicates == 0:
+            if resumed:
+                print(f"All items are already recorded as done in '{journal.path}'.")
+            else:
+                print("Input file is empty. Exiting.")
+            return
+
+        if resumed:
+            print(f"{plan.item_count + carried + duplicates} items left to process.")
+        else:
+            print(f"Found {plan.item_count + carried + duplicates} items to process from '{input_csv_file}'")
+        report_run(plan, carried, duplicates, args.shard, delta, pending_rows, plan_item_batches)
+        if args.plan:
+            report_plan(
+                run_batches_for(pending_rows(), plan_item_batches, delta, dedupe_columns=dedupe_columns),
+                client,
+                args.metrics_jsonl,
+                context_store,
+            )
+            return
+        if args.export_jobs:
+            searches = []
+
+            def requests_for(batch: List[Dict]) -> List[JobRequest]:
+                requests = batch_requests(client, batch, context_store)
+                searches.extend(request for request in requests if request[1] is INFO_GATHERING_CONFIG)
+                return requests
+
+            export_jobs(
+                args.export_jobs,
+                run_batches_for(pending_rows(), plan_item_batches, delta, dedupe_columns=dedupe_columns),
+                requests_for,
+                "lore",
+                MODEL_ID,
+            ).print_report(args.export_jobs)
+            if searches:
+                print(
+                    f"{len(searches)} of these are searches: ingest their results, then export again "
+                    f"for the corrections of those batches."
+                )
+            return
+
+        if args.ingest_results:
+            waiting = ingest_searches(
+                run_batches_for(pending_rows(), plan_item_batches, delta, dedupe_columns=dedupe_columns),
+                client,
+                run.job_results.results,
+                context_store,
+            )
+            if waiting:
+                stored = "; their searches are stored" if context_store else " (no context store to keep searches in)"
+                print(
+                    f"{waiting} batches have no correction in the results yet{stored}. Export again for "
+                    f"their corrections and ingest those results; '{output_csv_file}' was not written."
+                )
+                return
+            try:
+                journal, resumed = prepare_journal(
+                    output_csv_file, args.resume, data_file=temp_path_for(output_csv_file)
+                )
+            except IOError as e:
+                print(f"Error initializing output file {output_csv_file}: {e}")
+                return
+
+        process = (
+            process_and_save_batches_async
+            if EXECUTION_MODE == "async"
+            else process_and_save_batches
+        )
+        with open_output(output_csv_file, output_fieldnames, journal, append=resumed) as writer:
+            process(
+                run_batches_for(pending_rows(), plan_item_batches, delta, dedupe_columns=dedupe_columns),
+                writer,
+                client,
+                num_batches=num_batches,
+                context_store=context_store,
+            )
 
         print(f"\nProcessing complete. Results saved to '{output_csv_file}'")
 
@@ -419,7 +819,11 @@ def main():
 
         print(f"An unexpected error occurred: {e}")
         traceback.print_exc()
-
+    finally:
+        if context_store:
+            context_store.print_stats()
+            context_store.close()
+        run.close()
 
 if __name__ == "__main__":
     main()
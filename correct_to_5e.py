@@ -1,10 +1,31 @@
-import csv
+import asyncio
 import os
 import time
-import json  # Added json import
-from typing import List, Dict, Optional
+from typing import Iterable, List, Dict, Optional
 from pydantic import BaseModel, Field
 from google import genai
+from batch_executor import RateLimiter, batch_context, estimate_tokens, run_batches
+from response_cache import batch_is_cached, response_text
+from response_parsing import parser_for
+from name_matching import reconcile
+from checkpoint import CheckpointJournal, batch_keys, prepare_journal, track_batch_keys
+from output_writer import OrderedCsvWriter, temp_path_for
+from batch_planner import BatchPlan, plan_batches, report_dry_run
+from bulk_jobs import JobRequest, export_jobs
+from csv_stream import iter_item_records, read_csv_header
+from item_record import ItemSchema
+from delta import (
+    DeltaIndex,
+    changed_rows,
+    process_changed,
+    resolve_duplicates,
+    run_batches_for,
+    summarize_run,
+)
+from telemetry import recorded_latency
+from retry_policy import process_with_recovery
+from key_pool import pool_limits
+from stage_cli import StageRun, ask_paths, report_run, stage_parser
 
 # --- Configuration ---
 # Choose the column containing the description you want to correct
@@ -13,8 +34,22 @@ INPUT_DESCRIPTION_COLUMN = "descriptionlore"
 OUTPUT_DESCRIPTION_COLUMN = "Description5e"
 DEFAULT_INPUT_CSV = "items.csv"  # Or 'items_osr.csv' if you want to correct OSRPowers
 DEFAULT_OUTPUT_CSV = "items_5e.csv"
-BATCH_SIZE = 3  # Number of items to process per API call
+BATCH_SIZE = 10  # Maximum number of items per API call (batches are packed by token estimate)
+MAX_BATCH_TOKENS = 8_000  # Estimated prompt + response tokens per API call
+MODEL_ID = "gemini-2.0-flash"
 SLEEP_TIME = 10  # Seconds to wait between batches
+EXECUTION_MODE = "async"  # "async" keeps several batches in flight, "sequential" sleeps between batches
+MAX_IN_FLIGHT = 4  # Batches in flight at once in async mode
+REQUESTS_PER_MINUTE = 15
+TOKENS_PER_MINUTE = 1_000_000
+RESPONSE_TOKENS_PER_ITEM = 270  # 5e descriptions are capped at 1000 characters
+USE_RESPONSE_CACHE = True  # Re-runs over unchanged items are answered from disk
+CACHE_PATH = "gemini_cache.sqlite"
+METRICS_PATH = "gemini_metrics.jsonl"  # One JSON record per API call
+# Columns that feed the prompt; a row is re-sent in delta mode only when one of them changed
+DELTA_COLUMNS = ["Item Name", "Region", "Lore", INPUT_DESCRIPTION_COLUMN]
+DEDUPE_PAYLOADS = True  # Send each distinct prompt payload once and copy its result to repeats
+ERROR_OUTPUTS = ("Error", "No description generated")  # Prefixes of descriptions that are retried
 
 # --- Pydantic Models ---
 
@@ -36,6 +71,13 @@ class Batch5eResponse(BaseModel):
     )
 
 
+GENERATION_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": Batch5eResponse,
+}
+RESPONSE_PARSER = parser_for(Batch5eResponse)
+
+
 # --- Functions ---
 
 
@@ -48,7 +90,7 @@ def setup_api():
     return genai.Client(api_key=api_key)
 
 
-def process_item_batch(client, items: List[Dict], batch_size: int = BATCH_SIZE) -> List[Dict]:
+def request_item_batch(client, items: List[Dict], batch_size: int = BATCH_SIZE) -> List[Dict]:
     """Process a batch of items to generate corrected D&D 5e descriptions"""
     batches = [items[i : i + batch_size] for i in range(0, len(items), batch_size)]
     results = []
@@ -60,48 +102,34 @@ def process_item_batch(client, items: List[Dict], batch_size: int = BATCH_SIZE)
 
         try:
             response = client.models.generate_content(
-                model="gemini-2.0-flash",
+                model=MODEL_ID,
                 contents=batch_prompt,
-                config={
-                    "response_mime_type": "application/json",
-                    "response_schema": Batch5eResponse,
-                },
+                config=GENERATION_CONFIG,
             )
 
-            batch_results = None
-
-            if response.candidates and response.candidates[0].content.parts:
-                try:
-                    json_text = response.candidates[0].content.parts[0].text
-                    if json_text:
-                        parsed_data = json.loads(json_text)
-                        batch_results = Batch5eResponse.model_validate(parsed_data)
-                    else:
-                        print(f"Warning: Received empty text content for batch {i+1}.")
-                except json.JSONDecodeError as json_err:
-                    print(f"Error: Failed to decode JSON response for batch {i+1}: {json_err}")
-                    print(f"Received text: {response.candidates[0].content.parts[0].text}")
-                except Exception as parse_err:
-                    print(
-                        f"Error: Failed to parse or validate response for batch {i+1}: {parse_err}"
-                    )
-                    print(f"Received text: {response.candidates[0].content.parts[0].text}")
+            batch_results = RESPONSE_PARSER.parse(response_text(response))
+            if batch_results.outcome == "empty":
+                print(f"Warning: Received empty text content for batch {i+1}.")
+            elif batch_results.outcome == "salvaged":
+                print(
+                    f"Warning: Response for batch {i+1} was cut off or malformed; "
+                    f"kept {len(batch_results.items)} complete items"
+                )
+            elif not batch_results.complete:
+                print(f"Error: Failed to parse or validate response for batch {i+1} ({batch_results.outcome})")
 
-            if batch_results:
-                results_map = {
-                    res.item_name.strip().lower(): res.corrected_description_5e
-                    for res in batch_results.items
-                }
+            if batch_results.items:
+                matched = reconcile([item.get("Item Name", "Unknown") for item in batch], batch_results.items)
+                matched.print_report(f"batch {i+1}")
 
-                for item in batch:
+                for j, item in enumerate(batch):
                     item_name_original = item.get("Item Name", "Unknown")
-                    item_name_key = item_name_original.strip().lower()
 
-                    if item_name_key in results_map:
-                        item[OUTPUT_DESCRIPTION_COLUMN] = results_map[item_name_key]
+                    if j in matched.matches:
+                        item[OUTPUT_DESCRIPTION_COLUMN] = matched.matches[j].corrected_description_5e
                     else:
                         print(
-                            f"Warning: No corrected description found for '{item_name_original}' (key: '{item_name_key}') in batch {i+1}. Available keys: {list(results_map.keys())}"
+                            f"Warning: No corrected description found for '{item_name_original}' in batch {i+1}. Returned names: {[res.item_name for res in batch_results.items]}"
                         )
                         item[OUTPUT_DESCRIPTION_COLUMN] = "No description generated"
                     results.append(item)
@@ -133,13 +161,29 @@ def process_item_batch(client, items: List[Dict], batch_size: int = BATCH_SIZE)
                 item[OUTPUT_DESCRIPTION_COLUMN] = f"Error: {e}"
                 results.append(item)
 
-        if i < len(batches) - 1:
+        if i < len(batches) - 1 and not is_cached(client, batches[i + 1]):
             print(f"Waiting {SLEEP_TIME} seconds before next batch...")
             time.sleep(SLEEP_TIME)
 
     return results
 
 
+def mark_batch_error(items: List[Dict], e: Exception):
+    for item in items:
+        item[OUTPUT_DESCRIPTION_COLUMN] = f"Error: {str(e)}"
+
+
+def process_item_batch(client, items: List[Dict], batch_size: int = BATCH_SIZE) -> List[Dict]:
+    """Generate 5e descriptions, re-sending failed items until only those that cannot be rewritten are errors"""
+    return process_with_recovery(
+        items,
+        lambda part: request_item_batch(client, part, min(batch_size, len(part))),
+        needs_rerun,
+        mark_batch_error,
+        getattr(client, "recovery", None),
+    )
+
+
 def create_batch_5e_prompt(items: List[Dict]) -> str:
     """Create a prompt for correcting descriptions to D&D 5e style"""
     prompt = f"""Rewrite the following item's descriptions.
@@ -166,102 +210,263 @@ def create_batch_5e_prompt(items: List[Dict]) -> str:
     return prompt
 
 
-def save_batch(items: List[Dict], fieldnames: List[str], output_file: str, is_first_batch: bool):
-    """Save a batch of items to the output CSV file"""
-    mode = "w" if is_first_batch else "a"
-    with open(output_file, mode, encoding="utf-8", newline="") as outfile:
-        writer = csv.DictWriter(
-            outfile, fieldnames=fieldnames, extrasaction="ignore", delimiter=";"
-        )
-        if is_first_batch:
-            writer.writeheader()
-        writer.writerows(items)
+def is_cached(client, items: List[Dict]) -> bool:
+    """True when the request for this batch can be answered from the response cache"""
+    items = changed_rows(items)
+    if not items:
+        return True  # Every row is carried over from a previous run
+    return batch_is_cached(client, MODEL_ID, create_batch_5e_prompt(items), GENERATION_CONFIG)
+
+
+def open_output(
+    output_file: str,
+    fieldnames: List[str],
+    journal: Optional[CheckpointJournal] = None,
+    append: bool = False,
+) -> OrderedCsvWriter:
+    """The output CSV of a run, published when the run completes"""
+    # Duplicates are resolved as their batch is written, after the batches holding the originals
+    return OrderedCsvWriter(output_file, fieldnames, journal, append, before_write=resolve_duplicates)
 
 
 def process_and_save_batches(
-    items: List[Dict], fieldnames: List[str], output_file: str, client, batch_size: int = BATCH_SIZE
+    batches: Iterable[List[Dict]],
+    writer: OrderedCsvWriter,
+    client,
+    num_batches: Optional[int] = None,
 ):
-    """Process items in batches and save each batch immediately"""
-    batches = [items[i : i + batch_size] for i in range(0, len(items), batch_size)]
-
+    """Process planned batches (a list or a stream) and save each batch immediately"""
     for i, batch in enumerate(batches):
-        print(f"\nProcessing batch {i+1}/{len(batches)}...")
+        # Wait before each batch (except the first or one served from the cache)
+        if i > 0 and not is_cached(client, batch):
+            print(f"Waiting {SLEEP_TIME} seconds before next batch...")
+            time.sleep(SLEEP_TIME)
+
+        print(f"\nProcessing batch {i+1}/{num_batches or '?'}...")
+        keys = batch_keys(batch)
 
         try:
             # Process the batch
-            processed_batch = process_item_batch(client, batch, batch_size=len(batch))
-
-            # Save this batch immediately
-            is_first_batch = i == 0
-            save_batch(processed_batch, fieldnames, output_file, is_first_batch)
-            print(f"✓ Batch {i+1} saved successfully")
+            with batch_context(i, len(batch), "5e"):
+                processed_batch = process_changed(
+                    batch, lambda items: process_item_batch(client, items, batch_size=len(items))
+                )
 
-            # Wait before next batch (except for the last one)
-            if i < len(batches) - 1:
-                print(f"Waiting {SLEEP_TIME} seconds before next batch...")
-                time.sleep(SLEEP_TIME)
+            # The writer marks the batch done in the journal once its rows are on disk
+            writer.write_batch(i, processed_batch, keys)
+            print(f"✓ Batch {i+1} processed successfully")
 
         except Exception as e:
             print(f"Error processing/saving batch {i+1}: {e}")
             # Add error message to items and save them anyway
-            for item in batch:
-                item[OUTPUT_DESCRIPTION_COLUMN] = f"Error: {str(e)}"
-            save_batch(batch, fieldnames, output_file, i == 0)
+            mark_batch_error(changed_rows(batch), e)
+            writer.write_batch(i, batch, keys)
             print(f"Saved batch {i+1} with error messages")
 
 
-def main():
-    """Main function to process items and correct descriptions"""
-    input_csv_file = (
-        input(f"Enter input CSV filename (default: {DEFAULT_INPUT_CSV}): ") or DEFAULT_INPUT_CSV
+def needs_rerun(output_row: Dict) -> bool:
+    """A previous output row without a usable description is not carried over by a delta run"""
+    return (output_row.get(OUTPUT_DESCRIPTION_COLUMN) or "Error").startswith(ERROR_OUTPUTS)
+
+
+def estimate_response_tokens(item: Dict) -> int:
+    """A rewrite is about as long as the description it replaces, up to the schema's max_length"""
+    input_col_normalized = INPUT_DESCRIPTION_COLUMN.strip().lower()
+    description = next(
+        (value for key, value in item.items() if key and key.strip().lower() == input_col_normalized),
+        None,
     )
-    output_csv_file = (
-        input(f"Enter output CSV filename (default: {DEFAULT_OUTPUT_CSV}): ") or DEFAULT_OUTPUT_CSV
+    if not description:
+        return RESPONSE_TOKENS_PER_ITEM
+    return min(RESPONSE_TOKENS_PER_ITEM, estimate_tokens(description))
+
+
+def estimate_batch_tokens(items: List[Dict]) -> int:
+    """Estimate the prompt plus response tokens for one batch"""
+    items = changed_rows(items)
+    return estimate_tokens(create_batch_5e_prompt(items)) + sum(
+        estimate_response_tokens(item) for item in items
     )
 
-    try:
-        client = setup_api()
 
-        # Read input and validate headers
-        with open(input_csv_file, "r", encoding="utf-8-sig") as infile:
-            reader = csv.DictReader(infile, delimiter=";")
+def plan_item_batches(items: List[Dict]) -> BatchPlan:
+    """Pack items into requests up to MAX_BATCH_TOKENS (and at most BATCH_SIZE items)"""
+    return plan_batches(
+        items,
+        create_batch_5e_prompt,
+        estimate_response_tokens,
+        max_batch_tokens=MAX_BATCH_TOKENS,
+        max_items=BATCH_SIZE,
+    )
+
 
-            detected_headers = reader.fieldnames
-            print(f"Detected headers: {detected_headers}")
+def process_and_save_batches_async(
+    batches: Iterable[List[Dict]],
+    writer: OrderedCsvWriter,
+    client,
+    num_batches: Optional[int] = None,
+):
+    """Process batches concurrently under the rate limits, saving them in input order"""
+    keys_by_batch: Dict[int, list] = {}
+    requests_per_minute, tokens_per_minute, max_in_flight = pool_limits(
+        client, MODEL_ID, REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE, MAX_IN_FLIGHT
+    )
+    limiter = RateLimiter(requests_per_minute, tokens_per_minute)
 
-            cleaned_headers = (
-                [header.strip().lower() for header in detected_headers] if detected_headers else []
+    def process_batch(batch: List[Dict]) -> List[Dict]:
+        try:
+            return process_changed(
+                batch, lambda items: process_item_batch(client, items, batch_size=len(items))
             )
+        except Exception as e:
+            print(f"Error processing batch: {e}")
+            mark_batch_error(changed_rows(batch), e)
+            return batch
+
+    def save_in_order(index: int, processed_batch: List[Dict]):
+        writer.write_batch(index, processed_batch, keys_by_batch.pop(index))
+        print(f"✓ Batch {index+1} processed successfully")
+
+    asyncio.run(
+        run_batches(
+            track_batch_keys(batches, keys_by_batch),
+            process_batch,
+            save_in_order,
+            estimate_batch_tokens,
+            limiter=limiter,
+            max_in_flight=max_in_flight,
+            is_cached=lambda batch: is_cached(client, batch),
+            total=num_batches,
+        )
+    )
 
-            input_col_normalized = INPUT_DESCRIPTION_COLUMN.strip().lower()
-            if input_col_normalized not in cleaned_headers:
-                raise ValueError(
-                    f"Error: Column '{INPUT_DESCRIPTION_COLUMN}' (normalized to '{input_col_normalized}') "
-                    f"not found in the cleaned headers of '{input_csv_file}'. "
-                    f"Detected cleaned headers are: {cleaned_headers}."
-                )
 
-            all_items = list(reader)
+def batch_prompts(client, items: List[Dict]) -> List[str]:
+    """The prompts a batch would send; none when the cache or a previous run answers it"""
+    if is_cached(client, items):
+        return []
+    return [create_batch_5e_prompt(changed_rows(items))]
 
-        if not all_items:
-            print("Input file is empty. Exiting.")
-            return
 
-        print(f"Found {len(all_items)} items to process from '{input_csv_file}'")
+def batch_requests(client, items: List[Dict]) -> List[JobRequest]:
+    """The request a batch needs, for a bulk job file; none when the cache or a previous run answers it"""
+    if is_cached(client, items):
+        return []
+    items = changed_rows(items)
+    return [(create_batch_5e_prompt(items), GENERATION_CONFIG, items)]
+
 
-        # Prepare output fieldnames
-        fieldnames = (
-            detected_headers + [OUTPUT_DESCRIPTION_COLUMN]
-            if OUTPUT_DESCRIPTION_COLUMN not in detected_headers
-            else detected_headers
+def report_plan(batches: Iterable[List[Dict]], client, metrics_jsonl: Optional[str]):
+    """Estimate requests, tokens and wall time of a run over `batches` without calling the API"""
+    requests_per_minute, tokens_per_minute, max_in_flight = pool_limits(
+        client, MODEL_ID, REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE, MAX_IN_FLIGHT
+    )
+    report_dry_run(
+        batches,
+        lambda batch: batch_prompts(client, batch),
+        lambda batch: sum(estimate_response_tokens(item) for item in changed_rows(batch)),
+        estimate_batch_tokens,
+        recorded_latency(metrics_jsonl, "5e"),
+        requests_per_minute,
+        tokens_per_minute,
+        max_in_flight,
+        execution_mode=EXECUTION_MODE,
+        sleep_time=SLEEP_TIME,
+        label="Plan",
+    )
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = stage_parser("Rewrite item descriptions in D&D 5e style", METRICS_PATH)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    """Main function to process items and correct descriptions"""
+    args = parse_args(argv)
+    input_csv_file, output_csv_file = ask_paths(args, DEFAULT_INPUT_CSV, DEFAULT_OUTPUT_CSV)
+
+    # A --plan or --export-jobs run writes no metrics and only reads the cache and journal
+    run = StageRun(args, "5e")
+    try:
+        client = run.open_client(
+            setup_api, REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE, CACHE_PATH if USE_RESPONSE_CACHE else None
         )
 
-        # Create empty output file (will be appended to by process_and_save_batches)
-        with open(output_csv_file, "w", encoding="utf-8", newline="") as outfile:
-            pass  # Just create/clear the file
+        # Read and validate headers once; rows are streamed from disk later as records of this schema
+        detected_headers = read_csv_header(input_csv_file)
+        print(f"Detected headers: {detected_headers}")
+        schema = ItemSchema(detected_headers + [OUTPUT_DESCRIPTION_COLUMN])
+
+        if schema.find(INPUT_DESCRIPTION_COLUMN) is None:
+            raise ValueError(
+                f"Error: Column '{INPUT_DESCRIPTION_COLUMN}' (compared case-insensitively) "
+                f"not found in the headers of '{input_csv_file}'. "
+                f"Detected headers are: {detected_headers}."
+            )
+
+        # The output keeps the input columns and adds the generated one
+        fieldnames = list(schema.fields)
+
+        # Create/clear the run's temporary output, or roll it back to the last checkpoint on resume
+        journal, resumed = prepare_journal(
+            output_csv_file, args.resume, dry_run=run.offline, data_file=temp_path_for(output_csv_file)
+        )
+
+        delta = None
+        if args.delta_from:
+            delta = DeltaIndex.load(*args.delta_from, DELTA_COLUMNS, needs_rerun)
+
+        def pending_rows():
+            rows = iter_item_records(input_csv_file, schema=schema)
+            if args.shard:
+                rows = args.shard.select(rows)
+            return journal.pending(rows) if resumed else rows
+
+        # Plan in a first streaming pass so the report is printed before any API call
+        dedupe_columns = DELTA_COLUMNS if DEDUPE_PAYLOADS else None
+        plan, num_batches, carried, duplicates = summarize_run(
+            pending_rows(), plan_item_batches, delta, dedupe_columns
+        )
+        if plan.item_count == 0 and carried + duplicates == 0:
+            if resumed:
+                print(f"All items are already recorded as done in '{journal.path}'.")
+            else:
+                print("Input file is empty. Exiting.")
+            return
+
+        print(f"Found {plan.item_count + carried + duplicates} items to process from '{input_csv_file}'")
+        report_run(plan, carried, duplicates, args.shard, delta, pending_rows, plan_item_batches)
+        if args.plan:
+            report_plan(
+                run_batches_for(pending_rows(), plan_item_batches, delta, dedupe_columns=dedupe_columns),
+                client,
+                args.metrics_jsonl,
+            )
+            return
+        if args.export_jobs:
+            export_jobs(
+                args.export_jobs,
+                run_batches_for(pending_rows(), plan_item_batches, delta, dedupe_columns=dedupe_columns),
+                lambda batch: batch_requests(client, batch),
+                "5e",
+                MODEL_ID,
+            ).print_report(args.export_jobs)
+            return
 
         # Process and save items batch by batch
-        process_and_save_batches(all_items, fieldnames, output_csv_file, client)
+        process = (
+            process_and_save_batches_async
+            if EXECUTION_MODE == "async"
+            else process_and_save_batches
+        )
+        with open_output(output_csv_file, fieldnames, journal, append=resumed) as writer:
+            process(
+                run_batches_for(pending_rows(), plan_item_batches, delta, dedupe_columns=dedupe_columns),
+                writer,
+                client,
+                num_batches=num_batches,
+            )
 
         print(f"\nProcessing complete. All results saved to '{output_csv_file}'")
 
@@ -271,6 +476,8 @@ def main():
         print(ve)
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
+    finally:
+        run.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,55 @@
+import csv
+from typing import Dict, Iterator, List, Optional
+
+from item_record import ItemRecord, ItemSchema
+
+# --- Functions ---
+
+
+def read_csv_header(path: str, delimiter: str = ";", encoding: str = "utf-8-sig") -> List[str]:
+    """Read only the header row of a CSV file"""
+    with open(path, "r", encoding=encoding, newline="") as infile:
+        return list(csv.DictReader(infile, delimiter=delimiter).fieldnames or [])
+
+
+def iter_csv_rows(path: str, delimiter: str = ";", encoding: str = "utf-8-sig") -> Iterator[Dict]:
+    """Yield rows one at a time; the file stays open only while the generator is consumed"""
+    with open(path, "r", encoding=encoding, newline="") as infile:
+        yield from csv.DictReader(infile, delimiter=delimiter)
+
+
+def iter_item_records(
+    path: str, delimiter: str = ";", encoding: str = "utf-8-sig", schema: Optional[ItemSchema] = None
+) -> Iterator[ItemRecord]:
+    """
+    Like iter_csv_rows, but yield compact records sharing one schema instead of dicts.
+
+    Records hold the same keys and values as the DictReader rows would: a short row's
+    missing fields are None, a long row's surplus fields are a list under the key None.
+    """
+    with open(path, "r", encoding=encoding, newline="") as infile:
+        reader = csv.reader(infile, delimiter=delimiter)
+        headers = next(reader, None)
+        if headers is None:
+            return
+        schema = schema or ItemSchema(headers)  # A given schema starts with this file's headers
+        columns = None
+        if len(set(headers)) < len(headers):
+            # Repeated headers are one column holding the last one's value, as in DictReader
+            last = {header: i for i, header in enumerate(headers)}
+            columns = [last[header] for header in dict.fromkeys(headers)]
+        width = len(headers)
+        for values in reader:
+            if not values:
+                continue  # DictReader skips blank lines too
+            surplus = values[width:] if len(values) > width else None
+            if len(values) < width:
+                values = values + [None] * (width - len(values))
+            if columns:
+                values = [values[i] for i in columns]
+            elif surplus:
+                values = values[:width]
+            record = schema.record(values)
+            if surplus:
+                record[None] = surplus
+            yield record
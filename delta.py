@@ -0,0 +1,245 @@
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from batch_executor import current_batch
+from batch_planner import BatchPlan, iter_planned_batches
+from csv_stream import iter_csv_rows
+
+# --- Configuration ---
+DEDUPE_MAX_PAYLOADS = 100_000  # Distinct payloads remembered per run; the oldest are forgotten first
+
+# --- Functions ---
+
+
+class CarriedRow(dict):
+    """A previous output row reused as-is; `source_row` is the current input row it stands for"""
+
+    def __init__(self, output_row: Dict, source_row: Dict):
+        super().__init__(output_row)
+        self.source_row = source_row
+
+
+class DuplicateRow(CarriedRow):
+    """A row whose prompt payload repeats an earlier row of this run; it reuses that row's result"""
+
+    def __init__(self, source_row: Dict, original: Dict, columns: List[str]):
+        super().__init__(source_row, source_row)
+        self.original = original
+        self.columns = columns
+
+    def resolve(self) -> "DuplicateRow":
+        """Copy the original's result: columns it gained, and prompt columns the script rewrote"""
+        prompt_columns = {col.strip().lower() for col in self.columns}
+        for key, value in self.original.items():
+            if key not in self.source_row:
+                self[key] = value
+            elif str(key).strip().lower() in prompt_columns and (
+                canonical_value(value) != canonical_value(self.source_row[key])
+            ):
+                self[key] = value
+        return self
+
+
+def canonical_value(value) -> str:
+    """A prompt value with case and runs of whitespace ignored"""
+    return " ".join(str(value or "").split()).casefold()
+
+
+def row_fingerprint(row: Dict, columns: List[str], canonical: bool = False) -> str:
+    """Hash of the columns that feed the prompt (header names compared case-insensitively)"""
+    normalized = {str(k).strip().lower(): v for k, v in row.items() if k is not None}
+    values = [normalized.get(col.strip().lower()) or "" for col in columns]
+    if canonical:
+        values = [canonical_value(value) for value in values]
+    return hashlib.sha256(json.dumps(values, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class DeltaIndex:
+    """Previous output rows keyed by the fingerprint of the input row that produced them"""
+
+    def __init__(self, columns: List[str]):
+        self.columns = columns
+        self.outputs: Dict[str, Dict] = {}
+
+    @classmethod
+    def load(
+        cls,
+        previous_input: str,
+        previous_output: str,
+        columns: List[str],
+        needs_rerun: Callable[[Dict], bool],
+        delimiter: str = ";",
+        encoding: str = "utf-8-sig",
+    ) -> "DeltaIndex":
+        """
+        Pair previous input and output rows by position (outputs are written in input order).
+
+        Output rows that recorded an error are left out, so those items are sent again. A
+        shorter previous output (an interrupted run) simply carries over fewer rows.
+        """
+        index = cls(columns)
+        inputs = iter_csv_rows(previous_input, delimiter=delimiter, encoding=encoding)
+        outputs = iter_csv_rows(previous_output, delimiter=delimiter, encoding=encoding)
+        for input_row, output_row in zip(inputs, outputs):
+            if not needs_rerun(output_row):
+                index.outputs.setdefault(row_fingerprint(input_row, columns), output_row)
+        print(f"Delta: {len(index.outputs)} reusable rows loaded from '{previous_output}'")
+        return index
+
+    def lookup(self, row: Dict) -> Optional[CarriedRow]:
+        """The previous output for an unchanged row, or None if the row needs the model"""
+        previous = self.outputs.get(row_fingerprint(row, self.columns))
+        return None if previous is None else CarriedRow(previous, row)
+
+
+class PayloadIndex:
+    """
+    First row of the current run for each distinct prompt payload.
+
+    Rows are compared by a canonical hash of the columns that feed the prompt, so the same
+    item repeated across merged catalogs (differing only in case, spacing or columns the
+    prompt does not use) is sent once. Only the most recent DEDUPE_MAX_PAYLOADS payloads
+    are remembered, which keeps memory bounded on very large inputs.
+    """
+
+    def __init__(self, columns: List[str], max_payloads: int = DEDUPE_MAX_PAYLOADS):
+        self.columns = columns
+        self.max_payloads = max_payloads
+        self.rows: "OrderedDict[str, Dict]" = OrderedDict()
+
+    def lookup(self, row: Dict) -> Optional[DuplicateRow]:
+        """A DuplicateRow when an earlier row has the same payload, otherwise None"""
+        key = row_fingerprint(row, self.columns, canonical=True)
+        original = self.rows.get(key)
+        if original is not None:
+            self.rows.move_to_end(key)
+            return DuplicateRow(row, original, self.columns)
+        self.rows[key] = row
+        if len(self.rows) > self.max_payloads:
+            self.rows.popitem(last=False)
+        return None
+
+
+def resolve_duplicates(batch: List[Dict]) -> List[Dict]:
+    """
+    Fill in the duplicate rows of a processed batch from their originals.
+
+    Call this when a batch is saved: batches are saved in input order, so the batch holding
+    each original (the same one or an earlier one) has been processed by then.
+    """
+    for row in batch:
+        if isinstance(row, DuplicateRow):
+            row.resolve()
+    return batch
+
+
+def changed_rows(batch: List[Dict]) -> List[Dict]:
+    """Rows of a batch that still need the model"""
+    return [row for row in batch if not isinstance(row, CarriedRow)]
+
+
+def process_changed(batch: List[Dict], process: Callable[[List[Dict]], List[Dict]]) -> List[Dict]:
+    """Run `process` on the changed rows only and merge the results back in input order"""
+    changed = changed_rows(batch)
+    if not changed:
+        return batch
+    batch_info = current_batch()
+    if batch_info is not None:
+        batch_info["items"] = len(changed)  # Telemetry counts only the rows actually sent
+    processed = iter(process(changed))
+    return [row if isinstance(row, CarriedRow) else next(processed) for row in batch]
+
+
+def iter_delta_batches(
+    rows: Iterable[Dict],
+    index: DeltaIndex,
+    plan: Callable[[List[Dict]], BatchPlan],
+    summary: Optional[BatchPlan] = None,
+    payloads: Optional[PayloadIndex] = None,
+) -> Iterator[List[Dict]]:
+    """
+    Plan batches over the new or changed rows only, keeping carried rows in their place.
+
+    Each carried row rides along in front of the next changed row's batch, so the output
+    stays in input order while requests are packed only with rows that need the model.
+    `index` may be None when only `payloads` (repeats within this run) are carried.
+    """
+    carried_before: Dict[int, List[CarriedRow]] = {}
+    trailing: List[CarriedRow] = []
+
+    def changed_stream() -> Iterator[Dict]:
+        nonlocal trailing
+        for row in rows:
+            previous = index.lookup(row) if index is not None else None
+            if previous is None and payloads is not None:
+                previous = payloads.lookup(row)
+            if previous is not None:
+                trailing.append(previous)
+                continue
+            if trailing:
+                carried_before[id(row)] = trailing
+                trailing = []
+            yield row
+
+    for batch in iter_planned_batches(changed_stream(), plan, summary=summary):
+        merged: List[Dict] = []
+        for row in batch:
+            merged.extend(carried_before.pop(id(row), ()))
+            merged.append(row)
+        yield merged
+    if trailing:
+        yield trailing
+
+
+def run_batches_for(
+    rows: Iterable[Dict],
+    plan: Callable[[List[Dict]], BatchPlan],
+    index: Optional[DeltaIndex] = None,
+    summary: Optional[BatchPlan] = None,
+    dedupe_columns: Optional[List[str]] = None,
+) -> Iterator[List[Dict]]:
+    """
+    Batches for a run; with a delta index only new or changed rows are packed for the model.
+
+    With `dedupe_columns`, a row whose payload in those columns repeats an earlier row is
+    not sent either; it becomes a DuplicateRow for resolve_duplicates() to fill in.
+    """
+    payloads = PayloadIndex(dedupe_columns) if dedupe_columns else None
+    if index is None and payloads is None:
+        return iter_planned_batches(rows, plan, summary=summary)
+    return iter_delta_batches(rows, index, plan, summary=summary, payloads=payloads)
+
+
+def summarize_run(
+    rows: Iterable[Dict],
+    plan: Callable[[List[Dict]], BatchPlan],
+    index: Optional[DeltaIndex] = None,
+    dedupe_columns: Optional[List[str]] = None,
+) -> Tuple[BatchPlan, int, int, int]:
+    """
+    Plan a run without calling the model.
+
+    Returns the plan, the batch count, the number of rows carried over from the previous
+    output and the number of duplicate rows that will reuse another row's result.
+    """
+    summary = BatchPlan()
+    batch_count = carried = duplicates = 0
+    for batch in run_batches_for(rows, plan, index, summary=summary, dedupe_columns=dedupe_columns):
+        batch_count += 1
+        for row in batch:
+            if isinstance(row, DuplicateRow):
+                duplicates += 1
+            elif isinstance(row, CarriedRow):
+                carried += 1
+    return summary, batch_count, carried, duplicates
+
+
+def report_duplicates(duplicates: int, plan: BatchPlan, baseline: BatchPlan):
+    """Print what deduplication saves against `baseline`, the plan of the same run without it"""
+    saved = baseline.request_count - plan.request_count
+    print(
+        f"Dedupe: {duplicates} duplicate items reuse another item's result; "
+        f"{saved} requests saved ({plan.request_count} instead of {baseline.request_count})"
+    )
@@ -3,6 +3,9 @@
 # Create .nojekyll file to prevent Jekyll processing
 touch .nojekyll
 
+# Validate base-items.csv and build the data bundle the page loads instead of parsing it
+python3 build_bundle.py || { echo "Building the data bundle failed; nothing was deployed."; exit 1; }
+
 # Add all changes
 git add .
 
@@ -0,0 +1,146 @@
+"""
+Non-interactive entry point for the enrichment scripts, for schedulers and multi-node runs.
+
+    python enrich.py STAGE [--config run.json] [--shard I/N] [--input CSV] [--output CSV] [script options]
+
+STAGE is one of lore, 5e, osr or pipeline. The optional JSON config has one section per
+stage; a section holds the stage's input and output files, any of its command-line
+options (underscored, e.g. "key_pool" or "resume": true) and "settings" that override
+the script's configuration constants:
+
+    {
+      "lore": {"input": "items.csv", "output": "items_lore.csv", "settings": {"BATCH_SIZE": 8}},
+      "5e": {"input": "items_lore.csv", "resume": true,
+             "settings": {"INPUT_DESCRIPTION_COLUMN": "DescriptionLore", "MODEL_ID": "gemini-2.0-flash"}}
+    }
+
+The settings of every section are applied, so the pipeline stage runs its steps with
+them too. Options given on the command line win over the config. With --shard, an
+output path taken from the config or the script's default gets a per-shard suffix, so
+every node can share one config file; merge_outputs.py joins the shard outputs again.
+"""
+
+import argparse
+import importlib
+import json
+import sys
+from typing import Any, Dict, List, Optional
+
+from sharding import shard_option
+
+# --- Configuration ---
+# Stage name -> (module, whether it takes input and output as positional arguments)
+STAGES = {
+    "lore": ("correct_lore", False),
+    "5e": ("correct_to_5e", False),
+    "osr": ("generate_osr_powers", False),
+    "pipeline": ("pipeline", True),
+}
+SETTING_TYPES = (str, int, float, bool, list)
+
+# --- Functions ---
+
+
+def load_config(path: Optional[str]) -> Dict[str, Dict[str, Any]]:
+    if not path:
+        return {}
+    with open(path, "r", encoding="utf-8") as infile:
+        config = json.load(infile)
+    unknown = [name for name in config if name not in STAGES]
+    if unknown:
+        raise ValueError(f"Unknown stages {unknown} in '{path}'. Choose from {sorted(STAGES)}.")
+    return config
+
+
+def apply_settings(module: Any, settings: Dict[str, Any]):
+    """
+    Override a script's configuration constants.
+
+    Only existing upper-case constants with a JSON-compatible value can be set. Column
+    lists built from an overridden column name (e.g. DELTA_COLUMNS from
+    INPUT_DESCRIPTION_COLUMN) get the new name too, unless they are set themselves.
+    """
+    for name, value in settings.items():
+        current = getattr(module, name, None)
+        if not name.isupper() or not isinstance(current, SETTING_TYPES):
+            raise ValueError(f"'{name}' is not a setting of {module.__name__}")
+        numbers = all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in (current, value))
+        if not (numbers or type(value) is type(current)):
+            raise ValueError(f"Setting '{name}' of {module.__name__} must be of type {type(current).__name__}")
+        setattr(module, name, value)
+        if isinstance(current, str):
+            for list_name, values in vars(module).items():
+                if list_name.isupper() and list_name not in settings and isinstance(values, list):
+                    setattr(module, list_name, [value if v == current else v for v in values])
+
+
+def config_argv(section: Dict[str, Any]) -> List[str]:
+    """Command-line options of a config section (everything but input, output and settings)"""
+    argv = []
+    for key, value in section.items():
+        if key in ("input", "output", "settings") or value is None or value is False:
+            continue
+        argv.append("--" + key.replace("_", "-"))
+        if isinstance(value, list):
+            argv += [str(v) for v in value]
+        elif value is not True:
+            argv.append(str(value))
+    return argv
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Run an enrichment stage without prompts, optionally on one shard of the catalog",
+        epilog="Other options are passed on to the stage's script.",
+    )
+    parser.add_argument("stage", choices=sorted(STAGES))
+    parser.add_argument("--config", help="JSON file with per-stage files, options and settings")
+    parser.add_argument("--input", help="Input CSV file (default: from the config, else the script's)")
+    parser.add_argument(
+        "--output", help="Output CSV file, used as is (default: from the config, else the script's)"
+    )
+    parser.add_argument(
+        "--shard",
+        type=shard_option,
+        metavar="I/N",
+        help="Only process shard I of N; rows are assigned by a hash of their item name",
+    )
+    return parser.parse_known_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args, script_options = parse_args(argv)
+    try:
+        config = load_config(args.config)
+    except (OSError, ValueError) as e:
+        print(f"Configuration Error: {e}")
+        sys.exit(2)
+
+    for stage_name, section in config.items():
+        module = importlib.import_module(STAGES[stage_name][0])
+        try:
+            apply_settings(module, section.get("settings", {}))
+        except ValueError as e:
+            print(f"Configuration Error: {e}")
+            sys.exit(2)
+
+    module_name, positional = STAGES[args.stage]
+    module = importlib.import_module(module_name)
+    section = config.get(args.stage, {})
+    input_csv = args.input or section.get("input") or module.DEFAULT_INPUT_CSV
+    output_csv = args.output
+    if not output_csv:
+        output_csv = section.get("output") or module.DEFAULT_OUTPUT_CSV
+        if args.shard:
+            output_csv = args.shard.output_path(output_csv)  # Shared config, one file per node
+
+    script_argv = [input_csv, output_csv] if positional else ["--input", input_csv, "--output", output_csv]
+    if args.shard:
+        script_argv += ["--shard", str(args.shard)]
+    script_argv += config_argv(section) + script_options
+    print(f"Running {args.stage}: {input_csv} -> {output_csv}")
+    module.main(script_argv)
+
+
+if __name__ == "__main__":
+    main()
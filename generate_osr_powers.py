@@ -1,9 +1,49 @@
-import csv
+import asyncio
 import os
 import time
-from typing import List, Dict, Optional
+from typing import Callable, Iterable, List, Dict, Optional
 from pydantic import BaseModel, Field
 from google import genai
+from batch_executor import RateLimiter, batch_context, estimate_tokens, run_batches
+from response_cache import batch_is_cached, response_text
+from response_parsing import parser_for
+from name_matching import reconcile
+from output_writer import OrderedCsvWriter
+from batch_planner import BatchPlan, plan_batches, report_dry_run
+from bulk_jobs import JobRequest, export_jobs
+from csv_stream import iter_item_records, read_csv_header
+from item_record import ItemSchema
+from delta import (
+    DeltaIndex,
+    changed_rows,
+    process_changed,
+    resolve_duplicates,
+    run_batches_for,
+    summarize_run,
+)
+from telemetry import recorded_latency
+from retry_policy import process_with_recovery
+from key_pool import pool_limits
+from stage_cli import StageRun, ask_paths, report_run, stage_parser
+
+DEFAULT_INPUT_CSV = "items.csv"
+DEFAULT_OUTPUT_CSV = "items_osr.csv"
+MODEL_ID = "gemini-pro"  # Using pro model for more creative, complex responses
+EXECUTION_MODE = "async"  # "async" keeps several batches in flight, "sequential" sleeps between batches
+SLEEP_TIME = 10  # Seconds to wait between batches
+BATCH_SIZE = 10  # Maximum items per batch; batches are packed by token estimate below this
+MAX_BATCH_TOKENS = 8_000  # Estimated prompt + response tokens per API call
+MAX_IN_FLIGHT = 4  # Batches in flight at once in async mode
+REQUESTS_PER_MINUTE = 15
+TOKENS_PER_MINUTE = 1_000_000
+RESPONSE_TOKENS_PER_ITEM = 140  # OSR powers are capped at 500 characters
+USE_RESPONSE_CACHE = True  # Re-runs over unchanged items are answered from disk
+CACHE_PATH = "gemini_cache.sqlite"
+METRICS_PATH = "gemini_metrics.jsonl"  # One JSON record per API call
+# Columns that feed the prompt; a row is re-sent in delta mode only when one of them changed
+DELTA_COLUMNS = ["Item Name", "Region", "Lore", "DescriptionGame", "DescriptionLore"]
+DEDUPE_PAYLOADS = True  # Send each distinct prompt payload once and copy its result to repeats
+ERROR_OUTPUTS = ("Error generating power", "No power generated")
 
 class OSRItemPower(BaseModel):
     """Model for an OSR/Cairn-style item power"""
@@ -14,6 +54,12 @@ class BatchResponse(BaseModel):
     """Model for a batch of OSR item powers"""
     items: List[OSRItemPower] = Field(description="List of items with OSR powers")
 
+GENERATION_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": BatchResponse,
+}
+RESPONSE_PARSER = parser_for(BatchResponse)
+
 def setup_api():
     """Setup the Google Generative AI API client"""
     # Make sure to set GOOGLE_API_KEY in your environment variables
@@ -25,7 +71,7 @@ def setup_api():
     genai.configure(api_key=api_key)
     return genai.Client()
 
-def process_item_batch(client, items: List[Dict], batch_size: int = 5) -> List[Dict]:
+def request_item_batch(client, items: List[Dict], batch_size: int = BATCH_SIZE) -> List[Dict]:
     """Process a batch of items to generate OSR powers"""
     # Prepare batches
     batches = [items[i:i+batch_size] for i in range(0, len(items), batch_size)]
@@ -40,24 +86,26 @@ def process_item_batch(client, items: List[Dict], batch_size: int = 5) -> List[D
         try:
             # Call Gemini API
             response = client.models.generate_content(
-                model="gemini-pro",  # Using pro model for more creative, complex responses
+                model=MODEL_ID,
                 contents=batch_prompt,
-                config={
-                    "response_mime_type": "application/json",
-                    "response_schema": BatchResponse,
-                }
+                config=GENERATION_CONFIG
             )
             
-            # Extract OSR powers from response
-            batch_results: BatchResponse = response.parsed
+            # Extract OSR powers from response (complete items of a cut-off response are kept)
+            batch_results = RESPONSE_PARSER.parse(response_text(response))
+            if not batch_results.complete and not batch_results.items:
+                raise ValueError(f"Failed to parse response ({batch_results.outcome})")
+            if not batch_results.complete:
+                print(f"Warning: Response was cut off or malformed; kept {len(batch_results.items)} complete items")
             
-            # Match results with original items
+            # Match results with original items by name (the model may reorder or drop items)
+            matched = reconcile([item["Item Name"] for item in batch], batch_results.items)
+            matched.print_report(f"batch {i+1}")
             for j, item in enumerate(batch):
-                if j < len(batch_results.items):
-                    item_result = batch_results.items[j]
-                    item["OSRPower"] = item_result.osr_power
+                if j in matched.matches:
+                    item["OSRPower"] = matched.matches[j].osr_power
                 else:
-                    # Fallback if API returns fewer results than expected
+                    # Fallback if API returns no result for this item
                     item["OSRPower"] = "No power generated"
                     
                 results.append(item)
@@ -71,13 +119,27 @@ def process_item_batch(client, items: List[Dict], batch_size: int = 5) -> List[D
                 item["OSRPower"] = "Error generating power"
                 results.append(item)
         
-        # Rate limiting
-        if i < len(batches) - 1:  # Don't wait after the last batch
+        # Rate limiting (no wait after the last batch or before one answered from the cache)
+        if i < len(batches) - 1 and not is_cached(client, batches[i + 1]):
             print("Waiting before next batch...")
-            time.sleep(10)
+            time.sleep(SLEEP_TIME)
     
     return results
 
+def mark_batch_error(items: List[Dict], e: Exception):
+    for item in items:
+        item["OSRPower"] = "Error generating power"
+
+def process_item_batch(client, items: List[Dict], batch_size: int = BATCH_SIZE) -> List[Dict]:
+    """Generate OSR powers, re-sending failed items until only those that cannot be processed are errors"""
+    return process_with_recovery(
+        items,
+        lambda part: request_item_batch(client, part, min(batch_size, len(part))),
+        needs_rerun,
+        mark_batch_error,
+        getattr(client, "recovery", None),
+    )
+
 def create_batch_prompt(items: List[Dict]) -> str:
     """Create a prompt for a batch of items"""
     prompt = """Create evocative OSR/Cairn-style magical powers for the following League of Legends items. 
@@ -102,33 +164,177 @@ Items:
 
     return prompt
 
-def main():
+def is_cached(client, items: List[Dict]) -> bool:
+    """True when the request for this batch can be answered from the response cache"""
+    items = changed_rows(items)
+    if not items:
+        return True  # Every row is carried over from a previous run
+    return batch_is_cached(client, MODEL_ID, create_batch_prompt(items), GENERATION_CONFIG)
+
+def needs_rerun(output_row: Dict) -> bool:
+    """A previous output row without a usable power is not carried over by a delta run"""
+    return (output_row.get("OSRPower") or ERROR_OUTPUTS[0]) in ERROR_OUTPUTS
+
+def estimate_response_tokens(item: Dict) -> int:
+    """Powers are short and roughly the same length whatever the input"""
+    return RESPONSE_TOKENS_PER_ITEM
+
+def estimate_batch_tokens(items: List[Dict]) -> int:
+    """Estimate the prompt plus response tokens for one batch"""
+    items = changed_rows(items)
+    return estimate_tokens(create_batch_prompt(items)) + RESPONSE_TOKENS_PER_ITEM * len(items)
+
+def plan_item_batches(items: List[Dict]) -> BatchPlan:
+    """Pack items into requests up to MAX_BATCH_TOKENS (and at most BATCH_SIZE items)"""
+    return plan_batches(
+        items,
+        create_batch_prompt,
+        estimate_response_tokens,
+        max_batch_tokens=MAX_BATCH_TOKENS,
+        max_items=BATCH_SIZE,
+    )
+
+def process_item_batches(client, batches: Iterable[List[Dict]],
+                         on_batch_done: Callable[[int, List[Dict]], None]):
+    """Process planned batches one at a time, handing each result on as soon as it is ready"""
+    for i, batch in enumerate(batches):
+        # Rate limiting (no wait before the first batch or one answered from the cache)
+        if i > 0 and not is_cached(client, batch):
+            print("Waiting before next batch...")
+            time.sleep(SLEEP_TIME)
+        with batch_context(i, len(batch), "osr"):
+            results = process_changed(
+                batch, lambda items: process_item_batch(client, items, batch_size=len(items)))
+        on_batch_done(i, resolve_duplicates(results))
+
+def process_item_batches_async(client, batches: Iterable[List[Dict]],
+                               on_batch_done: Callable[[int, List[Dict]], None],
+                               num_batches: Optional[int] = None):
+    """Process batches concurrently under the rate limits, handing results on in input order"""
+    requests_per_minute, tokens_per_minute, max_in_flight = pool_limits(
+        client, MODEL_ID, REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE, MAX_IN_FLIGHT
+    )
+    limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+
+    def process_batch(batch: List[Dict]) -> List[Dict]:
+        # A single-batch call never sleeps, so it is safe to run concurrently
+        return process_changed(
+            batch, lambda items: process_item_batch(client, items, batch_size=len(items)))
+
+    def hand_on(index: int, results: List[Dict]):
+        # Results arrive in input order, so every duplicate's original is processed by now
+        on_batch_done(index, resolve_duplicates(results))
+
+    asyncio.run(
+        run_batches(
+            batches,
+            process_batch,
+            hand_on,
+            estimate_batch_tokens,
+            limiter=limiter,
+            max_in_flight=max_in_flight,
+            is_cached=lambda batch: is_cached(client, batch),
+            total=num_batches,
+        )
+    )
+
+def batch_prompts(client, items: List[Dict]) -> List[str]:
+    """The prompts a batch would send; none when the cache or a previous run answers it"""
+    if is_cached(client, items):
+        return []
+    return [create_batch_prompt(changed_rows(items))]
+
+def batch_requests(client, items: List[Dict]) -> List[JobRequest]:
+    """The request a batch needs, for a bulk job file; none when the cache or a previous run answers it"""
+    if is_cached(client, items):
+        return []
+    items = changed_rows(items)
+    return [(create_batch_prompt(items), GENERATION_CONFIG, items)]
+
+def report_plan(batches: Iterable[List[Dict]], client, metrics_jsonl: Optional[str]):
+    """Estimate requests, tokens and wall time of a run over `batches` without calling the API"""
+    requests_per_minute, tokens_per_minute, max_in_flight = pool_limits(
+        client, MODEL_ID, REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE, MAX_IN_FLIGHT
+    )
+    report_dry_run(
+        batches,
+        lambda batch: batch_prompts(client, batch),
+        lambda batch: RESPONSE_TOKENS_PER_ITEM * len(changed_rows(batch)),
+        estimate_batch_tokens,
+        recorded_latency(metrics_jsonl, "osr"),
+        requests_per_minute,
+        tokens_per_minute,
+        max_in_flight,
+        execution_mode=EXECUTION_MODE,
+        sleep_time=SLEEP_TIME,
+        label="Plan",
+    )
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = stage_parser("Generate OSR/Cairn-style item powers with Gemini", METRICS_PATH, resume=False)
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None):
     """Main function to process items and generate OSR powers"""
-    input_csv_file = input("Enter input CSV filename (default: items.csv): ") or "items.csv"
-    output_csv_file = input("Enter output CSV filename (default: items_osr.csv): ") or "items_osr.csv"
+    args = parse_args(argv)
+    input_csv_file, output_csv_file = ask_paths(args, DEFAULT_INPUT_CSV, DEFAULT_OUTPUT_CSV)
     
+    # A --plan or --export-jobs run writes no metrics and only reads the cache
+    run = StageRun(args, "osr")
     try:
-        # Setup the API client
-        client = setup_api()
+        # Setup the API client (a stand-in that refuses every call for --plan and --export-jobs,
+        # or one answering from bulk job results)
+        client = run.open_client(
+            setup_api, REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE, CACHE_PATH if USE_RESPONSE_CACHE else None
+        )
         
-        # Read input CSV
-        with open(input_csv_file, "r", encoding="utf-8") as infile:
-            reader = csv.DictReader(infile)
-            all_items = list(reader)
-            
-        print(f"Found {len(all_items)} items to process")
-        
-        # Process items in batches
-        processed_items = process_item_batch(client, all_items)
+        # Stream the input CSV as records of one schema; a first pass only plans the batches
+        headers = read_csv_header(input_csv_file, delimiter=",", encoding="utf-8")
+        schema = ItemSchema(headers + ["OSRPower"])
+
+        def read_rows():
+            rows = iter_item_records(input_csv_file, delimiter=",", encoding="utf-8", schema=schema)
+            return args.shard.select(rows) if args.shard else rows
+
+        delta = None
+        if args.delta_from:
+            delta = DeltaIndex.load(
+                *args.delta_from, DELTA_COLUMNS, needs_rerun, delimiter=",", encoding="utf-8"
+            )
+
+        dedupe_columns = DELTA_COLUMNS if DEDUPE_PAYLOADS else None
+        plan, num_batches, carried, duplicates = summarize_run(
+            read_rows(), plan_item_batches, delta, dedupe_columns
+        )
+        print(f"Found {plan.item_count + carried + duplicates} items to process")
+        report_run(plan, carried, duplicates, args.shard, delta, read_rows, plan_item_batches)
+        if args.plan:
+            report_plan(
+                run_batches_for(read_rows(), plan_item_batches, delta, dedupe_columns=dedupe_columns),
+                client,
+                args.metrics_jsonl,
+            )
+            return
+        if args.export_jobs:
+            export_jobs(
+                args.export_jobs,
+                run_batches_for(read_rows(), plan_item_batches, delta, dedupe_columns=dedupe_columns),
+                lambda batch: batch_requests(client, batch),
+                "osr",
+                MODEL_ID,
+            ).print_report(args.export_jobs)
+            return
         
-        # Write results to output CSV
         # Get all field names from input plus our new field
-        fieldnames = list(all_items[0].keys()) + ["OSRPower"]
+        fieldnames = headers + ["OSRPower"]
         
-        with open(output_csv_file, "w", encoding="utf-8", newline="") as outfile:
-            writer = csv.DictWriter(outfile, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(processed_items)
+        # Write results batch by batch, in input order; the output is replaced when the run completes
+        with OrderedCsvWriter(output_csv_file, fieldnames, delimiter=",") as writer:
+            batches = run_batches_for(read_rows(), plan_item_batches, delta, dedupe_columns=dedupe_columns)
+            if EXECUTION_MODE == "async":
+                process_item_batches_async(client, batches, writer.write_batch, num_batches)
+            else:
+                process_item_batches(client, batches, writer.write_batch)
         
         print(f"Processing complete. Results saved to '{output_csv_file}'")
             
@@ -136,6 +342,8 @@ def main():
         print(f"Error: Input file '{input_csv_file}' not found")
     except Exception as e:
         print(f"Error: {e}")
+    finally:
+        run.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,149 @@
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# --- Configuration ---
+# Columns with few distinct values repeated across a catalog; records of a file share one copy of each
+INTERNED_COLUMNS = ("Region", "ImageURL")
+
+_ABSENT = object()  # Value of a column a record does not have, like a key missing from a dict row
+
+# --- Functions ---
+
+
+def normalize_header(header: str) -> str:
+    return header.strip().lower()
+
+
+class ItemSchema:
+    """
+    Column layout of one CSV file, shared by all of its records and resolved once.
+
+    Maps column names to positions in a record's values, finds a column case- and
+    whitespace-insensitively (what the scripts used header maps for) and keeps the
+    one copy of each repeated value of the interned columns. The columns are fixed
+    when the schema is made, so records on other threads never see it change; give
+    the output columns up front, and any other key lives in the record that set it.
+    """
+
+    def __init__(self, fields: Sequence[str], interned: Iterable[str] = INTERNED_COLUMNS):
+        self.fields: Tuple[str, ...] = tuple(dict.fromkeys(fields))  # A repeated header is one column, as in DictReader
+        self.positions: Dict[str, int] = {field: i for i, field in enumerate(self.fields)}
+        self._normalized: Dict[str, str] = {}
+        for field in self.fields:
+            self._normalized.setdefault(normalize_header(field), field)
+        interned_names = {normalize_header(column) for column in interned}
+        self.interned = frozenset(i for i, field in enumerate(self.fields) if normalize_header(field) in interned_names)
+        self._values: Dict[str, str] = {}
+
+    def find(self, column: str) -> Optional[str]:
+        """The file's header for `column`, compared case- and whitespace-insensitively"""
+        return self._normalized.get(normalize_header(column))
+
+    def intern(self, value: Any) -> Any:
+        if not isinstance(value, str):
+            return value
+        return self._values.setdefault(value, value)
+
+    def record(self, values: Sequence[Any]) -> "ItemRecord":
+        """A record of values in column order; shorter sequences lack the trailing columns"""
+        values = list(values)
+        for i in self.interned:
+            if i < len(values) and isinstance(values[i], str):
+                values[i] = self._values.setdefault(values[i], values[i])
+        if len(values) < len(self.fields):
+            values.extend([_ABSENT] * (len(self.fields) - len(values)))  # Room for the output columns, once
+        return ItemRecord(self, values)
+
+    def from_row(self, row: Dict) -> "ItemRecord":
+        """A record of a dict row; keys the schema lacks are kept in the record itself"""
+        record = self.record([row.get(field, _ABSENT) for field in self.fields])
+        for key, value in row.items():
+            if key not in self.positions:
+                record[key] = value
+        return record
+
+
+class ItemRecord(MutableMapping):
+    """
+    One catalog row: a schema reference and a list of values, without per-row keys.
+
+    Behaves like the dict rows of csv.DictReader (exact, case-sensitive keys; a value
+    can be set for any key), so the scripts, the CSV writers and the helpers taking a
+    Dict work on records unchanged. Keys outside the schema, e.g. DictReader's None key
+    for surplus fields, go to a dict of the record's own, made only when one is set.
+    """
+
+    __slots__ = ("schema", "values", "extra")
+
+    def __init__(self, schema: ItemSchema, values: List[Any]):
+        self.schema = schema
+        self.values = values
+        self.extra: Optional[Dict] = None
+
+    def __getitem__(self, key):
+        position = self.schema.positions.get(key)
+        if position is None:
+            if self.extra is None:
+                raise KeyError(key)
+            return self.extra[key]
+        value = self.values[position]
+        if value is _ABSENT:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        position = self.schema.positions.get(key)
+        if position is None:
+            return default if self.extra is None else self.extra.get(key, default)
+        value = self.values[position]
+        return default if value is _ABSENT else value
+
+    def __contains__(self, key) -> bool:
+        return self.get(key, _ABSENT) is not _ABSENT
+
+    def __setitem__(self, key, value):
+        position = self.schema.positions.get(key)
+        if position is None:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+            return
+        if position in self.schema.interned:
+            value = self.schema.intern(value)
+        self.values[position] = value
+
+    def __delitem__(self, key):
+        position = self.schema.positions.get(key)
+        if position is None:
+            if self.extra is None:
+                raise KeyError(key)
+            del self.extra[key]
+            return
+        if self.values[position] is _ABSENT:
+            raise KeyError(key)
+        self.values[position] = _ABSENT
+
+    def __iter__(self) -> Iterator:
+        fields = self.schema.fields
+        for i, value in enumerate(self.values):
+            if value is not _ABSENT:
+                yield fields[i]
+        if self.extra:
+            yield from self.extra
+
+    def __len__(self) -> int:
+        return sum(1 for value in self.values if value is not _ABSENT) + len(self.extra or ())
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (ItemRecord, dict)):
+            return dict(self.items()) == dict(other.items())
+        return NotImplemented
+
+    __hash__ = None  # Mutable, like a dict
+
+    def __repr__(self) -> str:
+        return f"ItemRecord({dict(self.items())!r})"
+
+    def to_row(self) -> Dict:
+        """A plain dict row, e.g. for json or code that needs a real dict"""
+        return dict(self.items())
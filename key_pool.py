@@ -0,0 +1,218 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from batch_executor import TokenBucket, estimate_tokens
+
+# --- Configuration ---
+RATE_LIMIT_PAUSE_SECONDS = 30.0  # A key that answers 429 sits out this long, for every batch
+MAX_WAIT_STEP = 1.0  # Seconds slept at a time while no key has capacity, to notice unpauses
+
+# --- Functions ---
+
+
+def is_rate_limited(error: Exception) -> bool:
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    return code == 429 or "RESOURCE_EXHAUSTED" in str(error)
+
+
+class PoolMember:
+    """One credential, optionally pinned to a model, with its own request and token quota"""
+
+    def __init__(
+        self,
+        name: str,
+        client: Any,
+        model: Optional[str],
+        requests_per_minute: float,
+        tokens_per_minute: float,
+    ):
+        self.name = name
+        self.client = client
+        self.model = model  # None serves every model
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.paused_until = 0.0
+        self.in_flight = 0
+        self.calls = 0
+        self.tokens_sent = 0
+        self.rate_limited = 0
+        self.paused_seconds = 0.0
+        self.busy_seconds = 0.0
+
+    def wait_time(self, tokens: int, now: float) -> float:
+        return max(self.paused_until - now, self.requests.wait_time(1), self.tokens.wait_time(tokens))
+
+
+class KeyPool:
+    """
+    Credentials and models shared by every batch of a run, each under its own quota.
+
+    Each call goes to the member for its model that can take it soonest, preferring the
+    least busy one, so adding keys adds throughput. A member that is rate limited (429)
+    is paused for all callers and the call is sent to another member straight away.
+    """
+
+    def __init__(self, members: List[PoolMember], pause_seconds: float = RATE_LIMIT_PAUSE_SECONDS):
+        if not members:
+            raise ValueError("A key pool needs at least one key")
+        self.members = members
+        self.pause_seconds = pause_seconds
+        self.started_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(
+        cls,
+        path: str,
+        make_client: Callable[[str], Any],
+        requests_per_minute: float,
+        tokens_per_minute: float,
+        require_keys: bool = True,
+    ) -> "KeyPool":
+        """
+        Build a pool from a JSON file of the form
+        {"keys": [{"name": ..., "api_key_env": "GOOGLE_API_KEY_2", "model": ...,
+                   "requests_per_minute": ..., "tokens_per_minute": ...}, ...]}.
+
+        `api_key_env` names the environment variable holding the key, so the file itself
+        holds no secrets (a literal `api_key` is accepted too). Entries without a model
+        serve every model; missing limits default to the calling script's. Without
+        `require_keys` (a --plan dry run) entries whose key is not set are kept.
+        """
+        with open(path, "r", encoding="utf-8") as infile:
+            entries = json.load(infile)["keys"]
+        clients: Dict[str, Any] = {}
+        members = []
+        for i, entry in enumerate(entries):
+            api_key = entry.get("api_key") or os.environ.get(entry.get("api_key_env", ""))
+            if not api_key and require_keys:
+                raise ValueError(f"Key pool entry {i + 1} in '{path}' has no api_key and its api_key_env is not set")
+            name = entry.get("name") or entry.get("api_key_env") or f"key{i + 1}"
+            api_key = api_key or name  # Keyless entries of a dry run get a client each
+            if api_key not in clients:
+                clients[api_key] = make_client(api_key)  # One client per key, shared by its models
+            members.append(
+                PoolMember(
+                    name,
+                    clients[api_key],
+                    entry.get("model"),
+                    entry.get("requests_per_minute", requests_per_minute),
+                    entry.get("tokens_per_minute", tokens_per_minute),
+                )
+            )
+        print(f"Key pool: {len(members)} keys loaded from '{path}'")
+        return cls(members)
+
+    def members_for(self, model: str) -> List[PoolMember]:
+        members = [m for m in self.members if m.model in (model, None)]
+        if not members:
+            raise ValueError(f"No key in the pool serves model '{model}'")
+        return members
+
+    def acquire(self, model: str, tokens: int) -> PoolMember:
+        """Block until a member for `model` has quota, then take one request from it"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                member = min(
+                    self.members_for(model),
+                    key=lambda m: (m.wait_time(tokens, now), m.in_flight, m.calls),
+                )
+                wait = member.wait_time(tokens, now)
+                if wait <= 0:
+                    member.requests.consume(1)
+                    member.tokens.consume(tokens)
+                    member.in_flight += 1
+                    member.calls += 1
+                    member.tokens_sent += tokens
+                    return member
+            time.sleep(min(wait, MAX_WAIT_STEP))
+
+    def release(self, member: PoolMember, seconds: float):
+        with self._lock:
+            member.in_flight -= 1
+            member.busy_seconds += seconds
+
+    def pause(self, member: PoolMember, model: str) -> bool:
+        """Take a rate-limited member out of rotation; True if another one can still serve `model`"""
+        with self._lock:
+            now = time.monotonic()
+            member.rate_limited += 1
+            if member.paused_until <= now:
+                member.paused_until = now + self.pause_seconds
+                member.paused_seconds += self.pause_seconds
+            return any(m.paused_until <= now for m in self.members_for(model) if m is not member)
+
+    def limits(self, model: str) -> Tuple[float, float, int]:
+        """Summed requests/min and tokens/min of the members for `model`, and their count"""
+        members = self.members_for(model)
+        return (
+            sum(m.requests_per_minute for m in members),
+            sum(m.tokens_per_minute for m in members),
+            len(members),
+        )
+
+    def print_report(self):
+        minutes = (time.monotonic() - self.started_at) / 60
+        calls = sum(m.calls for m in self.members)
+        print(f"Key pool: {calls} calls over {len(self.members)} keys in {minutes:.1f} min")
+        minutes = max(minutes, 1.0)  # A full bucket allows a minute's quota at once
+        for m in self.members:
+            print(
+                f"  {m.name} ({m.model or 'any model'}): {m.calls} calls, "
+                f"{m.calls / (m.requests_per_minute * minutes):.0%} of {m.requests_per_minute:g} RPM, "
+                f"~{m.tokens_sent:,} prompt tokens, {m.rate_limited} rate limited, "
+                f"paused {m.paused_seconds:.0f}s, busy {m.busy_seconds:.1f}s"
+            )
+
+
+class PooledModels:
+    """Drop-in for `client.models` that sends every call through a KeyPool"""
+
+    def __init__(self, pool: KeyPool):
+        self.pool = pool
+
+    def generate_content(self, model: str, contents: str, config: Any = None):
+        tokens = estimate_tokens(contents)
+        while True:
+            member = self.pool.acquire(model, tokens)
+            started = time.monotonic()
+            try:
+                return member.client.models.generate_content(model=model, contents=contents, config=config)
+            except Exception as e:
+                if not (is_rate_limited(e) and self.pool.pause(member, model)):
+                    raise  # Other errors, and a pool that is wholly rate limited, go to the retry policy
+                print(f"Key '{member.name}' rate limited; pausing it for {self.pool.pause_seconds:.0f}s")
+            finally:
+                self.pool.release(member, time.monotonic() - started)
+
+
+class PooledClient:
+    """Stands in for a genai.Client, spreading calls over the keys of a KeyPool"""
+
+    def __init__(self, pool: KeyPool):
+        self.pool = pool
+        self.models = PooledModels(pool)
+
+
+def pool_limits(
+    client: Any, model: str, requests_per_minute: float, tokens_per_minute: float, max_in_flight: int
+) -> Tuple[float, float, int]:
+    """
+    Batch-level rate limits and concurrency for `client`.
+
+    When the client (or one it wraps) is pooled, the pool's summed quota replaces the
+    single-key limits and the in-flight batches scale with the number of keys.
+    """
+    while client is not None:
+        pool = getattr(client, "pool", None)
+        if isinstance(pool, KeyPool):
+            pool_rpm, pool_tpm, keys = pool.limits(model)
+            return pool_rpm, pool_tpm, max_in_flight * keys
+        client = getattr(client, "_client", None)
+    return requests_per_minute, tokens_per_minute, max_in_flight
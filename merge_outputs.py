@@ -0,0 +1,249 @@
+import argparse
+import csv
+import heapq
+import itertools
+import os
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from csv_stream import iter_csv_rows, read_csv_header
+
+# --- Configuration ---
+DEFAULT_OUTPUT_CSV = "items_merged.csv"
+KEY_COLUMN = "Item Name"
+# Values the scripts write into a row they could not enrich
+ERROR_PREFIXES = ("Error", "No description generated", "No power generated")
+PREFER_POLICIES = ("success", "latest")
+
+# --- Functions ---
+
+
+def is_error_row(row: Dict) -> bool:
+    return any(isinstance(value, str) and value.startswith(ERROR_PREFIXES) for value in row.values())
+
+
+class PartialOutput:
+    """One partial output CSV read as a stream, with the row at its head buffered"""
+
+    def __init__(self, path: str, rank: int, delimiter: str = ";"):
+        self.path = path
+        self.rank = rank  # Position on the command line; breaks timestamp ties
+        self.modified = os.path.getmtime(path)
+        self.fieldnames = read_csv_header(path, delimiter)
+        self.rows = iter_csv_rows(path, delimiter)
+        self.head: Optional[Dict] = next(self.rows, None)
+        self.read = 0
+
+    def pop(self) -> Dict:
+        row = self.head
+        self.head = next(self.rows, None)
+        self.read += 1
+        return row
+
+
+class MergeStats:
+    def __init__(self):
+        self.written = 0
+        self.duplicates = 0  # Extra copies of a row, from overlapping partial outputs
+        self.errors_replaced = 0
+        self.missing = 0  # Input rows no partial output has
+        self.skipped = 0  # Partial rows matching no remaining input row; left out
+
+    def print_report(self, output_file: str):
+        print(
+            f"Merged {self.written} rows into '{output_file}': {self.duplicates} duplicates resolved "
+            f"({self.errors_replaced} error rows replaced by a successful one)"
+        )
+        if self.missing:
+            print(f"Warning: {self.missing} input rows are missing from every partial output.")
+        if self.skipped:
+            print(f"Warning: {self.skipped} rows matched no remaining input row and were left out.")
+
+
+def pick_row(
+    candidates: List[Tuple[PartialOutput, Dict]],
+    prefer: str,
+    timestamp_column: Optional[str],
+    stats: MergeStats,
+) -> Dict:
+    """
+    The copy of a row to keep when several partial outputs have it.
+
+    "latest" keeps the newest copy: the largest `timestamp_column` value (ISO 8601 sorts
+    chronologically) or else the one from the most recently modified file. "success"
+    keeps the newest copy that is not an error, falling back to the newest error.
+    """
+
+    def age(candidate: Tuple[PartialOutput, Dict]):
+        partial, row = candidate
+        stamp = (row.get(timestamp_column) or "") if timestamp_column else ""
+        return (stamp, partial.modified, partial.rank)
+
+    stats.duplicates += len(candidates) - 1
+    newest = max(candidates, key=age)
+    if prefer == "success" and is_error_row(newest[1]):
+        successful = [c for c in candidates if not is_error_row(c[1])]
+        if successful:
+            stats.errors_replaced += 1
+            return max(successful, key=age)[1]
+    return newest[1]
+
+
+def merge_by_index(
+    partials: List[PartialOutput],
+    index_column: str,
+    prefer: str,
+    timestamp_column: Optional[str],
+    stats: MergeStats,
+) -> Iterator[Dict]:
+    """K-way merge of partial outputs, each in input order, that carry each row's input position"""
+
+    def keyed(partial: PartialOutput) -> Iterator[Tuple[int, int, PartialOutput, Dict]]:
+        while partial.head is not None:
+            row = partial.pop()
+            yield int(row[index_column]), partial.rank, partial, row
+
+    merged = heapq.merge(*(keyed(partial) for partial in partials), key=lambda entry: entry[:2])
+    for _, group in itertools.groupby(merged, key=lambda entry: entry[0]):
+        yield pick_row([(partial, row) for _, _, partial, row in group], prefer, timestamp_column, stats)
+
+
+def merge_by_input(
+    partials: List[PartialOutput],
+    input_rows: Iterable[Dict],
+    input_keys: Counter,
+    key_column: str,
+    prefer: str,
+    timestamp_column: Optional[str],
+    stats: MergeStats,
+) -> Iterator[Dict]:
+    """
+    Merge partial outputs in the order of the input they were produced from.
+
+    Every partial output (a shard, or an interrupted run and its resume) holds a
+    subsequence of the input in input order, so walking the input once and taking each
+    partial's head row when its key matches restores the order, holding one row per file.
+    Input rows sharing a key are matched in order. `input_keys` counts the keys of the
+    input; a head row whose key no remaining input row has is skipped, so it cannot hold
+    back the rest of its file.
+    """
+    remaining = Counter(input_keys)
+
+    def skip_unmatched():
+        for partial in partials:
+            while partial.head is not None and remaining[partial.head.get(key_column)] <= 0:
+                stats.skipped += 1
+                print(f"Warning: skipping '{partial.head.get(key_column)}' in '{partial.path}', not in the remaining input.")
+                partial.pop()
+
+    skip_unmatched()
+    for input_row in input_rows:
+        key = input_row.get(key_column)
+        candidates = [
+            (partial, partial.pop())
+            for partial in partials
+            if partial.head is not None and partial.head.get(key_column) == key
+        ]
+        if candidates:
+            yield pick_row(candidates, prefer, timestamp_column, stats)
+        else:
+            stats.missing += 1
+        remaining[key] -= 1
+        if remaining[key] <= 0:
+            skip_unmatched()
+
+
+def merge_outputs(
+    partial_files: List[str],
+    output_file: str,
+    order_from: Optional[str] = None,
+    index_column: Optional[str] = None,
+    key_column: str = KEY_COLUMN,
+    prefer: str = "success",
+    timestamp_column: Optional[str] = None,
+    delimiter: str = ";",
+) -> MergeStats:
+    """
+    Combine partial output CSVs into one QUOTE_ALL, `;`-delimited file in input order.
+
+    The order comes from `index_column` when the rows carry their input position, else
+    from the input CSV `order_from`, matched on `key_column`. The partial outputs are
+    streamed in a single pass; the input is read twice, first to count its keys, so
+    memory grows with the distinct item names but not with the rows.
+    """
+    if not index_column and not order_from:
+        raise ValueError("Give the input CSV to restore the order from, or a column holding each row's index")
+    partials = [PartialOutput(path, rank, delimiter) for rank, path in enumerate(partial_files)]
+    fieldnames = list(dict.fromkeys(name for partial in partials for name in partial.fieldnames))
+    stats = MergeStats()
+    if index_column:
+        rows = merge_by_index(partials, index_column, prefer, timestamp_column, stats)
+    else:
+        input_keys = Counter(row.get(key_column) for row in iter_csv_rows(order_from, delimiter))
+        input_rows = iter_csv_rows(order_from, delimiter)
+        rows = merge_by_input(partials, input_rows, input_keys, key_column, prefer, timestamp_column, stats)
+
+    # Written next to the output and moved over it once complete, so a failed merge leaves no half
+    # file; not <output>.partial, which may well be one of the files being merged
+    temp_file = f"{output_file}.{os.getpid()}.merging"
+    try:
+        with open(temp_file, "w", encoding="utf-8", newline="") as outfile:
+            writer = csv.DictWriter(
+                outfile, fieldnames=fieldnames, extrasaction="ignore", delimiter=";", quoting=csv.QUOTE_ALL
+            )
+            writer.writeheader()
+            for row in rows:
+                writer.writerow(row)
+                stats.written += 1
+        os.replace(temp_file, output_file)
+    finally:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+    return stats
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Merge partial or per-shard output CSVs into one ordered, fully quoted CSV"
+    )
+    parser.add_argument("partial_files", nargs="+", metavar="PARTIAL_CSV")
+    parser.add_argument("-o", "--output", default=DEFAULT_OUTPUT_CSV, help=f"(default: {DEFAULT_OUTPUT_CSV})")
+    order = parser.add_mutually_exclusive_group(required=True)
+    order.add_argument("--order-from", metavar="INPUT_CSV", help="Restore the row order of this input CSV")
+    order.add_argument("--index-column", help="Restore the order from each row's input index in this column")
+    parser.add_argument(
+        "--key-column", default=KEY_COLUMN, help=f"Column matching rows to the input (default: {KEY_COLUMN})"
+    )
+    parser.add_argument(
+        "--prefer",
+        choices=PREFER_POLICIES,
+        default="success",
+        help="Copy kept when partial outputs overlap: the newest successful one, or simply the newest",
+    )
+    parser.add_argument("--timestamp-column", help="Column dating each row (default: file modification time)")
+    parser.add_argument("--delimiter", default=";", help="Delimiter of the partial outputs (default: ;)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    try:
+        stats = merge_outputs(
+            args.partial_files,
+            args.output,
+            order_from=args.order_from,
+            index_column=args.index_column,
+            key_column=args.key_column,
+            prefer=args.prefer,
+            timestamp_column=args.timestamp_column,
+            delimiter=args.delimiter,
+        )
+        stats.print_report(args.output)
+    except FileNotFoundError as e:
+        print(f"Error: File '{e.filename}' not found")
+    except (KeyError, ValueError) as e:
+        print(f"Error: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import difflib
+import re
+import unicodedata
+from typing import Any, Callable, Dict, List, Tuple
+
+# --- Configuration ---
+FUZZY_MIN_RATIO = 0.85  # Similarity of normalized names needed for a fuzzy match
+FUZZY_MIN_MARGIN = 0.05  # A fuzzy match must beat the runner-up by this much, or it is a conflict
+# Typographic variants the model substitutes for plain ASCII
+CHARACTER_FOLDS = str.maketrans(
+    {"\u2018": "'", "\u2019": "'", "\u02bc": "'", "`": "'", "\u00b4": "'", "\u201c": '"', "\u201d": '"'}
+)
+
+# --- Functions ---
+
+
+def normalize_name(name: str) -> str:
+    """Match key of an item name: case, accents, quotes, apostrophes and punctuation ignored"""
+    name = unicodedata.normalize("NFKD", (name or "").translate(CHARACTER_FOLDS))
+    name = "".join(c for c in name if not unicodedata.combining(c)).lower()
+    name = name.replace("'", "")  # "Doran's Blade" and "Dorans Blade" are the same item
+    return " ".join(re.sub(r"[^\w]+", " ", name).split())
+
+
+class Reconciliation:
+    """Which model result belongs to which input item of a batch, and what could not be mapped"""
+
+    def __init__(self):
+        self.matches: Dict[int, Any] = {}  # Input position -> result
+        self.fuzzy: List[Tuple[str, str]] = []  # (result name, input name) matched approximately
+        self.conflicts: List[str] = []
+
+    def print_report(self, label: str):
+        for result_name, input_name in self.fuzzy:
+            print(f"Matched result '{result_name}' to item '{input_name}' in {label}")
+        for conflict in self.conflicts:
+            print(f"Warning: Conflict in {label}: {conflict}")
+
+
+def reconcile(
+    names: List[str],
+    results: List[Any],
+    result_name: Callable[[Any], str] = lambda result: result.item_name,
+) -> Reconciliation:
+    """
+    Map each result to the input item it answers, by name.
+
+    Results are looked up in an index of normalized input names first; repeated names are
+    assigned in input order. The rest are matched approximately against the items still
+    unanswered, strongest pairs first. A result that matches nothing, matches two items
+    equally well, or answers an item that already has a result is reported as a conflict
+    rather than guessed, so the item it might belong to is re-requested instead.
+    """
+    reconciliation = Reconciliation()
+    index: Dict[str, List[int]] = {}
+    for position, name in enumerate(names):
+        index.setdefault(normalize_name(name), []).append(position)
+
+    leftovers = []
+    for result in results:
+        key = normalize_name(result_name(result))
+        positions = [p for p in index.get(key, []) if p not in reconciliation.matches]
+        if positions:
+            reconciliation.matches[positions[0]] = result
+        elif key in index:
+            reconciliation.conflicts.append(
+                f"result '{result_name(result)}' repeats item '{names[index[key][0]]}', which already has one"
+            )
+        else:
+            leftovers.append((key, result))
+
+    open_positions = [p for p in range(len(names)) if p not in reconciliation.matches]
+    candidates = []
+    for key, result in leftovers:
+        # Best score first; on a tie, the earliest position, as in the exact-match pass above
+        scores = sorted(
+            ((_similarity(key, normalize_name(names[p])), p) for p in open_positions),
+            key=lambda s: (s[0], -s[1]),
+            reverse=True,
+        )
+        if not scores or scores[0][0] < FUZZY_MIN_RATIO:
+            reconciliation.conflicts.append(f"result '{result_name(result)}' matches no item in the batch")
+            continue
+        best = scores[0]
+        # Repeats of the best item's name are not rivals; the first open one is taken
+        rivals = [s for s in scores[1:] if normalize_name(names[s[1]]) != normalize_name(names[best[1]])]
+        if rivals and best[0] - rivals[0][0] < FUZZY_MIN_MARGIN:
+            reconciliation.conflicts.append(
+                f"result '{result_name(result)}' is ambiguous between items "
+                f"'{names[best[1]]}' and '{names[rivals[0][1]]}'"
+            )
+        else:
+            candidates.append((best[0], best[1], result))
+
+    for score, position, result in sorted(candidates, key=lambda c: c[0], reverse=True):
+        if position in reconciliation.matches:
+            reconciliation.conflicts.append(
+                f"result '{result_name(result)}' is closest to item '{names[position]}', which already has one"
+            )
+            continue
+        reconciliation.matches[position] = result
+        reconciliation.fuzzy.append((result_name(result), names[position]))
+    return reconciliation
+
+
+def _similarity(a: str, b: str) -> float:
+    matcher = difflib.SequenceMatcher(None, a, b)
+    # The upper bounds are cheap; skip the full comparison when they already rule a match out
+    if matcher.real_quick_ratio() < FUZZY_MIN_RATIO or matcher.quick_ratio() < FUZZY_MIN_RATIO:
+        return 0.0
+    return matcher.ratio()
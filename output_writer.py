@@ -0,0 +1,125 @@
+import csv
+import io
+import os
+import shutil
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from checkpoint import CheckpointJournal
+
+# --- Configuration ---
+TEMP_SUFFIX = ".partial"  # Rows of a run in progress go to <output>.partial
+FLUSH_BYTES = 1 << 20  # Buffered rows are written out once they reach this size...
+FLUSH_SECONDS = 5.0  # ...or once the oldest of them has waited this long
+
+# --- Functions ---
+
+
+def temp_path_for(output_file: str) -> str:
+    return output_file + TEMP_SUFFIX
+
+
+class OrderedCsvWriter:
+    """
+    The output CSV of a run: one open handle, rows buffered and written in input order.
+
+    Batches may be handed in in any order; each waits until the batches before it have
+    arrived. Buffered rows reach the disk (flushed and fsynced) once FLUSH_BYTES build up
+    or FLUSH_SECONDS pass, and only then are their batches recorded in the checkpoint
+    journal, so a resume never trusts rows that were not written. Rows go to a temporary
+    file next to the output, which replaces the output in a single rename when the run
+    ends, so readers such as the static site never see a torn CSV.
+    """
+
+    def __init__(
+        self,
+        output_file: str,
+        fieldnames: List[str],
+        journal: Optional[CheckpointJournal] = None,
+        append: bool = False,
+        delimiter: str = ";",
+        quoting: int = csv.QUOTE_MINIMAL,
+        before_write: Optional[Callable[[List[Dict]], object]] = None,
+        flush_bytes: int = FLUSH_BYTES,
+        flush_seconds: float = FLUSH_SECONDS,
+    ):
+        self.output_file = output_file
+        self.temp_file = temp_path_for(output_file)
+        self.journal = journal
+        self.before_write = before_write  # Runs on each batch in input order, e.g. resolve_duplicates
+        self.flush_bytes = flush_bytes
+        self.flush_seconds = flush_seconds
+        self.rows_written = 0
+        self.flushes = 0
+        if append and not os.path.exists(self.temp_file) and os.path.exists(output_file):
+            shutil.copyfile(output_file, self.temp_file)  # Resuming a run that was already published
+        self._file = open(self.temp_file, "a" if append else "w", encoding="utf-8", newline="")
+        self._buffer = io.StringIO()
+        self._writer = csv.DictWriter(
+            self._buffer, fieldnames=fieldnames, extrasaction="ignore", delimiter=delimiter, quoting=quoting
+        )
+        self._pending: Dict[int, Tuple[List[Dict], list]] = {}
+        self._next_index = 0
+        self._unrecorded: list = []  # Journal keys of the batches in the buffer
+        self._buffered_since: Optional[float] = None
+        if not append:
+            self._writer.writeheader()
+            self._buffered_since = time.monotonic()
+
+    def write_batch(self, index: int, rows: List[Dict], keys: Optional[list] = None):
+        """Hand in batch `index` (numbered from 0) with the journal keys of its input rows"""
+        self._pending[index] = (rows, keys or [])
+        while self._next_index in self._pending:
+            rows, keys = self._pending.pop(self._next_index)
+            if self.before_write:
+                self.before_write(rows)
+            self._writer.writerows(rows)
+            self._unrecorded.extend(keys)
+            self.rows_written += len(rows)
+            if self._buffered_since is None:
+                self._buffered_since = time.monotonic()
+            self._next_index += 1
+        if self._buffered_since is not None and (
+            self._buffer.tell() >= self.flush_bytes
+            or time.monotonic() - self._buffered_since >= self.flush_seconds
+        ):
+            self.flush()
+
+    def flush(self):
+        """Write the buffered rows to disk, then record their batches in the journal"""
+        self._file.write(self._buffer.getvalue())
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        if self.journal and self._unrecorded:
+            self.journal.record_batch(self._unrecorded)
+        self._unrecorded = []
+        self._buffered_since = None
+        self.flushes += 1
+
+    def close(self, publish: bool = True):
+        """
+        Flush and close; with `publish`, atomically replace the output with the finished file.
+
+        Batches still waiting for an earlier one are dropped (they are not journaled), and
+        without `publish` the rows written so far stay in the temporary file for --resume.
+        """
+        if self._file.closed:
+            return
+        if self._pending:
+            print(f"Warning: {len(self._pending)} batches finished out of order were not written.")
+            publish = False
+        self.flush()
+        self._file.close()
+        if publish:
+            os.replace(self.temp_file, self.output_file)
+        else:
+            hint = "; run again with --resume to continue" if self.journal else ""
+            print(f"Partial output kept in '{self.temp_file}'{hint}.")
+
+    def __enter__(self) -> "OrderedCsvWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(publish=exc_type is None)
@@ -0,0 +1,326 @@
+import argparse
+import asyncio
+import csv
+import itertools
+from typing import Callable, Dict, Iterable, List, Optional
+
+from google import genai
+
+import correct_lore
+import correct_to_5e
+import generate_osr_powers
+from batch_executor import RateLimiter, run_batch_stream
+from batch_planner import BatchPlan, iter_planned_batches, summarize_plan
+from csv_stream import iter_item_records, read_csv_header
+from item_record import ItemSchema
+from response_cache import CachedClient, ResponseCache
+from telemetry import MetricsClient, MetricsRecorder
+from retry_policy import RecoveryStats, RetryingClient
+from key_pool import KeyPool, PooledClient, pool_limits
+from stage_cli import add_api_options, add_shard_option
+from context_store import ContextStore
+from output_writer import OrderedCsvWriter
+
+# --- Configuration ---
+DEFAULT_INPUT_CSV = "items.csv"
+DEFAULT_OUTPUT_CSV = "items_enriched.csv"
+DEFAULT_STAGES = "lore,5e"  # "osr" additionally needs a DescriptionGame column
+QUEUE_BATCHES = 4  # Finished batches buffered between two stages before upstream pauses
+USE_RESPONSE_CACHE = True
+CACHE_PATH = "gemini_cache.sqlite"
+METRICS_PATH = "gemini_metrics.jsonl"  # One JSON record per API call, tagged with its stage
+
+# --- Stages ---
+
+
+class Stage:
+    """One enrichment step of the pipeline, built from an existing script's batch logic"""
+
+    def __init__(
+        self,
+        name: str,
+        model_id: str,
+        process_batch: Callable[[List[Dict]], List[Dict]],
+        mark_error: Callable[[List[Dict], Exception], None],
+        plan: Callable[[List[Dict]], BatchPlan],
+        estimate_batch_tokens: Callable[[List[Dict]], int],
+        output_columns: List[str],
+        is_cached: Optional[Callable[[List[Dict]], bool]] = None,
+        requests_per_batch: int = 1,
+        max_in_flight: int = 4,
+        requests_per_minute: float = 15,
+        tokens_per_minute: float = 1_000_000,
+    ):
+        self.name = name
+        self.model_id = model_id
+        self.process_batch = process_batch
+        self.mark_error = mark_error
+        self.plan = plan
+        self.estimate_batch_tokens = estimate_batch_tokens
+        self.output_columns = output_columns
+        self.is_cached = is_cached
+        self.requests_per_batch = requests_per_batch
+        self.max_in_flight = max_in_flight
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+
+    def run_batch(self, batch: List[Dict]) -> List[Dict]:
+        """Process one batch, turning an unexpected failure into error rows like the scripts do"""
+        try:
+            return self.process_batch(batch)
+        except Exception as e:
+            print(f"!! Critical Error in {self.name} stage: {e}")
+            self.mark_error(batch, e)
+            return batch
+
+
+def lore_stage(client, context_store: Optional[ContextStore] = None) -> Stage:
+    # No limiter for the gatherer: each batch reserves both of its requests, the search included
+    gatherer = correct_lore.ContextGatherer(context_store)
+    return Stage(
+        "lore",
+        correct_lore.MODEL_ID,
+        lambda batch: correct_lore.process_item_batch(client, batch, len(batch), gatherer),
+        correct_lore.mark_batch_error,
+        correct_lore.plan_item_batches,
+        correct_lore.estimate_batch_tokens,
+        output_columns=[],  # Region and Lore are corrected in place
+        is_cached=lambda batch: correct_lore.is_cached(client, batch, context_store),
+        requests_per_batch=2,
+        max_in_flight=correct_lore.MAX_IN_FLIGHT,
+        requests_per_minute=correct_lore.REQUESTS_PER_MINUTE,
+        tokens_per_minute=correct_lore.TOKENS_PER_MINUTE,
+    )
+
+
+def dnd5e_stage(client) -> Stage:
+    return Stage(
+        "5e",
+        correct_to_5e.MODEL_ID,
+        lambda batch: correct_to_5e.process_item_batch(client, batch, batch_size=len(batch)),
+        correct_to_5e.mark_batch_error,
+        correct_to_5e.plan_item_batches,
+        correct_to_5e.estimate_batch_tokens,
+        output_columns=[correct_to_5e.OUTPUT_DESCRIPTION_COLUMN],
+        is_cached=lambda batch: correct_to_5e.is_cached(client, batch),
+        max_in_flight=correct_to_5e.MAX_IN_FLIGHT,
+        requests_per_minute=correct_to_5e.REQUESTS_PER_MINUTE,
+        tokens_per_minute=correct_to_5e.TOKENS_PER_MINUTE,
+    )
+
+
+def osr_stage(client) -> Stage:
+    return Stage(
+        "osr",
+        generate_osr_powers.MODEL_ID,
+        lambda batch: generate_osr_powers.process_item_batch(client, batch, batch_size=len(batch)),
+        generate_osr_powers.mark_batch_error,
+        generate_osr_powers.plan_item_batches,
+        generate_osr_powers.estimate_batch_tokens,
+        output_columns=["OSRPower"],
+        is_cached=lambda batch: generate_osr_powers.is_cached(client, batch),
+        max_in_flight=generate_osr_powers.MAX_IN_FLIGHT,
+        requests_per_minute=generate_osr_powers.REQUESTS_PER_MINUTE,
+        tokens_per_minute=generate_osr_powers.TOKENS_PER_MINUTE,
+    )
+
+
+STAGE_FACTORIES = {"lore": lore_stage, "5e": dnd5e_stage, "osr": osr_stage}
+
+# --- Engine ---
+
+
+async def replan_stream(stage: Stage, inbox: asyncio.Queue):
+    """
+    Re-batch items arriving from the previous stage with this stage's own planner.
+
+    Every batch except the last (possibly underfilled) one is released as soon as it is
+    complete; the remainder waits for more items or for the upstream stage to finish.
+    """
+    buffer: List[Dict] = []
+    while True:
+        chunk = await inbox.get()
+        if chunk is None:
+            break
+        buffer.extend(chunk)
+        batches = stage.plan(buffer).batches
+        for batch in batches[:-1]:
+            yield batch
+        buffer = batches[-1] if batches else []
+    if buffer:
+        yield buffer
+
+
+async def run_stage(stage: Stage, inbox: asyncio.Queue, outbox: asyncio.Queue, limiter: RateLimiter):
+    """Run one stage until its inbox is exhausted, forwarding finished batches in input order"""
+
+    async def forward(index: int, results: List[Dict]):
+        await outbox.put(results)
+
+    await run_batch_stream(
+        replan_stream(stage, inbox),
+        stage.run_batch,
+        forward,
+        stage.estimate_batch_tokens,
+        limiter=limiter,
+        max_in_flight=stage.max_in_flight,
+        requests_per_batch=stage.requests_per_batch,
+        is_cached=stage.is_cached,
+        label=stage.name,
+    )
+    await outbox.put(None)
+
+
+async def run_pipeline(
+    items: Iterable[Dict],
+    stages: List[Stage],
+    on_items_done: Callable[[List[Dict]], None],
+    limiters: Dict[str, RateLimiter],
+):
+    """
+    Stream items through all stages concurrently.
+
+    Stages are connected by bounded queues, so batch N of a later stage runs while batch
+    N+1 is still in an earlier one and end-to-end time approaches that of the slowest stage.
+    Stages that call the same model share one rate limiter, since they share its quota.
+    """
+    queues = [asyncio.Queue(maxsize=QUEUE_BATCHES) for _ in range(len(stages) + 1)]
+
+    async def feed():
+        for batch in iter_planned_batches(items, stages[0].plan):
+            await queues[0].put(batch)
+        await queues[0].put(None)
+
+    async def drain():
+        while True:
+            chunk = await queues[-1].get()
+            if chunk is None:
+                break
+            on_items_done(chunk)
+
+    workers = [
+        run_stage(stage, queues[i], queues[i + 1], limiters[stage.model_id])
+        for i, stage in enumerate(stages)
+    ]
+    await asyncio.gather(feed(), drain(), *workers)
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Run the lore -> 5e -> OSR enrichment stages as one streaming pipeline"
+    )
+    parser.add_argument("input_csv", nargs="?", default=DEFAULT_INPUT_CSV)
+    parser.add_argument("output_csv", nargs="?", default=DEFAULT_OUTPUT_CSV)
+    parser.add_argument(
+        "--stages",
+        default=DEFAULT_STAGES,
+        help=f"Comma separated stages in order, from {sorted(STAGE_FACTORIES)} (default: {DEFAULT_STAGES})",
+    )
+    add_api_options(parser, METRICS_PATH)
+    add_shard_option(parser)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    """Read the catalog once, stream it through every stage and write one QUOTE_ALL CSV"""
+    args = parse_args(argv)
+    stage_names = [name.strip() for name in args.stages.split(",") if name.strip()]
+    unknown = [name for name in stage_names if name not in STAGE_FACTORIES]
+    if unknown or not stage_names:
+        print(f"Error: Unknown stages {unknown}. Choose from {sorted(STAGE_FACTORIES)}.")
+        return
+
+    cache = None
+    context_store = None
+    key_pool = None
+    recovery = RecoveryStats()
+    metrics = MetricsRecorder(args.metrics_jsonl, args.metrics_prom)
+    try:
+        if args.key_pool:
+            key_pool = KeyPool.load(
+                args.key_pool,
+                lambda api_key: genai.Client(api_key=api_key),
+                correct_to_5e.REQUESTS_PER_MINUTE,
+                correct_to_5e.TOKENS_PER_MINUTE,
+            )
+            client = PooledClient(key_pool)
+        else:
+            client = correct_to_5e.setup_api()
+        if USE_RESPONSE_CACHE:
+            cache = ResponseCache(CACHE_PATH)
+            client = CachedClient(client, cache)
+        client = MetricsClient(client, metrics)
+        client = RetryingClient(client, recovery)  # Outermost, so every attempt is recorded
+        if "lore" in stage_names and correct_lore.USE_CONTEXT_STORE:
+            context_store = ContextStore(correct_lore.CONTEXT_STORE_PATH)
+        factories = dict(STAGE_FACTORIES, lore=lambda client: lore_stage(client, context_store))
+        stages = [factories[name](client) for name in stage_names]
+
+        headers = read_csv_header(args.input_csv)
+        # Rows are streamed as records of one schema, with room for every stage's output columns
+        schema = ItemSchema(headers + [col for stage in stages for col in stage.output_columns])
+
+        def read_rows():
+            rows = iter_item_records(args.input_csv, schema=schema)
+            return args.shard.select(rows) if args.shard else rows
+
+        fieldnames = list(headers)
+        for stage in stages:
+            # Later stages see enriched rows; planning them on the input is a close estimate
+            plan = summarize_plan(read_rows(), stage.plan)
+            if plan.item_count == 0:
+                print("Input file is empty. Exiting.")
+                return
+            plan.report(f"{stage.name} plan")
+            fieldnames += [col for col in stage.output_columns if col not in fieldnames]
+        print(f"Running stages: {' -> '.join(stage_names)}")
+        if args.shard:
+            print(f"Shard {args.shard}: only rows whose item name hashes to this shard are included.")
+
+        limiters: Dict[str, RateLimiter] = {}
+        for stage in stages:
+            # With a key pool, each model's limits are the summed quotas of its keys
+            stage.requests_per_minute, stage.tokens_per_minute, stage.max_in_flight = pool_limits(
+                client, stage.model_id, stage.requests_per_minute, stage.tokens_per_minute, stage.max_in_flight
+            )
+            if stage.model_id not in limiters:
+                limiters[stage.model_id] = RateLimiter(
+                    stage.requests_per_minute, stage.tokens_per_minute
+                )
+
+        # Chunks arrive in input order; the output is replaced only when the pipeline completes
+        with OrderedCsvWriter(args.output_csv, fieldnames, quoting=csv.QUOTE_ALL) as writer:
+            chunk_index = itertools.count()
+
+            def write_items(chunk: List[Dict]):
+                writer.write_batch(next(chunk_index), chunk)
+
+            asyncio.run(run_pipeline(read_rows(), stages, write_items, limiters))
+
+        print(f"\nPipeline complete. Results saved to '{args.output_csv}'")
+
+    except FileNotFoundError:
+        print(f"Error: Input file '{args.input_csv}' not found")
+    except ValueError as ve:
+        print(f"Configuration Error: {ve}")
+    except Exception as e:
+        import traceback
+
+        print(f"An unexpected error occurred: {e}")
+        traceback.print_exc()
+    finally:
+        metrics.print_summary()
+        metrics.close()
+        recovery.print_report()
+        if key_pool:
+            key_pool.print_report()
+        if context_store:
+            context_store.print_stats()
+            context_store.close()
+        if cache:
+            cache.print_stats()
+            cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, Optional
+
+from response_parsing import strip_code_fence
+
+# --- Configuration ---
+DEFAULT_CACHE_PATH = "gemini_cache.sqlite"
+DEFAULT_MAX_SIZE_MB = 200  # Least recently used entries are evicted above this size
+DEFAULT_MAX_AGE_DAYS = 90  # Entries older than this are evicted
+EVICT_EVERY_N_WRITES = 100
+
+# --- Functions ---
+
+
+def schema_fingerprint(schema: Any) -> str:
+    """Stable text representation of a response schema (pydantic model, dict or None)"""
+    if schema is None:
+        return ""
+    if hasattr(schema, "model_json_schema"):
+        return json.dumps(schema.model_json_schema(), sort_keys=True)
+    if isinstance(schema, dict):
+        return json.dumps(schema, sort_keys=True, default=str)
+    return repr(schema)
+
+
+def config_schema(config: Any) -> Any:
+    """Extract the response schema from a dict or GenerateContentConfig"""
+    if config is None:
+        return None
+    if isinstance(config, dict):
+        return config.get("response_schema")
+    return getattr(config, "response_schema", None)
+
+
+def make_cache_key(model_id: str, schema: Any, prompt: str) -> str:
+    """Content-addressed key for a request; the prompt already embeds every per-item input field"""
+    digest = hashlib.sha256()
+    for part in (model_id, schema_fingerprint(schema), prompt):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+def response_text(response: Any) -> Optional[str]:
+    """Return the first text part of a generate_content response, if any"""
+    try:
+        if response.candidates and response.candidates[0].content.parts:
+            return response.candidates[0].content.parts[0].text
+    except AttributeError:
+        pass
+    return None
+
+
+class ResponseCache:
+    """On-disk SQLite cache of model response texts with size/age based eviction"""
+
+    def __init__(
+        self,
+        path: str = DEFAULT_CACHE_PATH,
+        max_size_mb: float = DEFAULT_MAX_SIZE_MB,
+        max_age_days: float = DEFAULT_MAX_AGE_DAYS,
+    ):
+        self.path = path
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.max_age_seconds = max_age_days * 24 * 3600
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self._lock = threading.Lock()  # Async mode calls the cache from worker threads
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model_id TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                hit_count INTEGER NOT NULL DEFAULT 0
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_accessed ON responses (accessed_at)")
+        self._conn.commit()
+        self.evict()
+
+    def contains(self, key: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        return row is not None and time.time() - row[0] <= self.max_age_seconds
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.max_age_seconds:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE responses SET accessed_at = ?, hit_count = hit_count + 1 WHERE key = ?",
+                (now, key),
+            )
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, model_id: str, value: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model_id, value, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model_id, value, len(value.encode("utf-8")), now, now),
+            )
+            self._conn.commit()
+            self.writes += 1
+            should_evict = self.writes % EVICT_EVERY_N_WRITES == 0
+        if should_evict:
+            self.evict()
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones until under the size limit"""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM responses WHERE created_at < ?", (time.time() - self.max_age_seconds,)
+            )
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_size_bytes:
+                excess = total - self.max_size_bytes
+                doomed = []
+                for key, size in self._conn.execute(
+                    "SELECT key, size FROM responses ORDER BY accessed_at ASC"
+                ):
+                    if excess <= 0:
+                        break
+                    doomed.append((key,))
+                    excess -= size
+                self._conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "size_mb": size / (1024 * 1024),
+        }
+
+    def print_stats(self):
+        s = self.stats()
+        print(
+            f"Response cache: {s['hits']} hits, {s['misses']} misses ({s['hit_rate']:.0%} hit rate), "
+            f"{s['entries']} entries, {s['size_mb']:.1f} MB in '{self.path}'"
+        )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CachedResponse:
+    """Minimal stand-in for GenerateContentResponse rebuilt from cached text"""
+
+    def __init__(self, text: str, schema: Any = None):
+        self.text = text
+        self._schema = schema
+        part = SimpleNamespace(text=text)
+        content = SimpleNamespace(parts=[part], to_dict=lambda: {"parts": [{"text": text}]})
+        self.candidates = [SimpleNamespace(content=content, finish_reason=None, safety_ratings=None)]
+
+    @property
+    def parsed(self):
+        if self._schema is not None and hasattr(self._schema, "model_validate_json"):
+            return self._schema.model_validate_json(self.text)
+        return None
+
+
+class CachedModels:
+    """Drop-in for `client.models` that answers repeated requests from a ResponseCache"""
+
+    def __init__(self, models: Any, cache: ResponseCache):
+        self._models = models
+        self.cache = cache
+
+    def is_cached(self, model: str, contents: str, config: Any = None) -> bool:
+        if self.cache.contains(make_cache_key(model, config_schema(config), contents)):
+            return True
+        # The wrapped models may answer without the API too (bulk_jobs.JobResultsModels)
+        checker = getattr(self._models, "is_cached", None)
+        return bool(checker and checker(model, contents, config))
+
+    def generate_content(self, model: str, contents: str, config: Any = None):
+        schema = config_schema(config)
+        key = make_cache_key(model, schema, contents)
+        cached_text = self.cache.get(key)
+        if cached_text is not None:
+            return CachedResponse(cached_text, schema)
+
+        response = self._models.generate_content(model=model, contents=contents, config=config)
+        text = response_text(response)
+        if text and _is_valid_for_schema(text, schema):
+            self.cache.put(key, model, text)
+        return response
+
+
+class CachedClient:
+    """Wraps a genai.Client so every generate_content call goes through the response cache"""
+
+    def __init__(self, client: Any, cache: ResponseCache):
+        self._client = client
+        self.cache = cache
+        self.models = CachedModels(client.models, cache)
+
+
+def _is_valid_for_schema(text: str, schema: Any) -> bool:
+    """Only cache responses that parse, so a malformed answer is retried on the next run"""
+    if schema is None:
+        return True
+    try:
+        if hasattr(schema, "model_validate_json"):
+            schema.model_validate_json(strip_code_fence(text))
+        else:
+            json.loads(strip_code_fence(text))
+        return True
+    except Exception:
+        return False
+
+
+def batch_is_cached(client: Any, model: str, contents: str, config: Any = None) -> bool:
+    """True when `client` is cache-backed and already holds the answer for this request"""
+    # Wrappers around a CachedClient (e.g. telemetry.MetricsClient) forward is_cached
+    checker = getattr(getattr(client, "models", None), "is_cached", None)
+    return bool(checker and checker(model, contents, config))
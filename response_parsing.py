@@ -0,0 +1,105 @@
+import functools
+import typing
+from typing import Any, List, Optional
+
+from pydantic import TypeAdapter, ValidationError
+from pydantic_core import from_json
+
+# --- Configuration ---
+ITEMS_FIELD = "items"  # Every batch schema wraps its results in a list under this field
+COMPLETE_OUTCOMES = ("ok", "fenced")
+
+# --- Functions ---
+
+
+def strip_code_fence(text: str) -> str:
+    """Remove a ```json ... ``` wrapper the model sometimes adds despite the instructions"""
+    stripped = text.strip()
+    if stripped.startswith("```json"):
+        return stripped[7:-3].strip()
+    if stripped.startswith("```"):
+        return stripped[3:-3].strip()
+    return stripped
+
+
+class ParsedBatch:
+    """Item models recovered from one response, and how the response parsed"""
+
+    def __init__(self, items: List[Any], outcome: str):
+        self.items = items
+        self.outcome = outcome  # ok, fenced, salvaged, empty, invalid_json or schema_mismatch
+
+    @property
+    def complete(self) -> bool:
+        return self.outcome in COMPLETE_OUTCOMES
+
+
+class BatchParser:
+    """
+    Precompiled validators for a batch schema (a model with an `items` list).
+
+    The raw response is validated in one pass by pydantic-core, without building an
+    intermediate dict with json.loads. A response that is cut off or otherwise does not
+    validate as a whole is parsed leniently instead, keeping every item object that is
+    complete and valid, so only the lost items need to be requested again.
+    """
+
+    def __init__(self, schema: Any):
+        self.schema = schema
+        self._batch = TypeAdapter(schema)
+        self._item = TypeAdapter(typing.get_args(schema.model_fields[ITEMS_FIELD].annotation)[0])
+
+    def parse(self, text: Optional[str]) -> ParsedBatch:
+        if not text or not text.strip():
+            return ParsedBatch([], "empty")
+        try:
+            return ParsedBatch(self._batch.validate_json(text).items, "ok")
+        except ValidationError as e:
+            error = e
+        stripped = strip_code_fence(text)
+        if stripped != text.strip():
+            try:
+                return ParsedBatch(self._batch.validate_json(stripped).items, "fenced")
+            except ValidationError as e:
+                error = e
+
+        items = self.salvage(stripped)
+        if items:
+            return ParsedBatch(items, "salvaged")
+        invalid_json = any(detail["type"] == "json_invalid" for detail in error.errors())
+        return ParsedBatch([], "invalid_json" if invalid_json else "schema_mismatch")
+
+    def salvage(self, text: str) -> List[Any]:
+        """Valid item objects of a truncated or partly invalid response, in response order"""
+        try:
+            # Incomplete trailing strings are dropped, so a cut-off object lacks a field
+            data = from_json(text, allow_partial=True)
+        except ValueError:
+            return []
+        if isinstance(data, dict):
+            data = data.get(ITEMS_FIELD)
+        if not isinstance(data, list):
+            return []
+
+        items = []
+        for value in data:
+            try:
+                items.append(self._item.validate_python(value))
+            except ValidationError:
+                continue
+        return items
+
+
+@functools.lru_cache(maxsize=None)
+def _compiled_parser(schema: type) -> Optional[BatchParser]:
+    model_fields = getattr(schema, "model_fields", None)
+    if not isinstance(model_fields, dict) or ITEMS_FIELD not in model_fields:
+        return None
+    return BatchParser(schema)
+
+
+def parser_for(schema: Any) -> Optional[BatchParser]:
+    """Shared BatchParser of a batch schema, or None for schemas without an `items` list"""
+    if not isinstance(schema, type):
+        return None
+    return _compiled_parser(schema)
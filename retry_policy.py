@@ -0,0 +1,179 @@
+import random
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional
+
+# --- Configuration ---
+MAX_ATTEMPTS = 5  # Tries per call before a transient error is given up on
+BASE_DELAY = 2.0  # Seconds; the backoff ceiling doubles after every failed attempt
+MAX_DELAY = 60.0
+TRANSIENT_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+# Per-thread/task state of the batch being recovered; see process_with_recovery()
+_recovery: ContextVar[Optional[Dict[str, bool]]] = ContextVar("recovery", default=None)
+
+# --- Functions ---
+
+
+def is_transient(error: Exception) -> bool:
+    """Rate limits, server errors and timeouts are worth retrying; bad requests are not"""
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if isinstance(code, int):
+        return code in TRANSIENT_STATUS_CODES
+    return isinstance(error, (TimeoutError, ConnectionError))
+
+
+def no_recovery():
+    """
+    Called by a client that can only answer a fixed set of requests, e.g. ingested bulk job
+    results: the batch being processed is neither re-sent nor split, since no smaller or
+    repeated request could be answered either.
+    """
+    state = _recovery.get()
+    if state is not None:
+        state["gave_up"] = True
+
+
+class RecoveryStats:
+    """API calls spent on backoff retries and on re-sending parts of failed batches"""
+
+    def __init__(self):
+        self.calls = 0
+        self.retries = 0
+        self.gave_up = 0
+        self.bisect_calls = 0
+        self.split_batches = 0
+        self.items_recovered = 0
+        self.items_failed = 0
+        self._lock = threading.Lock()
+
+    def add(self, **counts: int):
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    @property
+    def recovery_calls(self) -> int:
+        return self.retries + self.bisect_calls
+
+    def print_report(self):
+        if not self.calls:
+            return
+        print(
+            f"Recovery: {self.recovery_calls} of {self.calls} API calls spent on recovery "
+            f"({self.retries} backoff retries, {self.bisect_calls} calls re-sending failed items, "
+            f"{self.split_batches} batches split); {self.items_recovered} items recovered, "
+            f"{self.items_failed} left as errors, {self.gave_up} calls gave up after {MAX_ATTEMPTS} attempts"
+        )
+
+
+class RetryingModels:
+    """Drop-in for `client.models` that retries transient errors with exponential backoff"""
+
+    def __init__(self, models: Any, stats: RecoveryStats, max_attempts: int, base_delay: float, max_delay: float):
+        self._models = models
+        self.stats = stats
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def is_cached(self, model: str, contents: str, config: Any = None) -> bool:
+        checker = getattr(self._models, "is_cached", None)
+        return bool(checker and checker(model, contents, config))
+
+    def generate_content(self, model: str, contents: str, config: Any = None):
+        state = _recovery.get()
+        for attempt in range(self.max_attempts):
+            resending = attempt == 0 and state is not None and state["resending"]
+            self.stats.add(calls=1, retries=int(attempt > 0), bisect_calls=int(resending))
+            try:
+                return self._models.generate_content(model=model, contents=contents, config=config)
+            except Exception as e:
+                if not is_transient(e) or attempt == self.max_attempts - 1:
+                    if is_transient(e):
+                        self.stats.add(gave_up=1)
+                        if state is not None:
+                            state["gave_up"] = True
+                    raise
+                # Full jitter keeps concurrent batches from retrying in lockstep
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+                print(f"Transient error ({e}); retrying in {delay:.1f}s (attempt {attempt + 2}/{self.max_attempts})")
+                time.sleep(delay)
+
+
+class RetryingClient:
+    """Wraps a genai.Client (or another wrapper) so transient errors are retried"""
+
+    def __init__(
+        self,
+        client: Any,
+        stats: Optional[RecoveryStats] = None,
+        max_attempts: int = MAX_ATTEMPTS,
+        base_delay: float = BASE_DELAY,
+        max_delay: float = MAX_DELAY,
+    ):
+        self._client = client
+        self.recovery = stats or RecoveryStats()
+        self.models = RetryingModels(client.models, self.recovery, max_attempts, base_delay, max_delay)
+
+
+def process_with_recovery(
+    items: List[Dict],
+    process: Callable[[List[Dict]], List[Dict]],
+    needs_retry: Callable[[Dict], bool],
+    mark_error: Callable[[List[Dict], Exception], None],
+    stats: Optional[RecoveryStats] = None,
+) -> List[Dict]:
+    """
+    Run `process` on a batch and re-send only what failed, until single bad items are isolated.
+
+    `process` fills in the rows in place (as every process_item_batch does) and marks rows it
+    could not fill with error text recognised by `needs_retry`. Rows missing from an otherwise
+    good response are re-sent together; when the whole batch fails (an exception, or a
+    response that does not parse) it is split in half and each half is retried. A batch that
+    failed only because the API kept returning transient errors is not split, since smaller
+    requests would not help, and neither is one answered by a client that called
+    no_recovery(). Failed rows are restored to their input values before being
+    re-sent, so error text never leaks into a prompt.
+    """
+    stats = stats or RecoveryStats()
+    originals = [dict(item) for item in items]
+
+    def attempt(part: List[int], resending: bool = True) -> bool:
+        """Process the rows at these positions; returns whether re-sending them is pointless"""
+        state = {"gave_up": False, "resending": resending}
+        token = _recovery.set(state)
+        rows = [items[i] for i in part]
+        try:
+            process(rows)
+        except Exception as e:
+            mark_error(rows, e)
+        finally:
+            _recovery.reset(token)
+        return state["gave_up"]
+
+    def recover(part: List[int], gave_up: bool):
+        failed = [i for i in part if needs_retry(items[i])]
+        if not failed or len(part) == 1 or gave_up:
+            return
+        for i in failed:
+            items[i].clear()
+            items[i].update(originals[i])
+        if len(failed) < len(part):
+            recover(failed, attempt(failed))
+            return
+        stats.add(split_batches=1)
+        middle = len(part) // 2
+        for half in (part[:middle], part[middle:]):
+            recover(half, attempt(half))
+
+    positions = list(range(len(items)))
+    gave_up = attempt(positions, resending=False)
+    failed_before = sum(needs_retry(item) for item in items)
+    if failed_before and len(items) > 1 and not gave_up:
+        print(f"Recovering {failed_before} failed items of a batch of {len(items)}...")
+    recover(positions, gave_up)
+    failed_after = sum(needs_retry(item) for item in items)
+    stats.add(items_recovered=failed_before - failed_after, items_failed=failed_after)
+    return items
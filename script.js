@@ -21,11 +21,15 @@ document.addEventListener('DOMContentLoaded', function() {
     const newItemContainer = document.getElementById('newItemContainer');
     const deleteItemBtn = document.getElementById('deleteItemBtn'); // Get delete button
     const LOCAL_STORAGE_KEY = 'magicItemsAppState';
+    const BUNDLE_DIR = 'data/';
+    const BUNDLE_MANIFEST = BUNDLE_DIR + 'manifest.json'; // Written by build_bundle.py on deploy; lists the shards
 
     let leagueItems = [];
     let loadedFiles = [];
     let currentSort = 'nameAsc';
     let currentEditingItem = null;
+    let baseCatalog = null; // The sharded base catalog being shown, see loadCatalog()
+    let catalogIndex = null; // Prebuilt search index of the base catalog, see attachSearchIndex()
 
     function capitalize(text) {
         if (!text) return '';
@@ -74,6 +78,17 @@ document.addEventListener('DOMContentLoaded', function() {
             handleFilterAndSort();
             updateRegionFilter(leagueItems);
             updateLoadedFilesList();
+            // While the catalog is unchanged, the saved base items get their missing shards and the search index
+            const baseFile = loadedFiles.find(file => file.bundle);
+            if (baseFile) {
+                fetchJSON(BUNDLE_MANIFEST, { cache: 'no-cache' })
+                    .then(manifest => {
+                        if (manifest.sha256 === baseFile.bundle) {
+                            attachCatalog(baseFile, manifest);
+                        }
+                    })
+                    .catch(error => console.warn('No catalog manifest available:', error));
+            }
         } else {
             // No saved state, try loading base-items.csv
             itemsContainer.innerHTML = '<div class="loading">Loading base items...</div>';
@@ -82,8 +97,167 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
-    // Function to fetch and load base-items.csv
+    // Load the base items from the prebuilt shards, or from base-items.csv when there are none
     function fetchAndLoadBaseItems() {
+        fetchJSON(BUNDLE_MANIFEST, { cache: 'no-cache' }).then(loadCatalog, error => {
+            console.warn('No prebuilt data shards, parsing base-items.csv instead:', error);
+            fetchAndLoadBaseItemsCSV();
+        });
+    }
+
+    function fetchJSON(url, options) {
+        return fetch(url, options).then(response => {
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            return response.json();
+        });
+    }
+
+    // The manifest is revalidated on every load. It lists the catalog's shards, one or more
+    // per region with content-hashed file names, so the browser keeps each cached until an
+    // item in it changes, and only the shards of the region being shown are fetched.
+    function loadCatalog(manifest) {
+        let fileInfo = loadedFiles.find(f => f.name === manifest.source);
+        if (!fileInfo) {
+            fileInfo = { name: manifest.source, id: generateUniqueId(), count: manifest.items };
+            loadedFiles.push(fileInfo);
+        }
+        fileInfo.bundle = manifest.sha256;
+        fileInfo.shards = [];
+        attachCatalog(fileInfo, manifest);
+        updateLoadedFilesList();
+    }
+
+    function attachCatalog(fileInfo, manifest) {
+        baseCatalog = { fileId: fileInfo.id, fileInfo: fileInfo, manifest: manifest, requested: new Set(), pending: 0, view: null };
+        fileInfo.shards = fileInfo.shards || [];
+        updateRegionFilter(leagueItems);
+        loadShards();
+        loadSearchIndex(manifest);
+    }
+
+    // Fetch the shards the current region filter needs that are not loaded yet
+    function loadShards() {
+        if (!baseCatalog) return;
+        const catalog = baseCatalog;
+        const regionTerm = categoryFilter.value;
+        catalog.manifest.shards
+            .filter(shard => regionTerm === '' || shard.region === regionTerm)
+            .filter(shard => !catalog.fileInfo.shards.includes(shard.name) && !catalog.requested.has(shard.name))
+            .forEach(shard => {
+                catalog.requested.add(shard.name);
+                catalog.pending++;
+                fetchJSON(BUNDLE_DIR + shard.name)
+                    .then(data => {
+                        catalog.pending--;
+                        addShard(catalog, shard, data);
+                    }, error => {
+                        catalog.pending--;
+                        catalog.requested.delete(shard.name); // Retried on the next filter change
+                        console.error(`Error fetching ${shard.name}:`, error);
+                        if (catalog === baseCatalog) handleFilterAndSort();
+                    });
+            });
+    }
+
+    // Shard rows are already validated and use canonical field names, so no header lookup is needed
+    function addShard(catalog, shard, data) {
+        if (catalog !== baseCatalog) return; // The base file was removed meanwhile
+        const fileId = catalog.fileId;
+        const processedData = data.rows.map((row, i) => {
+            const item = { id: `${fileId}-${shard.start + i}` };
+            data.fields.forEach((field, j) => { item[field] = row[j]; });
+            item.row = shard.start + i; // Position in the catalog, which the search index refers to
+            item.fileId = fileId;
+            item.source = 'csv';
+            return item;
+        });
+        catalog.fileInfo.shards.push(shard.name);
+        leagueItems = leagueItems.concat(processedData);
+        invalidateIndexedView();
+        handleFilterAndSort();
+        updateRegionFilter(leagueItems);
+        if (catalog.pending === 0) {
+            saveStateToLocalStorage(); // Once the shards requested together are in, rather than per shard
+        }
+    }
+
+    function loadSearchIndex(manifest) {
+        if (!manifest.index) return;
+        fetchJSON(BUNDLE_DIR + manifest.index)
+            .then(attachSearchIndex)
+            .catch(error => console.warn('No search index available, searching by scanning instead:', error));
+    }
+
+    // Search and sorting of the base items come from the index from now on
+    function attachSearchIndex(index) {
+        if (!baseCatalog || index.catalog !== baseCatalog.manifest.sha256) return;
+        const ranks = {};
+        for (const [sortOrder, order] of Object.entries(index.orders)) {
+            const rank = new Int32Array(order.length);
+            order.forEach((row, position) => { rank[row] = position; });
+            ranks[sortOrder] = rank;
+        }
+        catalogIndex = {
+            tokens: index.tokens,
+            postings: index.postings,
+            orders: index.orders,
+            ranks: ranks
+        };
+        handleFilterAndSort();
+    }
+
+    // The base items by catalog row, and every other (uploaded, added or edited) item.
+    // Rebuilt after leagueItems changes, never per keystroke.
+    function catalogView() {
+        if (!baseCatalog) return null;
+        if (!baseCatalog.view) {
+            const manifest = baseCatalog.manifest;
+            const rowItems = new Array(manifest.items);
+            const others = [];
+            let present = 0;
+            leagueItems.forEach(item => {
+                if (item.fileId === baseCatalog.fileId && item.row !== undefined) {
+                    rowItems[item.row] = item;
+                    present++;
+                } else {
+                    others.push(item);
+                }
+            });
+            const loaded = manifest.shards.filter(shard => baseCatalog.fileInfo.shards.includes(shard.name));
+            const expected = loaded.reduce((total, shard) => total + shard.items, 0);
+            baseCatalog.view = {
+                rowItems: rowItems,
+                others: others,
+                unloaded: manifest.shards.filter(shard => !loaded.includes(shard)),
+                complete: present === expected // No base item was edited or removed
+            };
+        }
+        return baseCatalog.view;
+    }
+
+    function invalidateIndexedView() {
+        if (baseCatalog) baseCatalog.view = null;
+    }
+
+    function addBaseItems(fileInfo, processedData) {
+        // Avoid adding duplicate base file info if somehow loaded again
+        if (!loadedFiles.some(f => f.name === fileInfo.name)) {
+             loadedFiles.push(fileInfo);
+        }
+        leagueItems = [...leagueItems, ...processedData]; // Add base items
+        invalidateIndexedView();
+
+        handleFilterAndSort();
+        updateRegionFilter(leagueItems);
+        updateLoadedFilesList();
+        saveStateToLocalStorage(); // Save state after loading base items
+        console.log(`Loaded ${fileInfo.name} automatically.`);
+    }
+
+    // Function to fetch and load base-items.csv
+    function fetchAndLoadBaseItemsCSV() {
         const baseFileName = 'base-items.csv';
         fetch(baseFileName)
             .then(response => {
@@ -110,19 +284,7 @@ document.addEventListener('DOMContentLoaded', function() {
                             id: generateUniqueId(), // Give it a unique ID
                             count: results.data.length
                         };
-                        // Avoid adding duplicate base file info if somehow loaded again
-                        if (!loadedFiles.some(f => f.name === baseFileName)) {
-                             loadedFiles.push(fileInfo);
-                        }
-
-                        const processedData = processCSVData(results.data, fileInfo.id);
-                        leagueItems = [...leagueItems, ...processedData]; // Add base items
-
-                        handleFilterAndSort();
-                        updateRegionFilter(leagueItems);
-                        updateLoadedFilesList();
-                        saveStateToLocalStorage(); // Save state after loading base items
-                        console.log(`Loaded ${baseFileName} automatically.`);
+                        addBaseItems(fileInfo, processCSVData(results.data, fileInfo.id));
                     },
                     error: function(error) {
                         console.error(`Error parsing ${baseFileName}:`, error);
@@ -140,7 +302,10 @@ document.addEventListener('DOMContentLoaded', function() {
     uploadBtn.addEventListener('click', () => excelFileInput.click());
     excelFileInput.addEventListener('change', handleFileUpload);
     searchInput.addEventListener('input', handleFilterAndSort);
-    categoryFilter.addEventListener('change', handleFilterAndSort);
+    categoryFilter.addEventListener('change', () => {
+        loadShards();
+        handleFilterAndSort();
+    });
     sortSelect.addEventListener('change', () => {
         currentSort = sortSelect.value;
         handleFilterAndSort();
@@ -190,6 +355,7 @@ document.addEventListener('DOMContentLoaded', function() {
         };
 
         leagueItems.push(newItem);
+        invalidateIndexedView();
         handleFilterAndSort();
         updateRegionFilter(leagueItems);
         addItemModal.style.display = 'none';
@@ -215,6 +381,8 @@ document.addEventListener('DOMContentLoaded', function() {
             leagueItems[itemIndex].descriptionLore = editedDescription;
             leagueItems[itemIndex].lore = editedLore;
             leagueItems[itemIndex].image = editedImageUrl;
+            delete leagueItems[itemIndex].row; // No longer matches the prebuilt search index
+            invalidateIndexedView();
 
             modal.style.display = 'none';
             handleFilterAndSort();
@@ -237,6 +405,7 @@ document.addEventListener('DOMContentLoaded', function() {
             const itemIndex = leagueItems.findIndex(item => item.id === currentEditingItem.id);
             if (itemIndex !== -1) {
                 leagueItems.splice(itemIndex, 1); // Remove item from array
+                invalidateIndexedView();
 
                 // Update UI and save state
                 modal.style.display = 'none';
@@ -258,26 +427,99 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     function handleFilterAndSort() {
+        const view = catalogIndex && catalogView();
+        const indexedItems = view && searchIndexed(view);
+        if (indexedItems) {
+            displayItems(indexedItems);
+            return;
+        }
         const filteredItems = filterItems();
         const sortedItems = sortItems(filteredItems, currentSort);
         displayItems(sortedItems);
     }
 
+    function compareItems(a, b, sortOrder) {
+        switch(sortOrder) {
+            case 'nameAsc':
+                return a.name.localeCompare(b.name);
+            case 'nameDesc':
+                return b.name.localeCompare(a.name);
+            case 'regionAsc':
+                return a.region.localeCompare(b.region) || a.name.localeCompare(b.name);
+            case 'regionDesc': // Added Region Z-A sorting
+                return b.region.localeCompare(a.region) || a.name.localeCompare(b.name);
+            default:
+                return 0;
+        }
+    }
+
     function sortItems(items, sortOrder) {
-        return [...items].sort((a, b) => {
-            switch(sortOrder) {
-                case 'nameAsc':
-                    return a.name.localeCompare(b.name);
-                case 'nameDesc':
-                    return b.name.localeCompare(a.name);
-                case 'regionAsc':
-                    return a.region.localeCompare(b.region) || a.name.localeCompare(b.name);
-                case 'regionDesc': // Added Region Z-A sorting
-                    return b.region.localeCompare(a.region) || a.name.localeCompare(b.name);
-                default:
-                    return 0;
-            }
+        return [...items].sort((a, b) => compareItems(a, b, sortOrder));
+    }
+
+    // Lower-cased runs of letters and digits, as search_index.py tokenizes the catalog
+    function tokenize(text) {
+        return (text || '').toLowerCase().match(/[\p{L}\p{N}]+/gu) || [];
+    }
+
+    // Bundle rows with a word containing every search word: the union of the posting lists
+    // of the words containing it, intersected across search words. A superset of the items
+    // the search term is a substring of, which is what filterItems matches.
+    function matchingRows(index, queryTokens) {
+        let rows = null;
+        for (const queryToken of queryTokens) {
+            const matches = new Set();
+            index.tokens.forEach((token, i) => {
+                if (token.includes(queryToken)) index.postings[i].forEach(row => matches.add(row));
+            });
+            rows = rows === null ? Array.from(matches) : rows.filter(row => matches.has(row));
+            if (rows.length === 0) break;
+        }
+        return rows;
+    }
+
+    // The search of filterItems: the term is a substring of the name, lore or description
+    function matchesSearch(item, searchTerm, regionTerm) {
+        const nameMatch = item.name?.toLowerCase().includes(searchTerm);
+        const loreMatch = item.lore?.toLowerCase().includes(searchTerm);
+        const descMatch = item.descriptionLore?.toLowerCase().includes(searchTerm);
+        const regionMatch = regionTerm === '' || item.region === regionTerm;
+
+        return (nameMatch || loreMatch || descMatch) && regionMatch;
+    }
+
+    // Filtered and sorted items without scanning or re-sorting the catalog: the index narrows
+    // the base items down to candidates in presorted order, which are then checked as
+    // filterItems would, and the few others are filtered and merged in.
+    // Returns null when the index cannot answer, i.e. for a sort order it has no rank for.
+    function searchIndexed(view) {
+        const searchTerm = searchInput.value.toLowerCase();
+        const regionTerm = categoryFilter.value;
+        const queryTokens = tokenize(searchTerm);
+        const rank = catalogIndex.ranks[currentSort];
+        if (!rank) return null;
+
+        let rows;
+        if (queryTokens.length) {
+            rows = matchingRows(catalogIndex, queryTokens).sort((a, b) => rank[a] - rank[b]);
+        } else {
+            rows = catalogIndex.orders[currentSort];
+        }
+        const indexed = [];
+        rows.forEach(row => {
+            const item = view.rowItems[row];
+            if (item && matchesSearch(item, searchTerm, regionTerm)) indexed.push(item);
         });
+        const others = sortItems(view.others.filter(item => matchesSearch(item, searchTerm, regionTerm)), currentSort);
+        if (others.length === 0) return indexed;
+
+        const merged = [];
+        let i = 0;
+        let j = 0;
+        while (i < indexed.length && j < others.length) {
+            merged.push(compareItems(others[j], indexed[i], currentSort) < 0 ? others[j++] : indexed[i++]);
+        }
+        return merged.concat(indexed.slice(i), others.slice(j));
     }
 
     function handleFileUpload(event) {
@@ -314,6 +556,7 @@ document.addEventListener('DOMContentLoaded', function() {
 
                 const processedData = processCSVData(results.data, fileInfo.id);
                 leagueItems = [...leagueItems, ...processedData];
+                invalidateIndexedView();
 
                 handleFilterAndSort();
                 updateRegionFilter(leagueItems);
@@ -368,6 +611,10 @@ document.addEventListener('DOMContentLoaded', function() {
                     leagueItems = leagueItems.filter(item => item.fileId !== fileId);
                     if (leagueItems.length < initialLength) itemsRemoved = true;
                     loadedFiles = loadedFiles.filter(file => file.id !== fileId);
+                    if (baseCatalog && baseCatalog.fileId === fileId) {
+                        baseCatalog = null;
+                        catalogIndex = null;
+                    }
                 } else if (source === 'manual') {
                     const initialLength = leagueItems.length;
                     leagueItems = leagueItems.filter(item => item.source !== 'manual');
@@ -375,6 +622,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 }
 
                 if (itemsRemoved) {
+                    invalidateIndexedView();
                     updateLoadedFilesList();
                     handleFilterAndSort();
                     updateRegionFilter(leagueItems);
@@ -417,27 +665,41 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
-    function updateRegionFilter(items) {
-        const currentRegion = categoryFilter.value;
-        const regions = new Set();
+    // Items per region. The base items' counts come from the manifest while none was edited or
+    // removed, and shards that are not loaded yet count with the items the manifest lists.
+    function countRegions(items) {
+        const counts = new Map();
+        const view = catalogView();
+        if (view && view.complete) {
+            Object.entries(baseCatalog.manifest.regions).forEach(([region, count]) => counts.set(region, count));
+            items = view.others;
+        } else if (view) {
+            view.unloaded.forEach(shard => counts.set(shard.region, (counts.get(shard.region) || 0) + shard.items));
+        }
         items.forEach(item => {
             if (item.region) {
-                regions.add(item.region);
+                counts.set(item.region, (counts.get(item.region) || 0) + 1);
             }
         });
+        return counts;
+    }
+
+    function updateRegionFilter(items) {
+        const currentRegion = categoryFilter.value;
+        const regionCounts = countRegions(items);
 
         const defaultOption = categoryFilter.options[0];
         categoryFilter.innerHTML = '';
         categoryFilter.appendChild(defaultOption);
 
-        Array.from(regions).sort().forEach(region => {
+        Array.from(regionCounts.keys()).sort().forEach(region => {
             const option = document.createElement('option');
             option.value = region;
-            option.textContent = region;
+            option.textContent = `${region} (${regionCounts.get(region)})`;
             categoryFilter.appendChild(option);
         });
 
-        if (Array.from(regions).includes(currentRegion)) {
+        if (regionCounts.has(currentRegion)) {
             categoryFilter.value = currentRegion;
         }
     }
@@ -445,7 +707,10 @@ document.addEventListener('DOMContentLoaded', function() {
     function displayItems(items) {
         itemsContainer.innerHTML = '';
 
-        if (items.length === 0 && leagueItems.length > 0) {
+        if (items.length === 0 && baseCatalog && baseCatalog.pending > 0) {
+            itemsContainer.innerHTML = '<div class="loading">Loading base items...</div>';
+            return;
+        } else if (items.length === 0 && leagueItems.length > 0) {
             itemsContainer.innerHTML = '<div class="no-results">No items match your search/filter</div>';
             return;
         } else if (items.length === 0 && leagueItems.length === 0) {
@@ -483,14 +748,7 @@ document.addEventListener('DOMContentLoaded', function() {
         const searchTerm = searchInput.value.toLowerCase();
         const regionTerm = categoryFilter.value;
 
-        return leagueItems.filter(item => {
-            const nameMatch = item.name?.toLowerCase().includes(searchTerm);
-            const loreMatch = item.lore?.toLowerCase().includes(searchTerm);
-            const descMatch = item.descriptionLore?.toLowerCase().includes(searchTerm);
-            const regionMatch = regionTerm === '' || item.region === regionTerm;
-
-            return (nameMatch || loreMatch || descMatch) && regionMatch;
-        });
+        return leagueItems.filter(item => matchesSearch(item, searchTerm, regionTerm));
     }
 
     function showItemDetails(item) {
@@ -0,0 +1,68 @@
+import re
+import unicodedata
+from typing import Dict, List
+
+# --- Configuration ---
+INDEX_FORMAT = 2
+SEARCH_FIELDS = ["name", "lore", "descriptionLore"]  # The fields the page's search box looks at
+TOKEN_PATTERN = re.compile(r"[^\W_]+")  # Runs of letters and digits, like /[\p{L}\p{N}]+/u in script.js
+
+# --- Functions ---
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall((text or "").lower())
+
+
+def collation_key(text: str):
+    """Sort key approximating String.localeCompare: accents and case only break ties"""
+    folded = unicodedata.normalize("NFKD", text or "")
+    folded = "".join(c for c in folded if not unicodedata.combining(c)).casefold()
+    return (folded, text or "")
+
+
+def js_order(token: str) -> bytes:
+    """Key giving JavaScript's string order (UTF-16 code units), so tokens sort as on the page"""
+    return token.encode("utf-16-be")
+
+
+def sort_orders(rows: List[List[str]], fields: List[str]) -> Dict[str, List[int]]:
+    """Row ids in the order of each sort option of the page (see sortItems in script.js)"""
+    name = fields.index("name")
+    region = fields.index("region")
+    ids = range(len(rows))
+    by_name = sorted(ids, key=lambda i: collation_key(rows[i][name]))
+    return {
+        "nameAsc": by_name,
+        "nameDesc": sorted(ids, key=lambda i: collation_key(rows[i][name]), reverse=True),
+        "regionAsc": sorted(by_name, key=lambda i: collation_key(rows[i][region])),
+        # Regions Z-A, names still A-Z within a region
+        "regionDesc": sorted(by_name, key=lambda i: collation_key(rows[i][region]), reverse=True),
+    }
+
+
+def build_index(rows: List[List[str]], fields: List[str], catalog_sha256: str) -> Dict:
+    """
+    Search index of a catalog's rows, which are identified by their position.
+
+    `tokens` holds every word of the searched fields, sorted, and `postings[i]` lists
+    the rows containing `tokens[i]`, in row order; the page looks up the words
+    containing each search word to narrow the rows down before checking the search
+    term itself. `orders` has the rows presorted for every sort option, so the page
+    neither scans nor re-sorts the catalog per keystroke. The items per region are
+    counted in the manifest (see build_bundle).
+    """
+    positions = [fields.index(field) for field in SEARCH_FIELDS]
+    postings: Dict[str, List[int]] = {}
+    for row_id, row in enumerate(rows):
+        for token in dict.fromkeys(token for p in positions for token in tokenize(row[p])):
+            postings.setdefault(token, []).append(row_id)
+    tokens = sorted(postings, key=js_order)
+    return {
+        "format": INDEX_FORMAT,
+        "catalog": catalog_sha256,
+        "rows": len(rows),
+        "tokens": tokens,
+        "postings": [postings[token] for token in tokens],
+        "orders": sort_orders(rows, fields),
+    }
@@ -0,0 +1,66 @@
+import argparse
+import hashlib
+import os
+from typing import Dict, Iterable, Iterator
+
+from name_matching import normalize_name
+
+# --- Configuration ---
+NAME_COLUMN = "Item Name"
+SHARD_SUFFIX = ".shard-{index}-of-{count}"  # Inserted before the extension of a shared output path
+
+# --- Functions ---
+
+
+def shard_hash(row: Dict) -> int:
+    """Stable hash of a row's item name, the same on every machine and Python process"""
+    name = normalize_name(row.get(NAME_COLUMN) or "")
+    return int.from_bytes(hashlib.sha256(name.encode("utf-8")).digest()[:8], "big")
+
+
+class Shard:
+    """
+    One of `count` disjoint parts of a catalog, numbered from 1.
+
+    Rows are assigned by a hash of their normalized item name, so every node computes
+    the same partition without coordination, repeated and re-edited items always land
+    on the same node (keeping dedupe, delta runs and checkpoints per node valid), and
+    the parts are close to equal in size.
+    """
+
+    def __init__(self, index: int, count: int):
+        if count < 1 or not 1 <= index <= count:
+            raise ValueError(f"Shard {index}/{count} is out of range; use i/N with 1 <= i <= N")
+        self.index = index
+        self.count = count
+
+    @classmethod
+    def parse(cls, spec: str) -> "Shard":
+        """Parse an `i/N` option value"""
+        index, sep, count = spec.partition("/")
+        if not sep or not index.strip().isdigit() or not count.strip().isdigit():
+            raise ValueError(f"Invalid shard '{spec}'; expected i/N, e.g. 2/4")
+        return cls(int(index), int(count))
+
+    def owns(self, row: Dict) -> bool:
+        return shard_hash(row) % self.count == self.index - 1
+
+    def select(self, rows: Iterable[Dict]) -> Iterator[Dict]:
+        """Stream the rows of this shard, in input order"""
+        return (row for row in rows if self.owns(row))
+
+    def output_path(self, path: str) -> str:
+        """Per-shard variant of an output path shared by every node, e.g. items_5e.shard-2-of-4.csv"""
+        root, ext = os.path.splitext(path)
+        return root + SHARD_SUFFIX.format(index=self.index, count=self.count) + ext
+
+    def __str__(self) -> str:
+        return f"{self.index}/{self.count}"
+
+
+def shard_option(spec: str) -> Shard:
+    """argparse `type` for a --shard option"""
+    try:
+        return Shard.parse(spec)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
@@ -0,0 +1,191 @@
+import argparse
+import os
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from google import genai
+
+from batch_planner import BatchPlan, OfflineClient
+from bulk_jobs import JobResults, JobResultsClient
+from delta import DeltaIndex, report_duplicates, summarize_run
+from key_pool import KeyPool, PooledClient
+from response_cache import CachedClient, ResponseCache
+from retry_policy import RecoveryStats, RetryingClient
+from sharding import Shard, shard_option
+from telemetry import MetricsClient, MetricsRecorder
+
+# --- Configuration ---
+EXPORT_JOBS_HELP = "Write every request to this bulk job file instead of calling the API"
+
+# --- Functions ---
+
+
+def add_api_options(parser: argparse.ArgumentParser, metrics_path: str):
+    """--metrics-jsonl, --metrics-prom and --key-pool, shared by the scripts and the pipeline"""
+    parser.add_argument(
+        "--metrics-jsonl",
+        default=metrics_path,
+        help=f"Append one JSON record per API call to this file (default: {metrics_path})",
+    )
+    parser.add_argument(
+        "--metrics-prom", help="Also export run totals as a Prometheus textfile at this path"
+    )
+    parser.add_argument(
+        "--key-pool",
+        metavar="KEYS_JSON",
+        help="Spread requests over the API keys and per-key quotas listed in this JSON file",
+    )
+
+
+def add_shard_option(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--shard",
+        type=shard_option,
+        metavar="I/N",
+        help="Only process shard I of N; rows are assigned by a hash of their item name",
+    )
+
+
+def stage_parser(
+    description: str,
+    metrics_path: str,
+    resume: bool = True,
+    export_jobs_help: str = EXPORT_JOBS_HELP,
+) -> argparse.ArgumentParser:
+    """
+    The command line every stage script shares; scripts add their own options to it.
+
+    `resume` offers --resume, for the scripts that keep a checkpoint journal.
+    """
+    parser = argparse.ArgumentParser(description=description)
+    if resume:
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Skip items recorded in the checkpoint journal and keep appending to the output file",
+        )
+    parser.add_argument(
+        "--delta-from",
+        nargs=2,
+        metavar=("PREVIOUS_INPUT", "PREVIOUS_OUTPUT"),
+        help="Only send rows that are new or changed since the previous snapshot; copy the rest from its output",
+    )
+    add_api_options(parser, metrics_path)
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--plan",
+        action="store_true",
+        help="Build every prompt and print the expected requests, tokens and wall time without calling the API",
+    )
+    mode.add_argument("--export-jobs", metavar="JOBS_JSONL", help=export_jobs_help)
+    mode.add_argument(
+        "--ingest-results",
+        nargs="+",
+        metavar="RESULTS_JSONL",
+        help="Answer the requests from these bulk job results instead of calling the API",
+    )
+    parser.add_argument("--input", help="Input CSV file (asked for when omitted)")
+    parser.add_argument("--output", help="Output CSV file (asked for when omitted)")
+    add_shard_option(parser)
+    return parser
+
+
+def ask_paths(args: argparse.Namespace, default_input: str, default_output: str):
+    """The input and output CSV of a run, asked for when not given on the command line"""
+    input_csv_file = args.input or (
+        input(f"Enter input CSV filename (default: {default_input}): ") or default_input
+    )
+    output_csv_file = args.output or (
+        input(f"Enter output CSV filename (default: {default_output}): ") or default_output
+    )
+    return input_csv_file, output_csv_file
+
+
+class StageRun:
+    """
+    The API client of one script run and what it opens, reported and closed by close().
+
+    --plan and --export-jobs runs are offline: the client refuses every call, and no
+    metrics are written. An --ingest-results run answers from the bulk job results and
+    records no metrics either.
+    """
+
+    def __init__(self, args: argparse.Namespace, stage: str):
+        self.args = args
+        self.offline = args.plan or bool(args.export_jobs)
+        self.cache: Optional[ResponseCache] = None
+        self.key_pool: Optional[KeyPool] = None
+        self.job_results: Optional[JobResultsClient] = None
+        self.recovery = RecoveryStats()
+        record_metrics = not (self.offline or args.ingest_results)
+        self.metrics = MetricsRecorder(
+            args.metrics_jsonl if record_metrics else None,
+            args.metrics_prom if record_metrics else None,
+            stage=stage,
+        )
+
+    def open_client(
+        self,
+        setup_api: Callable[[], Any],
+        requests_per_minute: float,
+        tokens_per_minute: float,
+        cache_path: Optional[str],
+    ):
+        """
+        The client for the run's calls: job results, a key pool or `setup_api()`, behind
+        the response cache at `cache_path` (None for none), metrics and retries.
+        """
+        args = self.args
+        if args.ingest_results:
+            self.job_results = JobResultsClient(JobResults.load(args.ingest_results))
+            client = self.job_results
+        elif args.key_pool:
+            self.key_pool = KeyPool.load(
+                args.key_pool,
+                (lambda api_key: OfflineClient()) if self.offline else (lambda api_key: genai.Client(api_key=api_key)),
+                requests_per_minute,
+                tokens_per_minute,
+                require_keys=not self.offline,
+            )
+            client = PooledClient(self.key_pool)
+        else:
+            client = OfflineClient() if self.offline else setup_api()
+        # An offline run only reads an existing cache
+        if cache_path and (os.path.exists(cache_path) or not self.offline):
+            self.cache = ResponseCache(cache_path)
+            client = CachedClient(client, self.cache)
+        client = MetricsClient(client, self.metrics)
+        return RetryingClient(client, self.recovery)  # Outermost, so every attempt is recorded
+
+    def close(self):
+        self.metrics.print_summary()
+        self.metrics.close()
+        self.recovery.print_report()
+        if self.key_pool and not self.offline:
+            self.key_pool.print_report()
+        if self.job_results:
+            self.job_results.print_report()
+        if self.cache:
+            self.cache.print_stats()
+            self.cache.close()
+
+
+def report_run(
+    plan: BatchPlan,
+    carried: int,
+    duplicates: int,
+    shard: Optional[Shard],
+    delta: Optional[DeltaIndex],
+    baseline: Callable[[], Iterable[Dict]],
+    plan_item_batches: Callable[[List[Dict]], BatchPlan],
+):
+    """
+    Print what a planned run will do: its shard, the rows a delta run carries over, what
+    deduplication saves against planning the `baseline()` rows without it, and the plan.
+    """
+    if shard:
+        print(f"Shard {shard}: only rows whose item name hashes to this shard are included.")
+    if delta:
+        print(f"Delta: {carried} unchanged items carried over, {plan.item_count} new or changed.")
+    if duplicates:
+        report_duplicates(duplicates, plan, summarize_run(baseline(), plan_item_batches, delta)[0])
+    plan.report()
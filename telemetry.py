@@ -0,0 +1,245 @@
+import json
+import os
+import statistics
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional
+
+from batch_executor import current_batch, estimate_tokens
+from response_cache import config_schema, response_text
+from response_parsing import parser_for, strip_code_fence
+
+# --- Configuration ---
+DEFAULT_METRICS_PATH = "gemini_metrics.jsonl"
+PROM_METRIC_PREFIX = "gemini_enrichment"
+PROM_WRITE_EVERY_N_CALLS = 50  # The textfile is also rewritten when the run ends
+LATENCY_QUANTILES = (50, 95, 99)
+
+# --- Functions ---
+
+
+def parse_outcome(text: Optional[str], schema: Any) -> str:
+    """Classify a response: text (no schema), ok, fenced, salvaged, empty, invalid_json or schema_mismatch"""
+    if not text:
+        return "empty"
+    if schema is None:
+        return "text"
+    parser = parser_for(schema)
+    if parser is not None:
+        return parser.parse(text).outcome
+    stripped = strip_code_fence(text)
+    try:
+        data = json.loads(stripped)
+    except json.JSONDecodeError:
+        return "invalid_json"
+    if hasattr(schema, "model_validate"):
+        try:
+            schema.model_validate(data)
+        except Exception:
+            return "schema_mismatch"
+    return "fenced" if stripped != text.strip() else "ok"
+
+
+def percentile(values: List[float], pct: int) -> float:
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100, method="inclusive")[pct - 1]
+
+
+def recorded_latency(jsonl_path: Optional[str], stage: str) -> Optional[float]:
+    """Median latency of a stage's successful, uncached calls in a metrics JSONL file, if any"""
+    if not jsonl_path or not os.path.exists(jsonl_path):
+        return None
+    latencies = []
+    with open(jsonl_path, "r", encoding="utf-8") as infile:
+        for line in infile:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("stage") == stage and not record.get("cache_hit") and record.get("outcome") != "error":
+                latencies.append(record["latency_s"])
+    return statistics.median(latencies) if latencies else None
+
+
+class MetricsRecorder:
+    """
+    Collects one record per API call, appends it to a JSONL file and keeps run totals.
+
+    Totals are exported as a Prometheus textfile (for node_exporter's textfile collector)
+    when `prom_path` is set, and printed as an end-of-run summary by print_summary().
+    """
+
+    def __init__(
+        self,
+        jsonl_path: Optional[str] = DEFAULT_METRICS_PATH,
+        prom_path: Optional[str] = None,
+        stage: str = "",
+    ):
+        self.jsonl_path = jsonl_path
+        self.prom_path = prom_path
+        self.stage = stage
+        self.started = time.monotonic()
+        self.calls: Counter = Counter()  # (stage, outcome) -> calls
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.items: Counter = Counter()
+        self.prompt_tokens: Counter = Counter()
+        self.cache_hits: Counter = Counter()
+        self.retries: Counter = Counter()
+        self._lock = threading.Lock()  # Records arrive from worker threads in async mode
+        self._file = open(jsonl_path, "a", encoding="utf-8") if jsonl_path else None
+
+    def record(self, record: Dict[str, Any]):
+        stage = record["stage"]
+        with self._lock:
+            self.calls[(stage, record["outcome"])] += 1
+            self.latencies[stage].append(record["latency_s"])
+            self.prompt_tokens[stage] += record["prompt_tokens"]
+            self.cache_hits[stage] += record["cache_hit"]
+            self.retries[stage] += record["retry"] > 0
+            if record["first_call_of_batch"]:
+                self.items[stage] += record["items"]
+            if self._file:
+                self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                self._file.flush()
+            write_prom = self.prom_path and sum(self.calls.values()) % PROM_WRITE_EVERY_N_CALLS == 0
+        if write_prom:
+            self.write_prometheus()
+
+    def stages(self) -> List[str]:
+        with self._lock:
+            return sorted(self.latencies)
+
+    def write_prometheus(self):
+        """Rewrite the textfile atomically so a scrape never sees a half-written file"""
+        p = PROM_METRIC_PREFIX
+        with self._lock:
+            lines = [
+                f"# HELP {p}_calls_total API calls by stage and parse outcome",
+                f"# TYPE {p}_calls_total counter",
+            ]
+            lines += [
+                f'{p}_calls_total{{stage="{stage}",outcome="{outcome}"}} {count}'
+                for (stage, outcome), count in sorted(self.calls.items())
+            ]
+            for name, help_text, counter in (
+                ("items_total", "Items sent to the model", self.items),
+                ("prompt_tokens_total", "Estimated prompt tokens sent", self.prompt_tokens),
+                ("cache_hits_total", "Calls answered from the response cache", self.cache_hits),
+                ("retries_total", "Calls repeating a prompt already sent for the same batch", self.retries),
+            ):
+                lines += [f"# HELP {p}_{name} {help_text}", f"# TYPE {p}_{name} counter"]
+                lines += [f'{p}_{name}{{stage="{stage}"}} {value}' for stage, value in sorted(counter.items())]
+            lines += [
+                f"# HELP {p}_call_latency_seconds Latency of generate_content calls",
+                f"# TYPE {p}_call_latency_seconds summary",
+            ]
+            for stage, values in sorted(self.latencies.items()):
+                for pct in LATENCY_QUANTILES:
+                    lines.append(
+                        f'{p}_call_latency_seconds{{stage="{stage}",quantile="{pct / 100}"}} {percentile(values, pct):.6f}'
+                    )
+                lines.append(f'{p}_call_latency_seconds_sum{{stage="{stage}"}} {sum(values):.6f}')
+                lines.append(f'{p}_call_latency_seconds_count{{stage="{stage}"}} {len(values)}')
+        temp_path = self.prom_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as outfile:
+            outfile.write("\n".join(lines) + "\n")
+        os.replace(temp_path, self.prom_path)
+
+    def print_summary(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        with self._lock:
+            total_calls = sum(self.calls.values())
+            total_items = sum(self.items.values())
+            total_tokens = sum(self.prompt_tokens.values())
+        if not total_calls:
+            print("Run metrics: no API calls made.")
+            return
+        print(
+            f"Run metrics: {total_calls} calls in {elapsed:.1f}s ({total_calls / elapsed:.2f} calls/s, "
+            f"{total_items / elapsed:.2f} items/s, ~{total_tokens / elapsed * 60:,.0f} prompt tokens/min)"
+        )
+        for stage in self.stages():
+            with self._lock:
+                values = list(self.latencies[stage])
+                outcomes = {o: n for (s, o), n in sorted(self.calls.items()) if s == stage}
+                hits, retries = self.cache_hits[stage], self.retries[stage]
+            latency = " ".join(f"p{pct} {percentile(values, pct):.2f}s" for pct in LATENCY_QUANTILES)
+            print(
+                f"  {stage or 'calls'}: {len(values)} calls, {hits} cache hits, {retries} retries, "
+                f"latency {latency}, total {sum(values):.1f}s; "
+                + " ".join(f"{outcome}={count}" for outcome, count in outcomes.items())
+            )
+        if self.jsonl_path:
+            print(f"  Per-call records appended to '{self.jsonl_path}'")
+
+    def close(self):
+        if self.prom_path:
+            self.write_prometheus()
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+
+class MetricsModels:
+    """Drop-in for `client.models` that records every generate_content call"""
+
+    def __init__(self, models: Any, recorder: MetricsRecorder):
+        self._models = models
+        self.recorder = recorder
+
+    def is_cached(self, model: str, contents: str, config: Any = None) -> bool:
+        checker = getattr(self._models, "is_cached", None)
+        return bool(checker and checker(model, contents, config))
+
+    def generate_content(self, model: str, contents: str, config: Any = None):
+        batch = current_batch() or {}
+        attempts = batch.get("attempts")
+        retry = 0
+        if attempts is not None:
+            retry = attempts[contents]
+            attempts[contents] += 1
+        first_call_of_batch = attempts is not None and sum(attempts.values()) == 1
+        record = {
+            "ts": time.time(),
+            "stage": batch.get("stage") or self.recorder.stage,
+            "model": model,
+            "batch": batch.get("index"),
+            "items": batch.get("items", 0),
+            "prompt_chars": len(contents),
+            "prompt_tokens": estimate_tokens(contents),
+            "retry": retry,
+            "cache_hit": self.is_cached(model, contents, config),
+            "first_call_of_batch": first_call_of_batch,
+        }
+        started = time.perf_counter()
+        try:
+            response = self._models.generate_content(model=model, contents=contents, config=config)
+        except Exception as e:
+            record.update(
+                latency_s=time.perf_counter() - started,
+                outcome="error",
+                status=getattr(e, "code", None),
+                error=f"{type(e).__name__}: {e}"[:500],
+            )
+            self.recorder.record(record)
+            raise
+        text = response_text(response)
+        record.update(
+            latency_s=time.perf_counter() - started,
+            outcome=parse_outcome(text, config_schema(config)),
+            response_chars=len(text or ""),
+        )
+        self.recorder.record(record)
+        return response
+
+
+class MetricsClient:
+    """Wraps a (possibly cache-backed) genai.Client so every call is recorded"""
+
+    def __init__(self, client: Any, recorder: MetricsRecorder):
+        self._client = client
+        self.recorder = recorder
+        self.models = MetricsModels(client.models, recorder)